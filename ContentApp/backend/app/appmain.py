@@ -2,11 +2,16 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import time
-from .routes import api_router, auth_router
+from .routes import api_router, auth_router, images_router
+from .routes.api import image_job_service, generation_service
+from .services.post_write_buffer import post_write_buffer
+from .services.prompt_service import prompt_service
+from .services.document_extractor import document_extractor
 from .routes.health import router as health_router
 from .database import connect_to_mongo, close_mongo_connection
 from .utils.logging_config import setup_logging
 from .utils.error_handlers import APIError, handle_api_error
+from .utils.deadline import RequestDeadlineMiddleware
 import uuid
 import traceback
 from .config import settings
@@ -73,12 +78,29 @@ async def log_requests(request: Request, call_next):
         )
         raise
 
+# Registered last so it is outermost: the deadline covers the whole request
+app.add_middleware(
+    RequestDeadlineMiddleware,
+    timeout_seconds=settings.request_timeout_seconds,
+    min_timeout_seconds=settings.request_timeout_min_seconds,
+    path_timeouts={"/api/history/export": settings.export_timeout_seconds}
+)
+
 @app.on_event("startup")
 async def startup_event():
     await connect_to_mongo()
+    if settings.post_write_behind_enabled:
+        await post_write_buffer.start()
+    await image_job_service.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await image_job_service.stop()
+    # Drain buffered posts while Mongo is still connected
+    await post_write_buffer.stop()
+    await prompt_service.drain()
+    await generation_service.image_store.close()
+    document_extractor.close()
     await close_mongo_connection()
 
 @app.get("/")
@@ -96,6 +118,7 @@ async def favicon():
 app.include_router(api_router)
 app.include_router(auth_router)
 app.include_router(health_router)
+app.include_router(images_router)
 
 # Debug endpoint
 @app.get("/debug/routes")
@@ -14,6 +14,7 @@ class Settings(BaseSettings):
     app_name: str = "LinkedIn Post Generator"
     api_prefix: str = "/api"
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")  # Empty uses the OpenAI default
     openai_model: str = "gpt-3.5-turbo"
     openai_image_model: str = "dall-e-2" 
     max_tokens: int = 1000  # Increased for longer posts
@@ -29,10 +30,111 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     jwt_expiration: int = 30  # days
     google_client_id: str = os.getenv("GOOGLE_CLIENT_ID", "")
+    generation_cache_enabled: bool = True
+    generation_cache_max_entries: int = 512  # In-process LRU tier
+    generation_cache_ttl_seconds: int = 24 * 3600
+    singleflight_lease_seconds: int = 90  # Upper bound on how long followers wait for a leader
+    singleflight_poll_interval: float = 0.25
+    batch_concurrency: int = 4  # Concurrent upstream calls per batch request
+    batch_max_variants: int = 4
+    # Account-wide OpenAI limits; each server worker process schedules against its 1/server_workers share
+    openai_tokens_per_minute: int = int(os.getenv("OPENAI_TPM_LIMIT", "90000"))
+    openai_requests_per_minute: int = int(os.getenv("OPENAI_RPM_LIMIT", "3500"))
+    server_workers: int = int(os.getenv("WEB_CONCURRENCY", "1"))  # Same variable uvicorn reads for --workers
+    scheduler_max_wait_seconds: float = 20.0  # Reject instead of queueing past this
+    scheduler_default_weight: float = 1.0
+    scheduler_anonymous_weight: float = 0.5  # Anonymous traffic gets a smaller fair share
+    upload_max_file_bytes: int = 1024 * 1024  # Large documents are condensed by the summary pipeline
+    upload_max_total_bytes: int = 2 * 1024 * 1024  # Across all files of one request
+    upload_chunk_bytes: int = 16 * 1024  # Uploads are read and validated this much at a time
+    document_extract_workers: int = 2  # Processes parsing Word uploads
+    document_extract_max_in_flight: int = 8  # Further extractions wait for a slot
+    docx_extract_timeout_seconds: float = 5.0
+    doc_extract_timeout_seconds: float = 2.0
+    document_max_decompressed_bytes: int = 10 * 1024 * 1024  # Zip bomb guard for .docx
+    document_max_compression_ratio: float = 100.0
+    upload_max_document_hashes: int = 10  # Previously uploaded documents one request may reference
+    document_cache_max_entries: int = 256
+    document_cache_max_bytes: int = 64 * 1024 * 1024
+    document_cache_ttl_seconds: int = 7 * 24 * 3600  # Renewed whenever the document is uploaded again
+    document_cache_max_shared_chars: int = 2_000_000  # Larger texts stay in the local tier (Mongo's 16MB document limit)
+    document_context_tokens: int = 3000  # Upper bound for packed document excerpts
+    summary_pipeline_min_tokens: int = 12000  # Larger documents are map-reduce summarized instead of excerpted
+    summary_max_input_tokens: int = 200000  # Reject rather than run hundreds of summary calls
+    summary_chunk_tokens: int = 3000  # Input per summarization call
+    summary_max_tokens: int = 300  # Length of each summary
+    summary_concurrency: int = 4  # Parallel summarization calls per request
+    summary_max_reduce_levels: int = 2
+    document_chunk_tokens: int = 200
+    history_count_cache_seconds: int = 30  # Staleness allowed for totals on cursor-paginated history
+    export_batch_size: int = 500  # Documents per cursor batch when exporting history
+    export_timeout_seconds: float = 1800.0  # Exports stream far longer than ordinary requests
+    history_cache_max_entries: int = 2000  # Cached history pages per worker
+    history_cache_max_bytes: int = 32 * 1024 * 1024
+    history_cache_ttl_seconds: int = 600  # Versioned keys make this a memory bound, not a staleness bound
+    search_index_max_users: int = 256  # Per-worker inverted indexes kept in memory
+    search_index_ttl_seconds: int = 3600
+    search_max_indexed_posts: int = 50000  # Larger histories fall back to (escaped) regex search
+    post_write_behind_enabled: bool = True  # Persist posts in batches off the request path
+    post_write_batch_size: int = 100
+    post_write_flush_seconds: float = 0.2  # Longest a post waits in the buffer
+    post_write_max_pending: int = 1000  # Writers wait once this many posts are buffered
+    # Buffered posts are only visible on the worker that took them until flushed; wait for the flush
+    # before answering when reads may land on another worker
+    post_write_wait_for_flush: bool = False
+    post_write_retry_max_delay: float = 5.0  # Failed batches are retried until they land, backing off up to this
+    post_write_drain_seconds: float = 30.0  # Longest shutdown waits for buffered posts to be written
+    popular_prompts_top_k: int = 20  # Precomputed popular prompts per user and template; larger limits are capped
+    popular_prompts_cache_seconds: int = 30
+    prompt_cache_max_entries: int = 5000  # Prompt texts kept per worker to fill in post contexts
+    library_dir: str = os.getenv("LIBRARY_DIR", "data/library")  # Per-user memory-mapped vector files
+    library_embedding_dim: int = 512  # Hashed feature buckets per chunk vector (2KB per chunk)
+    library_max_rows: int = 20000  # Rows in a user's vector file; rows of deleted documents are reused
+    library_top_k: int = 8  # Library chunks retrieved per generation
+    library_open_indexes: int = 256  # Vector files kept mapped per worker
+    image_job_workers: int = 2  # Concurrent image generations per process
+    image_job_queue_size: int = 100
+    image_job_timeout_seconds: int = 120
+    image_job_lease_seconds: float = 30.0  # Renewed every third of this while a job runs; a lapsed lease marks its worker as dead
+    image_job_recovery_seconds: float = 15.0  # How often jobs of dead workers, or left out of a full queue, are requeued
+    image_job_max_attempts: int = 3  # Jobs whose worker died this many times are failed instead of requeued
+    image_job_max_wait_seconds: int = 30  # Longest allowed long-poll
+    image_store_dir: str = os.getenv("IMAGE_STORE_DIR", "data/images")
+    public_base_url: str = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")
+    image_max_bytes: int = 20 * 1024 * 1024
+    image_download_timeout_seconds: int = 30
+    image_thumbnail_size: int = 256  # Longest edge in pixels
+    rate_limit_per_minute: int = int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+    request_timeout_seconds: float = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "120"))  # Whole-request deadline; X-Request-Timeout may shorten it
+    request_timeout_min_seconds: float = 2.0  # Shortest deadline X-Request-Timeout can ask for
+    model_backends: str = os.getenv("MODEL_BACKENDS", "")  # JSON list of {name, base_url, api_key, model}
+    model_router_default_latency: float = 2.0  # Seconds assumed for backends without samples
+    model_router_ewma_alpha: float = 0.2
+    model_router_failure_threshold: int = 3  # Consecutive failures before a cooldown
+    model_router_cooldown_seconds: float = 30.0
+    circuit_breaker_window_seconds: float = 60.0  # Rolling window for error and latency rates
+    circuit_breaker_min_calls: int = 10  # Calls in the window before the breaker may open
+    circuit_breaker_failure_rate: float = 0.5
+    circuit_breaker_slow_call_rate: float = 0.8
+    circuit_breaker_slow_call_seconds: dict = {"text": 20.0, "image": 60.0}  # One breaker per kind
+    circuit_breaker_open_seconds: float = 30.0  # Fail fast this long before probing again
+    circuit_breaker_half_open_calls: int = 2
+    circuit_breaker_serve_previous: bool = True  # Fall back to the user's last post for the same prompt while open
+    max_concurrent_generations: int = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "32"))  # Shed load beyond this per process
+    # Retry/hedging policy per model route; hedges fire after the learned latency percentile
+    model_call_policies: dict = {
+        "default": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 8.0, "deadline": 45.0, "hedge": False},
+        "chat": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 8.0, "deadline": 45.0,
+                 "hedge": True, "hedge_percentile": 95, "hedge_min_samples": 20},
+        "chat_stream": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 4.0, "deadline": 20.0,
+                        "hedge": True, "hedge_percentile": 95, "hedge_min_samples": 20},
+        "image": {"max_attempts": 2, "base_delay": 1.0, "max_delay": 8.0, "deadline": 90.0, "hedge": False},
+    }
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
     class Config:
         env_file = ".env"
+        protected_namespaces = ("settings_",)  # Allow model_* setting names
 
 settings = Settings()
@@ -1,20 +1,49 @@
 from fastapi import HTTPException, UploadFile
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Dict, Any, Optional
 from ..services.post_service import PostService
 from ..services.generation_service import GenerationService
 from ..services.file_service import FileService
+from ..services.library_service import LibraryService
 from ..schemas import TEMPLATE_PROMPTS
+from ..config import settings
+from ..utils.error_handlers import APIError
+from ..utils.export import coalesce_chunks, csv_lines, gzip_chunks, ndjson_lines
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger("app")
 
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; offsets such as ...Z are converted to match"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 class PostController:
-    def __init__(self, post_service: PostService, generation_service: GenerationService, file_service: FileService):
+    def __init__(self, post_service: PostService, generation_service: GenerationService, file_service: FileService, library_service: Optional[LibraryService] = None):
         self.post_service = post_service
         self.generation_service = generation_service
         self.file_service = file_service
+        self.library_service = library_service
+
+    async def _document_texts(
+        self,
+        documents: List[UploadFile],
+        document_hashes: Optional[List[str]],
+        user_id: str,
+        objective: str,
+        context: str,
+        use_library: bool
+    ) -> List[str]:
+        """Uploaded and referenced documents, plus the most relevant saved library excerpts"""
+        document_texts = await self.file_service.process_files(documents, document_hashes, user_id)
+        if use_library and self.library_service and user_id != "anonymous":
+            document_texts += await self.library_service.retrieve(user_id, f"{objective} {context}")
+        return document_texts
 
-    async def generate_post(self, template: str, objective: str, context: str, documents: List[UploadFile], user_id: str) -> Dict[str, Any]:
+    async def generate_post(self, template: str, objective: str, context: str, documents: List[UploadFile], user_id: str, use_cache: bool = True, document_hashes: Optional[List[str]] = None, use_library: bool = False) -> Dict[str, Any]:
         if not template or not objective or not context:
             raise HTTPException(status_code=400, detail="Missing required fields")
             
@@ -22,13 +51,16 @@ class PostController:
         if not template_base:
             raise HTTPException(status_code=400, detail="Invalid template type")
 
-        document_texts = await self.file_service.process_files(documents)
+        document_texts = await self._document_texts(documents, document_hashes, user_id, objective, context, use_library)
+        document_texts = await self.generation_service.summaries.condense(document_texts, user_id)
         
         generated_text = await self.generation_service.generate_text(
             template_base,
             objective,
             context,
-            document_texts
+            document_texts,
+            use_cache=use_cache,
+            user_id=user_id
         )
         
         if not generated_text:
@@ -45,12 +77,165 @@ class PostController:
             
         return {"post": generated_text}
 
+    async def generate_post_stream(self, template: str, objective: str, context: str, documents: List[UploadFile], user_id: str, use_cache: bool = True, document_hashes: Optional[List[str]] = None, use_library: bool = False) -> AsyncIterator[str]:
+        """Validate the request and return an NDJSON event stream of the generation"""
+        if not template or not objective or not context:
+            raise HTTPException(status_code=400, detail="Missing required fields")
+            
+        template_base = TEMPLATE_PROMPTS.get(template)
+        if not template_base:
+            raise HTTPException(status_code=400, detail="Invalid template type")
+
+        # Read uploads before the response starts; they are closed once the handler returns
+        document_texts = await self._document_texts(documents, document_hashes, user_id, objective, context, use_library)
+
+        return self._stream_post_events(template, template_base, objective, context, document_texts, user_id, use_cache)
+
+    async def _stream_post_events(
+        self,
+        template: str,
+        template_base: str,
+        objective: str,
+        context: str,
+        document_texts: List[str],
+        user_id: str,
+        use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        parts: List[str] = []
+        try:
+            if self.generation_service.summaries.needs_pipeline(document_texts):
+                # Large documents are summarized first; report each finished summary as it lands
+                progress: asyncio.Queue = asyncio.Queue()
+
+                async def condense() -> List[str]:
+                    try:
+                        return await self.generation_service.summaries.condense(document_texts, user_id, progress.put_nowait)
+                    finally:
+                        progress.put_nowait(None)
+
+                task = asyncio.ensure_future(condense())
+                try:
+                    while (event := await progress.get()) is not None:
+                        yield json.dumps({"type": "progress", **event}) + "\n"
+                    document_texts = await task
+                finally:
+                    task.cancel()
+
+            async for delta in self.generation_service.generate_text_stream(
+                template_base,
+                objective,
+                context,
+                document_texts,
+                use_cache=use_cache,
+                user_id=user_id
+            ):
+                parts.append(delta)
+                yield json.dumps({"type": "delta", "content": delta}) + "\n"
+
+            generated_text = "".join(parts).strip()
+            if not generated_text:
+                yield json.dumps({"type": "error", "detail": "Failed to generate text"}) + "\n"
+                return
+
+            post = await self.post_service.create_post({
+                "user_id": user_id,
+                "template": template,
+                "objective": objective,
+                "context": context,
+                "generated_content": generated_text,
+            }, user_id)
+
+            yield json.dumps({"type": "done", "post": generated_text, "post_id": post.id}) + "\n"
+        except asyncio.CancelledError:
+            # Client went away: the upstream stream is closed and nothing is persisted
+            logger.info(f"Client disconnected during streamed generation for user {user_id}", extra={"received_chars": sum(len(p) for p in parts)})
+            raise
+        except APIError as e:
+            logger.warning(f"Streamed post generation failed: {e.message}")
+            yield json.dumps({"type": "error", "detail": e.message, "status_code": e.status_code, **e.details}) + "\n"
+        except Exception as e:
+            logger.error(f"Streamed post generation failed: {str(e)}", exc_info=True)
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    async def generate_posts_batch(
+        self,
+        templates: List[str],
+        objective: str,
+        context: str,
+        documents: List[UploadFile],
+        user_id: str,
+        variants: int = 1,
+        document_hashes: Optional[List[str]] = None,
+        use_library: bool = False
+    ) -> Dict[str, Any]:
+        if not templates or not objective or not context:
+            raise HTTPException(status_code=400, detail="Missing required fields")
+        if variants < 1 or variants > settings.batch_max_variants:
+            raise HTTPException(status_code=400, detail=f"variants must be between 1 and {settings.batch_max_variants}")
+
+        # Deduplicate while keeping the requested order
+        templates = list(dict.fromkeys(templates))
+        invalid = [template for template in templates if template not in TEMPLATE_PROMPTS]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid template type: {', '.join(invalid)}")
+
+        # Documents are parsed once and shared by every item in the batch
+        document_texts = await self._document_texts(documents, document_hashes, user_id, objective, context, use_library)
+        document_texts = await self.generation_service.summaries.condense(document_texts, user_id)
+        semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+        async def run(template: str) -> List[str]:
+            async with semaphore:
+                return await self.generation_service.generate_text_variants(
+                    TEMPLATE_PROMPTS[template],
+                    objective,
+                    context,
+                    document_texts,
+                    n=variants,
+                    user_id=user_id
+                )
+
+        outcomes = await asyncio.gather(*(run(template) for template in templates), return_exceptions=True)
+
+        results: List[Dict[str, Any]] = []
+        posts_data: List[Dict[str, Any]] = []
+        for template, outcome in zip(templates, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch generation failed for template {template}: {str(outcome)}")
+                results.append({"template": template, "error": str(outcome)})
+                continue
+            if not outcome:
+                results.append({"template": template, "error": "Failed to generate text"})
+                continue
+            for index, generated_text in enumerate(outcome):
+                results.append({"template": template, "variant": index, "post": generated_text})
+                posts_data.append({
+                    "template": template,
+                    "objective": objective,
+                    "context": context,
+                    "generated_content": generated_text,
+                })
+
+        # One bulk insert for every successful draft
+        stored = await self.post_service.create_posts(posts_data, user_id)
+        stored_ids = iter(post.id for post in stored)
+        for result in results:
+            if "post" in result:
+                result["post_id"] = next(stored_ids)
+
+        return {
+            "results": results,
+            "succeeded": len(posts_data),
+            "failed": sum(1 for result in results if "error" in result)
+        }
+
     async def generate_image(
         self, 
         template: str, 
         objective: str, 
         context: str,
-        user_id: str
+        user_id: str,
+        use_cache: bool = True
     ) -> Dict[str, str]:
         if not template or not objective or not context:
             raise HTTPException(status_code=400, detail="Missing required fields")
@@ -63,7 +248,9 @@ class PostController:
             image_url = await self.generation_service.generate_image(
                 template=template_base,
                 request_objective=objective,
-                request_context=context
+                request_context=context,
+                use_cache=use_cache,
+                user_id=user_id
             )
 
             # Store the generated image
@@ -76,19 +263,56 @@ class PostController:
                 "type": "image"
             }, user_id)
 
-            return {"image_url": image_url}
+            return {"image_url": image_url, "thumbnail_url": f"{image_url}/thumbnail"}
+        except APIError:
+            raise
         except Exception as e:
             logger.error(f"Image generation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def get_user_posts(self, user_id: str, limit: int, skip: int, search: str = None):
+    async def get_user_posts(self, user_id: str, limit: int, skip: int, search: str = None, cursor: Optional[str] = None, include_total: bool = False):
         return await self.post_service.get_user_posts(
             user_id=user_id,
             limit=limit,
             skip=skip,
-            search=search
+            search=search,
+            cursor=cursor,
+            include_total=include_total
         )
 
+    async def history_etag(self, user_id: str, limit: int, skip: int, search: str = None, cursor: Optional[str] = None, include_total: bool = False) -> Optional[str]:
+        return await self.post_service.history_etag(user_id, limit, skip, search, cursor, include_total)
+
+    async def get_post(self, post_id: str, user_id: str):
+        post = await self.post_service.get_post(post_id, user_id)
+        if post is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return post
+
+    async def post_etag(self, post_id: str, user_id: str) -> Optional[str]:
+        return await self.post_service.post_etag(post_id, user_id)
+
+    def export_posts(
+        self,
+        user_id: str,
+        export_format: str,
+        template: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 500,
+        compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        if export_format not in ("ndjson", "csv"):
+            raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+        since, until = _naive_utc(since), _naive_utc(until)
+        if since and until and since >= until:
+            raise HTTPException(status_code=400, detail="since must be before until")
+
+        logger.info(f"Exporting posts for user {user_id}", extra={"format": export_format, "compress": compress})
+        posts = self.post_service.iter_posts(user_id, template, since, until, batch_size)
+        lines = ndjson_lines(posts) if export_format == "ndjson" else csv_lines(posts)
+        return gzip_chunks(lines) if compress else coalesce_chunks(lines)
+
     async def save_post(self, post_data: Dict[str, Any], user_id: str):
         logger.info(f"Saving post for user {user_id}", extra={"post_data": str(post_data)})
         result = await self.post_service.create_post(post_data, user_id)
@@ -10,6 +10,14 @@ class Database:
     posts_collection: Collection = None
     prompts_collection: Collection = None
     users_collection: Collection = None  # Add this line
+    generation_cache_collection: Collection = None
+    generation_leases_collection: Collection = None
+    image_jobs_collection: Collection = None
+    post_versions_collection: Collection = None
+    document_cache_collection: Collection = None
+    library_documents_collection: Collection = None
+    library_chunks_collection: Collection = None
+    library_indexes_collection: Collection = None
 
 db = Database()
 
@@ -24,6 +32,14 @@ async def connect_to_mongo():
         db.posts_collection = db.client[settings.mongodb_name]["posts"]
         db.prompts_collection = db.client[settings.mongodb_name]["prompts"]
         db.users_collection = db.client[settings.mongodb_name]["users"]  # Add this line
+        db.generation_cache_collection = db.client[settings.mongodb_name]["generation_cache"]
+        db.generation_leases_collection = db.client[settings.mongodb_name]["generation_leases"]
+        db.image_jobs_collection = db.client[settings.mongodb_name]["image_jobs"]
+        db.post_versions_collection = db.client[settings.mongodb_name]["post_versions"]
+        db.document_cache_collection = db.client[settings.mongodb_name]["document_cache"]
+        db.library_documents_collection = db.client[settings.mongodb_name]["library_documents"]
+        db.library_chunks_collection = db.client[settings.mongodb_name]["library_chunks"]
+        db.library_indexes_collection = db.client[settings.mongodb_name]["library_indexes"]
         
         # Create indexes
         await db.posts_collection.create_index([
@@ -31,9 +47,26 @@ async def connect_to_mongo():
             ("created_at", -1)
         ])
         await db.posts_collection.create_index("created_at")
-        await db.prompts_collection.create_index("template")
+        # Covers the (created_at, _id) keyset sort used by cursor pagination
+        await db.posts_collection.create_index([
+            ("user_id", 1),
+            ("created_at", -1),
+            ("_id", -1)
+        ])
+        # A user's popular prompts, overall and per template
+        await db.prompts_collection.create_index([("user_id", 1), ("use_count", -1), ("_id", 1)])
+        await db.prompts_collection.create_index([("user_id", 1), ("template", 1), ("use_count", -1), ("_id", 1)])
         await db.users_collection.create_index("google_id", unique=True)  # Add this line
         await db.users_collection.create_index("email", unique=True)      # Add this line
+        await db.generation_cache_collection.create_index("expires_at", expireAfterSeconds=0)
+        await db.generation_leases_collection.create_index("expires_at", expireAfterSeconds=0)
+        await db.document_cache_collection.create_index("expires_at", expireAfterSeconds=0)
+        await db.library_documents_collection.create_index([("user_id", 1), ("created_at", -1)])
+        await db.library_documents_collection.create_index([("user_id", 1), ("sha256", 1)], unique=True)
+        await db.library_chunks_collection.create_index([("user_id", 1), ("row", 1)], unique=True)
+        await db.library_chunks_collection.create_index([("user_id", 1), ("document_id", 1)])
+        await db.image_jobs_collection.create_index([("status", 1), ("created_at", 1)])
+        await db.image_jobs_collection.create_index("updated_at", expireAfterSeconds=7 * 24 * 3600)
         
         logger.info("Database initialized successfully")
     except Exception as e:
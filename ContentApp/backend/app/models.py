@@ -9,7 +9,8 @@ class StoredPost(BaseModel):
     user_id: str
     template: TemplateType
     objective: str
-    context: str
+    context: Optional[str] = None  # Stored on the linked prompt when identical
+    prompt_id: Optional[str] = None
     generated_content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -1,5 +1,6 @@
 from .auth import router as auth_router
 from .api import router as api_router
 from .health import router as health_router
+from .images import router as images_router
 
-__all__ = ['auth_router', 'api_router', 'health_router']
+__all__ = ['auth_router', 'api_router', 'health_router', 'images_router']
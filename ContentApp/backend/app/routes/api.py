@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Query, File, UploadFile, Form, Depends, Header, Body, Request, HTTPException
+from fastapi import APIRouter, Query, File, UploadFile, Form, Depends, Header, Body, Request, HTTPException, Response
+from fastapi.responses import StreamingResponse
 import logging
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from ..services.model_service import ModelService
 from ..services.generation_service import GenerationService
 from ..services.auth_service import AuthService
 from ..services.post_service import PostService
 from ..services.file_service import FileService
+from ..services.image_job_service import ImageJobService
+from ..services.library_service import LibraryService
+from ..services.prompt_service import prompt_service
 from ..controllers.post_controller import PostController
 from ..utils.rate_limiter import rate_limiter
+from ..config import settings
+from ..utils.error_handlers import APIError
+from ..utils.etag import PRIVATE_CACHE_CONTROL, etag_matches
 from ..utils.token_utils import get_token_from_header  # Import utility function
 
 logger = logging.getLogger(__name__)
@@ -17,8 +25,10 @@ model_service = ModelService()
 generation_service = GenerationService(model_service)
 auth_service = AuthService()
 file_service = FileService()
+library_service = LibraryService(file_service)
 post_service = PostService()
-post_controller = PostController(post_service, generation_service, file_service)
+post_controller = PostController(post_service, generation_service, file_service, library_service)
+image_job_service = ImageJobService(generation_service, post_service)
 
 router = APIRouter(prefix="/api", tags=["generation"])
 
@@ -32,6 +42,9 @@ async def generate_post(
     objective: str = Form(...),
     context: str = Form(...),
     documents: List[UploadFile] = File([]),
+    document_hashes: List[str] = Form([], description="sha256 of documents uploaded before, sent instead of the files"),
+    use_library: bool = Form(False, description="Add the most relevant excerpts from the user's document library"),
+    use_cache: bool = Form(True),
     authorization: str = Header(None)
 ):
     await rate_limiter.check_rate_limit(request)
@@ -44,17 +57,71 @@ async def generate_post(
             except Exception:
                 pass  # Continue with anonymous user
 
-        return await post_controller.generate_post(template, objective, context, documents, user_id)
+        return await post_controller.generate_post(template, objective, context, documents, user_id, use_cache, document_hashes, use_library)
+    except (APIError, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"Post generation failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/generate/stream")
+async def generate_post_stream(
+    request: Request,
+    template: str = Form(...),
+    objective: str = Form(...),
+    context: str = Form(...),
+    documents: List[UploadFile] = File([]),
+    document_hashes: List[str] = Form([], description="sha256 of documents uploaded before, sent instead of the files"),
+    use_library: bool = Form(False, description="Add the most relevant excerpts from the user's document library"),
+    use_cache: bool = Form(True),
+    authorization: str = Header(None)
+):
+    await rate_limiter.check_rate_limit(request)
+    user_id = "anonymous"
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token = authorization.split(" ")[1]
+            user_id = auth_service.verify_token(token)
+        except Exception:
+            pass  # Continue with anonymous user
+
+    events = await post_controller.generate_post_stream(template, objective, context, documents, user_id, use_cache, document_hashes, use_library)
+    return StreamingResponse(
+        events,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/generate/batch")
+async def generate_posts_batch(
+    request: Request,
+    templates: List[str] = Form(...),
+    objective: str = Form(...),
+    context: str = Form(...),
+    variants: int = Form(1),
+    documents: List[UploadFile] = File([]),
+    document_hashes: List[str] = Form([], description="sha256 of documents uploaded before, sent instead of the files"),
+    use_library: bool = Form(False, description="Add the most relevant excerpts from the user's document library"),
+    authorization: str = Header(None)
+):
+    await rate_limiter.check_rate_limit(request)
+    user_id = "anonymous"
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token = authorization.split(" ")[1]
+            user_id = auth_service.verify_token(token)
+        except Exception:
+            pass  # Continue with anonymous user
+
+    return await post_controller.generate_posts_batch(templates, objective, context, documents, user_id, variants, document_hashes, use_library)
+
 @router.post("/generate/image/")  # Added trailing slash
 async def generate_image(
     request: Request,
     template: str = Form(...),
     objective: str = Form(...),
     context: str = Form(...),
+    use_cache: bool = Form(True),
     authorization: str = Header(None)
 ):
     # For testing, comment out rate limiting:
@@ -74,22 +141,152 @@ async def generate_image(
             template=template,
             objective=objective,
             context=context,
-            user_id=user_id
+            user_id=user_id,
+            use_cache=use_cache
         )
         logger.info(f"Image generation response from controller: {response}")
         return response
+    except (APIError, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"Image generation failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/generate/image/jobs", status_code=202)
+async def submit_image_job(
+    request: Request,
+    template: str = Form(...),
+    objective: str = Form(...),
+    context: str = Form(...),
+    use_cache: bool = Form(True),
+    authorization: str = Header(None)
+):
+    user_id = "anonymous"
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token = authorization.split(" ")[1]
+            user_id = auth_service.verify_token(token)
+        except Exception:
+            pass
+
+    return await image_job_service.submit(template, objective, context, user_id, use_cache)
+
+@router.get("/generate/image/jobs/{job_id}")
+async def get_image_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30),
+    authorization: str = Header(None)
+):
+    user_id = "anonymous"
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token = authorization.split(" ")[1]
+            user_id = auth_service.verify_token(token)
+        except Exception:
+            pass
+
+    return await image_job_service.get_job(job_id, user_id, wait)
+
+def _conditional_headers(etag: Optional[str]) -> dict:
+    headers = {"Cache-Control": PRIVATE_CACHE_CONTROL, "Vary": "Authorization"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
 @router.get("/history")
 async def get_post_history(
+    response: Response,
     limit: int = Query(10, gt=0, le=100),
     skip: int = Query(0, ge=0),
     search: str = Query(None),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page; send it empty for the first page"),
+    include_total: bool = Query(False, description="Add a (briefly cached) total to cursor pages"),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    # Revalidation only reads the user's post version, never the posts themselves
+    etag = await post_controller.history_etag(user_id, limit, skip, search, cursor, include_total)
+    headers = _conditional_headers(etag)
+    if etag and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await post_controller.get_user_posts(user_id, limit, skip, search, cursor, include_total)
+
+@router.get("/history/export")
+async def export_post_history(
+    export_format: str = Query("ndjson", alias="format", description="ndjson or csv"),
+    template: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None, description="Only posts created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only posts created before this time"),
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=5000),
+    gzip: bool = Query(False),
+    user_id: str = Depends(get_current_user_id)
+):
+    chunks = post_controller.export_posts(user_id, export_format, template, since, until, batch_size, gzip)
+    filename = f"posts.{export_format}" + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else ("application/x-ndjson" if export_format == "ndjson" else "text/csv; charset=utf-8")
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.post("/library")
+async def add_library_documents(
+    documents: List[UploadFile] = File(...),
+    user_id: str = Depends(get_current_user_id)
+):
+    return {"documents": await library_service.add_documents(user_id, documents)}
+
+@router.get("/library")
+async def list_library_documents(user_id: str = Depends(get_current_user_id)):
+    return {"documents": await library_service.list_documents(user_id)}
+
+@router.delete("/library/{document_id}")
+async def delete_library_document(
+    document_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    if not await library_service.delete_document(user_id, document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document removed from library"}
+
+@router.get("/documents/{sha256}")
+async def get_cached_document(
+    sha256: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Whether a document can be sent by hash instead of uploaded again"""
+    return await file_service.describe(sha256, user_id)
+
+@router.get("/popular-prompts")
+async def get_popular_prompts(
+    response: Response,
+    limit: int = Query(5, gt=0, le=settings.popular_prompts_top_k),
+    template: Optional[str] = Query(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    # Prompts carry the user's objectives and context, so only the caller's own are listed
+    response.headers.update(_conditional_headers(None))
+    return await prompt_service.popular(user_id, limit, template)
+
+@router.get("/posts/{post_id}")
+async def get_post(
+    post_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     user_id: str = Depends(get_current_user_id)
 ):
-    return await post_controller.get_user_posts(user_id, limit, skip, search)
+    etag = await post_controller.post_etag(post_id, user_id)
+    headers = _conditional_headers(etag)
+    if etag and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await post_controller.get_post(post_id, user_id)
 
 @router.post("/posts")
 async def save_post(
@@ -1,5 +1,11 @@
 from fastapi import APIRouter
 from ..database import db
+from .api import generation_service, model_service
+from ..services.search_service import search_service
+from ..services.post_write_buffer import post_write_buffer
+from ..services.history_cache import history_cache
+from ..services.prompt_service import prompt_service
+from ..services.document_cache import document_cache
 
 router = APIRouter(prefix="/health", tags=["Health"])
 
@@ -19,4 +25,45 @@ async def database_health_check():
         else:
             return {"status": "unhealthy", "database": "not connected"}
     except Exception as e:
-        return {"status": "unhealthy", "database": str(e)} 
\ No newline at end of file
+        return {"status": "unhealthy", "database": str(e)} 
+@router.get("/cache")
+async def cache_health_check():
+    """Generation, history, prompt and document cache hit rates, request coalescing and search index counters"""
+    return {
+        "status": "healthy",
+        "generation_cache": generation_service.cache.stats(),
+        "single_flight": generation_service.single_flight.stats(),
+        "summaries": generation_service.summaries.stats(),
+        "search": search_service.stats(),
+        "history": history_cache.stats(),
+        "prompts": prompt_service.stats(),
+        "documents": document_cache.stats()
+    }
+
+@router.get("/writes")
+async def writes_health_check():
+    """Write-behind buffer depth and flush counters"""
+    stats = post_write_buffer.stats()
+    return {"status": "healthy" if not stats["failing"] else "degraded", "post_writes": stats}
+
+@router.get("/scheduler")
+async def scheduler_health_check():
+    """Upstream token budget usage, queue depth and wait times"""
+    return {"status": "healthy", "scheduler": model_service.scheduler.stats()}
+
+@router.get("/models")
+async def models_health_check():
+    """Per-backend latency, error rate, routing, retry and hedging counters"""
+    return {
+        "status": "healthy",
+        "routing": model_service.router.stats(),
+        "calls": model_service.resilience.stats(),
+        **model_service.stats()
+    }
+
+@router.get("/circuit")
+async def circuit_health_check():
+    """Model circuit breaker states and load shedding counters"""
+    stats = model_service.stats()
+    degraded = any(circuit["state"] != "closed" for circuit in stats["circuits"].values())
+    return {"status": "degraded" if degraded else "healthy", **stats}
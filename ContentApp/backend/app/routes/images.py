@@ -0,0 +1,86 @@
+import os
+import re
+from typing import Iterator, Optional
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from .api import generation_service
+from ..utils.etag import etag_matches
+
+router = APIRouter(prefix="/api/images", tags=["images"])
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+# Content-addressed bytes never change for a given URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _serve_file(path: str, etag: str, if_none_match: Optional[str], range_header: Optional[str]) -> Response:
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    media_type = generation_service.image_store.content_type(path)
+    start, end, status_code = 0, size - 1, 200
+
+    if range_header:
+        match = RANGE_RE.match(range_header.strip())
+        if not match or (not match.group(1) and not match.group(2)):
+            raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(match.group(2)))
+        if start > end or start >= size:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_range(path, start, end), status_code=status_code, media_type=media_type, headers=headers)
+
+def _path_or_404(digest: str, thumbnail: bool = False) -> str:
+    store = generation_service.image_store
+    try:
+        return store.thumbnail_path_for(digest) if thumbnail else store.path_for(digest)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+@router.get("/{digest}")
+async def get_image(
+    digest: str,
+    if_none_match: Optional[str] = Header(None),
+    range: Optional[str] = Header(None)
+):
+    return _serve_file(_path_or_404(digest), f'"{digest}"', if_none_match, range)
+
+@router.get("/{digest}/thumbnail")
+async def get_image_thumbnail(
+    digest: str,
+    if_none_match: Optional[str] = Header(None),
+    range: Optional[str] = Header(None)
+):
+    path = _path_or_404(digest, thumbnail=True)
+    if not os.path.exists(path):
+        # Thumbnails are best effort; fall back to the original image
+        return _serve_file(_path_or_404(digest), f'"{digest}"', if_none_match, range)
+    return _serve_file(path, f'"{digest}-thumb"', if_none_match, range)
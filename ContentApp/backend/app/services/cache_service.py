@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from ..config import settings
+from ..database import db
+from ..utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+def make_generation_key(
+    kind: str,
+    template: str,
+    objective: str,
+    context: str,
+    document_texts: Optional[List[str]] = None,
+    params: Optional[Dict[str, Any]] = None
+) -> str:
+    """Build a stable cache key from the normalized generation inputs"""
+    payload = {
+        "kind": kind,
+        "template": _normalize(template),
+        "objective": _normalize(objective),
+        "context": _normalize(context),
+        "documents": [
+            hashlib.sha256(text.encode("utf-8")).hexdigest()
+            for text in (document_texts or [])
+        ],
+        "params": params or {}
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class GenerationCache:
+    """Two-tier cache: in-process LRU in front of a Mongo collection shared by all workers"""
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None):
+        self.ttl_seconds = ttl_seconds or settings.generation_cache_ttl_seconds
+        self.local = LRUCache(
+            max_entries=max_entries or settings.generation_cache_max_entries,
+            ttl_seconds=self.ttl_seconds
+        )
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        collection = db.generation_cache_collection
+        if collection is None:
+            return None
+
+        try:
+            doc = await collection.find_one({
+                "_id": key,
+                "expires_at": {"$gt": datetime.utcnow()}
+            })
+        except Exception as e:
+            logger.warning(f"Shared generation cache lookup failed: {str(e)}")
+            return None
+
+        if not doc:
+            self.shared_misses += 1
+            return None
+
+        self.shared_hits += 1
+        remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+        self.local.set(key, doc["value"], ttl_seconds=max(remaining, 0))
+        return doc["value"]
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
+        ttl = ttl_seconds or self.ttl_seconds
+        self.local.set(key, value, ttl_seconds=ttl)
+
+        collection = db.generation_cache_collection
+        if collection is None:
+            return
+
+        now = datetime.utcnow()
+        try:
+            await collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "value": value,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Shared generation cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local": self.local.stats(),
+            "shared": {
+                "hits": self.shared_hits,
+                "misses": self.shared_misses
+            }
+        }
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from ..config import settings
+from ..database import db
+from ..utils.cache import LRUCache
+from ..utils.context_packing import chunk_document, seed_chunks
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def _record_size(record: Dict[str, Any]) -> int:
+    return 256 + 2 * len(record["text"])
+
+class DocumentCache:
+    """Extracted text, chunk boundaries and token counts keyed by the sha256 of the uploaded bytes.
+
+    An in-process LRU sits in front of a Mongo collection shared by all
+    workers. Records remember which users uploaded them; only those users may
+    reuse a document by hash without uploading it again. Texts too large to
+    share stay local, but their owners are still stored in Mongo so any worker
+    holding the text can tell who uploaded it.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl_seconds: int = None):
+        self.ttl_seconds = ttl_seconds or settings.document_cache_ttl_seconds
+        self.local = LRUCache(
+            max_entries=max_entries or settings.document_cache_max_entries,
+            ttl_seconds=self.ttl_seconds,
+            max_bytes=max_bytes or settings.document_cache_max_bytes,
+            sizeof=_record_size
+        )
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    async def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        record = self.local.get(digest)
+        if record is None:
+            record = await self._get_shared(digest)
+            if record is None:
+                return None
+            self.local.set(digest, record)
+        self._seed(record)
+        return record
+
+    async def _get_shared(self, digest: str) -> Optional[Dict[str, Any]]:
+        collection = db.document_cache_collection
+        if collection is None:
+            return None
+        try:
+            record = await collection.find_one({"_id": digest, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logger.warning(f"Shared document cache lookup failed: {str(e)}")
+            return None
+        if record is None or "text" not in record:
+            # Texts over document_cache_max_shared_chars only have their owners shared
+            self.shared_misses += 1
+            return None
+        self.shared_hits += 1
+        record["chunks"] = [tuple(chunk) for chunk in record["chunks"]]
+        record["owners"] = set(record.get("owners", []))
+        return record
+
+    async def _shared_owners(self, digest: str) -> Set[str]:
+        collection = db.document_cache_collection
+        if collection is None:
+            return set()
+        try:
+            shared = await collection.find_one({"_id": digest, "expires_at": {"$gt": datetime.utcnow()}}, {"owners": 1})
+        except Exception as e:
+            logger.warning(f"Shared document cache lookup failed: {str(e)}")
+            return set()
+        return set(shared.get("owners", [])) if shared else set()
+
+    def _seed(self, record: Dict[str, Any]) -> None:
+        # Chunks are only reusable if they were cut the way the prompt builder would cut them
+        if record["chunk_tokens"] == settings.document_chunk_tokens and record["model"] == settings.openai_model:
+            seed_chunks(record["text"], record["chunk_tokens"], record["model"], record["chunks"])
+
+    async def put(self, digest: str, text: str, filename: str) -> Dict[str, Any]:
+        """Chunk and count a freshly extracted document and cache it under its hash"""
+        # Token counting a large document is CPU work; keep it off the event loop
+        chunks = await asyncio.to_thread(chunk_document, text, settings.document_chunk_tokens, settings.openai_model)
+        record = {
+            "_id": digest,
+            "filename": filename,
+            "text": text,
+            "chunks": chunks,
+            "chunk_tokens": settings.document_chunk_tokens,
+            "model": settings.openai_model,
+            "tokens": sum(tokens for _, tokens in chunks),
+            "owners": set()
+        }
+        self.local.set(digest, record)
+        await self._write_shared(record)
+        return record
+
+    async def _write_shared(self, record: Dict[str, Any]) -> None:
+        collection = db.document_cache_collection
+        if collection is None or len(record["text"]) > settings.document_cache_max_shared_chars:
+            return
+        now = datetime.utcnow()
+        try:
+            await collection.update_one(
+                {"_id": record["_id"]},
+                {
+                    "$set": {
+                        "filename": record["filename"],
+                        "text": record["text"],
+                        "chunks": [list(chunk) for chunk in record["chunks"]],
+                        "chunk_tokens": record["chunk_tokens"],
+                        "model": record["model"],
+                        "tokens": record["tokens"],
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                    },
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Shared document cache write failed: {str(e)}")
+
+    async def add_owner(self, record: Dict[str, Any], owner: str) -> None:
+        if owner in record["owners"]:
+            return
+        record["owners"].add(owner)
+        collection = db.document_cache_collection
+        if collection is None:
+            return
+        now = datetime.utcnow()
+        try:
+            await collection.update_one(
+                {"_id": record["_id"]},
+                {
+                    "$addToSet": {"owners": owner},
+                    # Every upload keeps the document around for another full TTL
+                    "$set": {"expires_at": now + timedelta(seconds=self.ttl_seconds)},
+                    "$setOnInsert": {"created_at": now}
+                },
+                # Upserted so the owner is recorded even when the text was not shared
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Shared document cache write failed: {str(e)}")
+
+    async def lookup(self, digests: List[str], owner: str) -> List[Optional[Dict[str, Any]]]:
+        """Records for hashes the owner has uploaded before; None for unknown ones"""
+        records = []
+        for digest in digests:
+            record = await self.get(digest) if SHA256_RE.match(digest) else None
+            if record is not None and owner not in record["owners"]:
+                # The owner may have uploaded it through another worker
+                record["owners"] |= await self._shared_owners(digest)
+            records.append(record if record is not None and owner in record["owners"] else None)
+        return records
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local": self.local.stats(),
+            "shared": {
+                "hits": self.shared_hits,
+                "misses": self.shared_misses
+            }
+        }
+
+document_cache = DocumentCache()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+from ..config import settings
+from ..utils.deadline import with_deadline
+from ..utils.document_extract import DocumentExtractionError, extract_doc, extract_docx
+
+logger = logging.getLogger(__name__)
+
+class DocumentExtractor:
+    """Runs Word text extraction in a small process pool.
+
+    Parsing is CPU bound and would otherwise hold the GIL while the event loop
+    is streaming generations. Jobs past the pool's capacity wait for a slot.
+    A job that overruns its timeout gets the pool recycled so the stuck worker
+    cannot starve later uploads.
+    """
+
+    def __init__(self, max_workers: int = None, max_in_flight: int = None):
+        self.max_workers = max_workers or settings.document_extract_workers
+        self.max_in_flight = max_in_flight or settings.document_extract_max_in_flight
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.extracted = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def _timeout(self, file_ext: str) -> float:
+        return settings.docx_extract_timeout_seconds if file_ext == '.docx' else settings.doc_extract_timeout_seconds
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    def _recycle(self) -> None:
+        if self.pool is not None:
+            # shutdown() only stops idle workers; one stuck in a parse would keep running, so end them all.
+            # Other jobs still in this pool fail with BrokenProcessPool and are reported as unreadable.
+            processes = list((self.pool._processes or {}).values())
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            self.pool = None
+
+    async def extract(self, file_ext: str, data: bytes) -> str:
+        """Text of a .docx or .doc file; raises DocumentExtractionError when it can't be read"""
+        timeout = self._timeout(file_ext)
+        if file_ext == '.docx':
+            job = (extract_docx, data, settings.document_max_decompressed_bytes, settings.document_max_compression_ratio, timeout)
+        elif file_ext == '.doc':
+            job = (extract_doc, data, timeout)
+        else:
+            raise DocumentExtractionError(f"No extractor for {file_ext}")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool(), *job)
+            try:
+                # Workers stop themselves at the timeout; this is the backstop
+                text = await with_deadline(asyncio.wait_for(future, timeout + 1.0), "extract document")
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"{file_ext} extraction timed out after {timeout}s, recycling the pool")
+                self._recycle()
+                raise DocumentExtractionError("Document took too long to process")
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start fresh for the next upload
+                self.failed += 1
+                self._recycle()
+                raise DocumentExtractionError("Document could not be processed")
+            except DocumentExtractionError:
+                self.failed += 1
+                raise
+        self.extracted += 1
+        return text
+
+    def close(self) -> None:
+        self._recycle()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "extracted": self.extracted,
+            "failed": self.failed,
+            "timeouts": self.timeouts
+        }
+
+document_extractor = DocumentExtractor()
@@ -1,66 +1,148 @@
+import asyncio
+import codecs
+import hashlib
 import logging
 from fastapi import HTTPException, UploadFile
-from typing import List
+from typing import Any, Dict, List, Optional
+from ..config import settings
+from ..utils.document_extract import DocumentExtractionError
+from ..utils.error_handlers import APIError
+from .document_cache import document_cache
+from .document_extractor import document_extractor
 
 logger = logging.getLogger(__name__)
 
+class _UploadBudget:
+    """Bytes read so far across every file of one request"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def take(self, size: int) -> None:
+        self.used += size
+        if self.used > self.limit:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Total size of all files exceeds {self.limit // 1024}KB"
+            )
+
 class FileService:
     def __init__(self):
         self.ALLOWED_EXTENSIONS = {'.txt', '.doc', '.docx'}
-        self.MAX_FILE_SIZE = 50 * 1024  # 50KB per file
-        self.MAX_TOTAL_SIZE = 200 * 1024  # 200KB total
+        self.MAX_FILE_SIZE = settings.upload_max_file_bytes
+        self.MAX_TOTAL_SIZE = settings.upload_max_total_bytes
+        self.CHUNK_SIZE = settings.upload_chunk_bytes
+        self.extractor = document_extractor
+        self.cache = document_cache
 
-    async def process_files(self, files: List[UploadFile]) -> List[str]:
-        """Process and validate uploaded files"""
-        if not files:
+    async def process_files(self, files: List[UploadFile], document_hashes: Optional[List[str]] = None, user_id: str = "anonymous") -> List[str]:
+        """Process and validate uploaded files, followed by previously uploaded documents referenced by sha256"""
+        if not files and not document_hashes:
             return []
 
-        total_size = 0
-        document_texts = []
-        
+        files = files or []
+        # Reject bad extensions before reading any bytes
         for file in files:
-            try:
-                # Check file extension
-                file_ext = '.' + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
-                if file_ext not in self.ALLOWED_EXTENSIONS:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"File type {file_ext} not allowed. Supported types: {', '.join(self.ALLOWED_EXTENSIONS)}"
-                    )
+            self._extension(file)
+
+        referenced = await self._referenced_texts(document_hashes or [], user_id)
+        budget = _UploadBudget(self.MAX_TOTAL_SIZE)
+        tasks = [asyncio.ensure_future(self._read_text(file, self._extension(file), budget, user_id)) for file in files]
+        try:
+            return await asyncio.gather(*tasks) + referenced
+        finally:
+            # The first rejected file fails the request; stop reading the rest
+            for task in tasks:
+                task.cancel()
+
+    async def _referenced_texts(self, document_hashes: List[str], user_id: str) -> List[str]:
+        if len(document_hashes) > settings.upload_max_document_hashes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.upload_max_document_hashes} documents can be referenced by hash"
+            )
+        document_hashes = [digest.strip().lower() for digest in document_hashes]
+        records = await self.cache.lookup(document_hashes, user_id)
+        for digest, record in zip(document_hashes, records):
+            if record is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Document {digest} is not cached; upload the file instead"
+                )
+        return [record["text"] for record in records]
+
+    async def describe(self, digest: str, user_id: str) -> Dict[str, Any]:
+        """What is cached for a document the user uploaded before"""
+        record = (await self.cache.lookup([digest.lower()], user_id))[0]
+        if record is None:
+            raise HTTPException(status_code=404, detail="Document not cached")
+        return {
+            "sha256": record["_id"],
+            "filename": record["filename"],
+            "tokens": record["tokens"],
+            "chunks": len(record["chunks"])
+        }
 
-                content = await file.read()
-                size = len(content)
-                
+    def _extension(self, file: UploadFile) -> str:
+        file_ext = '.' + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
+        if file_ext not in self.ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File type {file_ext} not allowed. Supported types: {', '.join(self.ALLOWED_EXTENSIONS)}"
+            )
+        return file_ext
+
+    async def _read_text(self, file: UploadFile, file_ext: str, budget: _UploadBudget, user_id: str = "anonymous") -> str:
+        """Read a file chunk by chunk, enforcing size limits (and UTF-8 validity for text) as bytes arrive"""
+        # Word files are binary; their bytes are kept for the extractor instead of decoded
+        decoder = codecs.getincrementaldecoder('utf-8')() if file_ext == '.txt' else None
+        digest = hashlib.sha256()
+        parts = []
+        size = 0
+        try:
+            while True:
+                chunk = await file.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
                 if size > self.MAX_FILE_SIZE:
                     raise HTTPException(
                         status_code=400,
-                        detail=f"File {file.filename} exceeds maximum size of 50KB"
-                    )
-                
-                total_size += size
-                if total_size > self.MAX_TOTAL_SIZE:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Total size of all files exceeds 200KB"
-                    )
-                
-                await file.seek(0)
-                try:
-                    text = content.decode('utf-8')
-                    document_texts.append(text)
-                except UnicodeDecodeError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"File {file.filename} appears to be binary or not a valid text document"
+                        detail=f"File {file.filename} exceeds maximum size of {self.MAX_FILE_SIZE // 1024}KB"
                     )
-                    
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.error(f"Error processing file {file.filename}: {str(e)}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error processing file {file.filename}"
-                )
-        
-        return document_texts
+                budget.take(len(chunk))
+                digest.update(chunk)
+                parts.append(decoder.decode(chunk) if decoder else chunk)
+            await file.seek(0)
+
+            # A repeat upload reuses the earlier extraction, chunks and token counts
+            record = await self.cache.get(digest.hexdigest())
+            if record is None:
+                if decoder is None:
+                    text = await self.extractor.extract(file_ext, b''.join(parts))
+                else:
+                    parts.append(decoder.decode(b'', final=True))
+                    text = ''.join(parts)
+                record = await self.cache.put(digest.hexdigest(), text, file.filename)
+            if user_id != "anonymous":
+                await self.cache.add_owner(record, user_id)
+            return record["text"]
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File {file.filename} appears to be binary or not a valid text document"
+            )
+        except DocumentExtractionError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Could not read text from {file.filename}: {str(e)}"
+            )
+        except (HTTPException, APIError):
+            raise
+        except Exception as e:
+            logger.error(f"Error processing file {file.filename}: {str(e)}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Error processing file {file.filename}"
+            )
@@ -1,35 +1,216 @@
+import asyncio
 import logging
-from typing import List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
 from .model_service import ModelService
 from .text_generation_service import TextGenerationService
 from .image_generation_service import ImageGenerationService
+from .image_store_service import ImageStoreService
+from .summary_service import SummaryService
+from .cache_service import GenerationCache, make_generation_key
+from ..config import settings
+from ..database import db
+from ..utils.singleflight import SingleFlight, MongoLease
+from ..utils.deadline import check_deadline, remaining
+from ..utils.error_handlers import APIError
+from ..utils.model_utils import get_text_generation_params, get_image_generation_params
 
 logger = logging.getLogger(__name__)
 
 class GenerationService:
-    def __init__(self, model_service: ModelService):
+    def __init__(self, model_service: ModelService, cache: Optional[GenerationCache] = None, image_store: Optional[ImageStoreService] = None):
         self.model_service = model_service
         self.text_service = TextGenerationService(model_service)
         self.image_service = ImageGenerationService(model_service)
+        self.cache = cache or GenerationCache()
+        self.summaries = SummaryService(model_service, self.cache)
+        self.image_store = image_store or ImageStoreService()
+        self.single_flight = SingleFlight()
+
+    def _text_cache_key(self, template: str, objective: str, context: str, document_texts: Optional[List[str]]) -> str:
+        return make_generation_key("text", template, objective, context, document_texts, get_text_generation_params())
+
+    def _image_cache_key(self, template: str, objective: str, context: str) -> str:
+        return make_generation_key("stored-image", template, objective, context, None, get_image_generation_params())
+
+    async def _produce_and_cache(self, key: str, produce: Callable[[], Awaitable[Any]], ttl_seconds: Optional[int] = None) -> Any:
+        value = await produce()
+        if value:
+            await self.cache.set(key, value, ttl_seconds=ttl_seconds)
+        return value
+
+    async def _wait_for_shared_result(self, key: str, lease: MongoLease) -> Optional[Any]:
+        """Poll the shared cache while another worker holds the lease for this key, within the request deadline"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + remaining(settings.singleflight_lease_seconds)
+        while loop.time() < deadline:
+            value = await self.cache.get(key)
+            if value is not None:
+                return value
+            if not await lease.is_held():
+                # Leader finished or gave up; its result may have landed just before release
+                return await self.cache.get(key)
+            await asyncio.sleep(max(0, min(settings.singleflight_poll_interval, deadline - loop.time())))
+        return None
+
+    async def _lead_or_follow(self, key: str, produce: Callable[[], Awaitable[Any]], ttl_seconds: Optional[int] = None) -> Any:
+        collection = db.generation_leases_collection
+        if collection is None:
+            return await self._produce_and_cache(key, produce, ttl_seconds)
+
+        lease = MongoLease(collection, key, settings.singleflight_lease_seconds)
+        try:
+            acquired = await lease.acquire()
+        except Exception as e:
+            logger.warning(f"Generation lease unavailable, running without it: {str(e)}")
+            return await self._produce_and_cache(key, produce, ttl_seconds)
+
+        if acquired:
+            try:
+                return await self._produce_and_cache(key, produce, ttl_seconds)
+            finally:
+                try:
+                    await lease.release()
+                except Exception as e:
+                    logger.warning(f"Failed to release generation lease: {str(e)}")
+
+        logger.info("Waiting for identical generation running on another worker", extra={"cache_key": key})
+        value = await self._wait_for_shared_result(key, lease)
+        if value is not None:
+            return value
+        check_deadline("wait for shared generation")
+        return await self._produce_and_cache(key, produce, ttl_seconds)
+
+    async def _coalesced(self, key: str, produce: Callable[[], Awaitable[Any]], ttl_seconds: Optional[int] = None) -> Any:
+        """Share one upstream call between identical requests in this and other workers"""
+        return await self.single_flight.do(key, lambda: self._lead_or_follow(key, produce, ttl_seconds))
+
+    async def _previous_post(self, error: APIError, template: str, objective: str, user_id: str) -> Optional[str]:
+        """The user's last post for the same prompt, to serve while the model circuit is open"""
+        if (
+            not settings.circuit_breaker_serve_previous
+            or error.details.get("reason") != "circuit_open"
+            or user_id == "anonymous"
+            or db.posts_collection is None
+        ):
+            return None
+        try:
+            post = await db.posts_collection.find_one(
+                {"user_id": user_id, "template": template, "objective": objective},
+                sort=[("created_at", -1)]
+            )
+        except Exception as e:
+            logger.warning(f"Previous post lookup failed: {str(e)}")
+            return None
+        if not post:
+            return None
+        logger.warning("Model circuit open, serving previously generated post", extra={"user_id": user_id})
+        return post["generated_content"]
 
     async def generate_text(
         self, 
         template: str, 
         request_objective: str, 
         request_context: str,
-        document_texts: Optional[List[str]] = None
+        document_texts: Optional[List[str]] = None,
+        use_cache: bool = True,
+        user_id: str = "anonymous"
     ) -> str:
-        return await self.text_service.generate(template, request_objective, request_context, document_texts)
+        use_cache = use_cache and settings.generation_cache_enabled
+        key = self._text_cache_key(template, request_objective, request_context, document_texts)
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info("Serving generated text from cache", extra={"cache_key": key})
+                return cached
+
+        produce = lambda: self.text_service.generate(template, request_objective, request_context, document_texts, user_id=user_id)
+        try:
+            if use_cache:
+                return await self._coalesced(key, produce)
+            return await self._produce_and_cache(key, produce)
+        except APIError as e:
+            previous = await self._previous_post(e, template, request_objective, user_id)
+            if previous is None:
+                raise
+            return previous
+
+    async def generate_text_variants(
+        self, 
+        template: str, 
+        request_objective: str, 
+        request_context: str,
+        document_texts: Optional[List[str]] = None,
+        n: int = 1,
+        user_id: str = "anonymous"
+    ) -> List[str]:
+        # Drafts are meant to differ, so variants bypass the cache and coalescing
+        return await self.text_service.generate_variants(template, request_objective, request_context, document_texts, n, user_id=user_id)
+
+    async def generate_text_stream(
+        self, 
+        template: str, 
+        request_objective: str, 
+        request_context: str,
+        document_texts: Optional[List[str]] = None,
+        use_cache: bool = True,
+        user_id: str = "anonymous"
+    ) -> AsyncIterator[str]:
+        use_cache = use_cache and settings.generation_cache_enabled
+        key = self._text_cache_key(template, request_objective, request_context, document_texts)
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info("Serving streamed text from cache", extra={"cache_key": key})
+                yield cached
+                return
+
+        parts: List[str] = []
+        try:
+            async for delta in self.text_service.generate_stream(template, request_objective, request_context, document_texts, user_id=user_id):
+                parts.append(delta)
+                yield delta
+        except APIError as e:
+            # The circuit only rejects before the first delta, so nothing has been sent yet
+            previous = None if parts else await self._previous_post(e, template, request_objective, user_id)
+            if previous is None:
+                raise
+            yield previous
+            return
+
+        # Only complete streams are cached; a disconnect never reaches this point
+        generated_text = "".join(parts).strip()
+        if generated_text:
+            await self.cache.set(key, generated_text)
 
     async def generate_image(
         self, 
         template: str, 
         request_objective: str, 
-        request_context: str
+        request_context: str,
+        use_cache: bool = True,
+        user_id: str = "anonymous"
     ) -> str:
+        use_cache = use_cache and settings.generation_cache_enabled
+        key = self._image_cache_key(template, request_objective, request_context)
         try:
+            if use_cache:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    logger.info("Serving generated image from cache", extra={"cache_key": key})
+                    return cached
+
             logger.info(f"Calling image_service.generate with template={template}, objective={request_objective}, context={request_context}")
-            image_url = await self.image_service.generate(template, request_objective, request_context)
+
+            async def produce() -> str:
+                # Provider URLs expire, so the bytes are copied into our own store
+                provider_url = await self.image_service.generate(template, request_objective, request_context, user_id=user_id)
+                digest = await self.image_store.store_from_url(provider_url)
+                return self.image_store.public_url(digest)
+
+            if use_cache:
+                image_url = await self._coalesced(key, produce)
+            else:
+                image_url = await self._produce_and_cache(key, produce)
             logger.info(f"Image service returned: {image_url}")
             return image_url
         except Exception as e:
@@ -0,0 +1,61 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from ..config import settings
+from ..utils.cache import LRUCache
+from .post_version_service import PostVersionService
+
+logger = logging.getLogger(__name__)
+
+def _result_size(result: Dict[str, Any]) -> int:
+    """Rough in-memory footprint of a history page"""
+    size = 256
+    for post in result.get("posts", []):
+        size += 256 + sum(len(value) for value in post.values() if isinstance(value, str))
+    return size
+
+def _copy(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Callers decorate pages (pending posts, highlights), so never hand out the cached objects
+    return {**result, "posts": [dict(post) for post in result["posts"]]}
+
+class HistoryCache:
+    """History pages cached per user and post version.
+
+    A write on any worker bumps the user's version, so cached pages for the
+    old version are simply never looked up again and age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl_seconds: int = None):
+        self.cache = LRUCache(
+            max_entries=max_entries or settings.history_cache_max_entries,
+            ttl_seconds=ttl_seconds or settings.history_cache_ttl_seconds,
+            max_bytes=max_bytes or settings.history_cache_max_bytes,
+            sizeof=_result_size
+        )
+        self.version_errors = 0
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        params: Dict[str, Hashable],
+        load: Callable[[Optional[int]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        try:
+            version = await PostVersionService.get_version(user_id)
+        except Exception as e:
+            self.version_errors += 1
+            logger.warning(f"Post version unavailable, reading history uncached: {str(e)}")
+            return await load(None)
+
+        key = (user_id, version, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return _copy(cached)
+
+        result = await load(version)
+        self.cache.set(key, result)
+        return _copy(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "max_bytes": self.cache.max_bytes, "version_errors": self.version_errors}
+
+history_cache = HistoryCache()
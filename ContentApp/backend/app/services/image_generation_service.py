@@ -1,6 +1,5 @@
 import logging
 from .model_service import ModelService
-from ..config import settings
 from ..utils.error_handlers import handle_api_operation
 
 logger = logging.getLogger(__name__)
@@ -19,15 +18,15 @@ class ImageGenerationService:
             "No text, clean corporate look."
         )
 
-    async def generate(self, template: str, objective: str, context: str) -> str:
+    async def generate(self, template: str, objective: str, context: str, user_id: str = "anonymous") -> str:
         try:
             prompt = self._create_prompt(template, objective, context)
             logger.info(f"Generating image with prompt: {prompt}")
             
-            # Explicitly pass the model from settings to ensure it's using dall-e-2
+            # The default image model comes from settings; backends may configure their own
             result = await handle_api_operation(
                 "image generation",
-                self.model_service.generate_image(prompt, model=settings.openai_image_model),
+                self.model_service.generate_image(prompt, user_id=user_id),
                 "Image generation failed"
             )
             
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from .generation_service import GenerationService
+from .post_service import PostService
+from ..config import settings
+from ..database import db
+from ..schemas import TEMPLATE_PROMPTS
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+class ImageJobService:
+    """Runs image generations in a bounded worker pool with job state stored in Mongo.
+
+    Jobs queued in Mongo but not in memory (the queue was full, or the worker
+    process that held them died) and running jobs whose lease expired are
+    requeued at startup and then every few seconds.
+    """
+
+    def __init__(self, generation_service: GenerationService, post_service: PostService, workers: int = None):
+        self.generation_service = generation_service
+        self.post_service = post_service
+        self.worker_count = workers or settings.image_job_workers
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.recovery: Optional[asyncio.Task] = None
+        self._done_events: Dict[str, asyncio.Event] = {}
+        # Long-polls waiting on each event, so the last one to leave removes it
+        self._done_waiters: Dict[str, int] = {}
+        # Ids in the in-memory queue, so recovery does not queue them twice
+        self._queued: Set[str] = set()
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=settings.image_job_queue_size)
+        self._queued.clear()
+        self.workers = [
+            asyncio.create_task(self._worker(i))
+            for i in range(self.worker_count)
+        ]
+        await self.recover_jobs()
+        self.recovery = asyncio.create_task(self._recover_periodically())
+
+    async def stop(self) -> None:
+        tasks = self.workers + ([self.recovery] if self.recovery else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.recovery = None
+
+    def _enqueue(self, job_id: str) -> None:
+        self.queue.put_nowait(job_id)
+        self._queued.add(job_id)
+
+    async def recover_jobs(self) -> int:
+        """Requeue jobs left queued, or running by a worker that stopped mid-job"""
+        now = datetime.utcnow()
+        expired = {"status": "running", "lease_expires_at": {"$lte": now}}
+        failed = await db.image_jobs_collection.update_many(
+            {**expired, "attempts": {"$gte": settings.image_job_max_attempts}},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": f"Image job did not finish after {settings.image_job_max_attempts} attempts",
+                    "updated_at": now
+                },
+                "$unset": {"lease_expires_at": ""}
+            }
+        )
+        if failed.modified_count:
+            logger.warning(f"Failed {failed.modified_count} image jobs that kept losing their worker")
+        await db.image_jobs_collection.update_many(
+            expired,
+            {"$set": {"status": "queued", "updated_at": now}, "$unset": {"lease_expires_at": ""}}
+        )
+        recovered = 0
+        async for job in db.image_jobs_collection.find({"status": "queued"}, {"_id": 1}).sort("created_at", 1):
+            if self.queue.full():
+                break
+            # Jobs queued by other processes may be taken here too; claiming is atomic
+            if job["_id"] in self._queued:
+                continue
+            self._enqueue(job["_id"])
+            recovered += 1
+        if recovered:
+            logger.info(f"Recovered {recovered} image jobs")
+        return recovered
+
+    async def _recover_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.image_job_recovery_seconds)
+            try:
+                await self.recover_jobs()
+            except Exception as e:
+                logger.warning(f"Image job recovery failed: {str(e)}")
+
+    async def submit(self, template: str, objective: str, context: str, user_id: str, use_cache: bool = True) -> Dict[str, Any]:
+        if not template or not objective or not context:
+            raise HTTPException(status_code=400, detail="Missing required fields")
+        if template not in TEMPLATE_PROMPTS:
+            raise HTTPException(status_code=400, detail="Invalid template type")
+        if self.queue is None or self.queue.full():
+            raise HTTPException(status_code=503, detail="Image job queue is full. Please try again later.")
+
+        now = datetime.utcnow()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "template": template,
+            "objective": objective,
+            "context": context,
+            "use_cache": use_cache,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+        await db.image_jobs_collection.insert_one(job)
+        self._enqueue(job["_id"])
+        return self._serialize(job)
+
+    async def get_job(self, job_id: str, user_id: str, wait: float = 0) -> Dict[str, Any]:
+        """Return the job, optionally long-polling until it finishes or wait seconds pass"""
+        job = await self._find_job(job_id, user_id)
+        if job["status"] in FINISHED_STATUSES or wait <= 0:
+            return self._serialize(job)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, settings.image_job_max_wait_seconds)
+        event = self._done_events.setdefault(job_id, asyncio.Event())
+        self._done_waiters[job_id] = self._done_waiters.get(job_id, 0) + 1
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    # Jobs run by this worker signal the event; others are picked up by polling
+                    await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+                job = await self._find_job(job_id, user_id)
+                if job["status"] in FINISHED_STATUSES:
+                    break
+        finally:
+            self._done_waiters[job_id] -= 1
+            if not self._done_waiters[job_id]:
+                del self._done_waiters[job_id]
+                # _finish may already have popped it, and a newer poll may have registered another
+                if self._done_events.get(job_id) is event:
+                    del self._done_events[job_id]
+        return self._serialize(job)
+
+    async def _find_job(self, job_id: str, user_id: str) -> Dict[str, Any]:
+        job = await db.image_jobs_collection.find_one({"_id": job_id, "user_id": user_id})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    def _serialize(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "job_id": job["_id"],
+            "status": job["status"],
+            "result": job.get("result"),
+            "error": job.get("error"),
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await db.image_jobs_collection.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {
+                "$set": {
+                    "status": "running",
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=settings.image_job_lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _renew_lease(self, job_id: str) -> None:
+        """Keep the lease of a running job alive, so recovery only takes jobs whose worker stopped"""
+        while True:
+            await asyncio.sleep(settings.image_job_lease_seconds / 3)
+            try:
+                now = datetime.utcnow()
+                await db.image_jobs_collection.update_one(
+                    {"_id": job_id, "status": "running"},
+                    {"$set": {"lease_expires_at": now + timedelta(seconds=settings.image_job_lease_seconds)}}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to renew lease of image job {job_id}: {str(e)}")
+
+    async def _run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        image_url = await asyncio.wait_for(
+            self.generation_service.generate_image(
+                template=TEMPLATE_PROMPTS[job["template"]],
+                request_objective=job["objective"],
+                request_context=job["context"],
+                use_cache=job.get("use_cache", True),
+                user_id=job["user_id"]
+            ),
+            timeout=settings.image_job_timeout_seconds
+        )
+        post = await self.post_service.create_post({
+            "user_id": job["user_id"],
+            "template": job["template"],
+            "objective": job["objective"],
+            "context": job["context"],
+            "generated_content": image_url,
+            "type": "image"
+        }, job["user_id"])
+        return {"image_url": image_url, "post_id": post.id}
+
+    async def _finish(self, job_id: str, update: Dict[str, Any]) -> None:
+        update["updated_at"] = datetime.utcnow()
+        await db.image_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": update, "$unset": {"lease_expires_at": ""}}
+        )
+        event = self._done_events.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job_id = await self.queue.get()
+            self._queued.discard(job_id)
+            try:
+                job = await self._claim(job_id)
+                if not job:
+                    continue  # Already claimed by another worker
+                logger.info(f"Image job {job_id} started on worker {number}")
+                lease = asyncio.create_task(self._renew_lease(job_id))
+                try:
+                    try:
+                        result = await self._run(job)
+                    finally:
+                        lease.cancel()
+                    await self._finish(job_id, {"status": "succeeded", "result": result})
+                    logger.info(f"Image job {job_id} succeeded")
+                except asyncio.CancelledError:
+                    # Shutting down: hand the job back so recovery picks it up
+                    await asyncio.shield(db.image_jobs_collection.update_one(
+                        {"_id": job_id, "status": "running"},
+                        {"$set": {"status": "queued", "updated_at": datetime.utcnow()}}
+                    ))
+                    raise
+                except Exception as e:
+                    logger.error(f"Image job {job_id} failed: {str(e)}", exc_info=True)
+                    await self._finish(job_id, {"status": "failed", "error": str(e)})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Image job worker {number} error: {str(e)}", exc_info=True)
+            finally:
+                self.queue.task_done()
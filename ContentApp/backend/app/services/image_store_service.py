@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from typing import Optional
+import httpx
+from ..config import settings
+from ..utils.error_handlers import APIError
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the formats the image providers return
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"RIFF", "image/webp"),
+)
+
+def _make_thumbnail(source: str, target: str, size: int) -> bool:
+    try:
+        from PIL import Image # type: ignore
+    except ImportError:
+        return False
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        image.convert("RGB").save(target, format="JPEG", quality=80, optimize=True)
+    return True
+
+class ImageStoreService:
+    """Content-addressed on-disk store for generated images, keyed by sha256"""
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.image_store_dir
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=settings.image_download_timeout_seconds, follow_redirects=True)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def path_for(self, digest: str) -> str:
+        if not SHA256_RE.match(digest):
+            raise ValueError("Invalid image id")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def thumbnail_path_for(self, digest: str) -> str:
+        return self.path_for(digest) + ".thumb.jpg"
+
+    def public_url(self, digest: str) -> str:
+        return f"{settings.public_base_url}{settings.api_prefix}/images/{digest}"
+
+    @staticmethod
+    def content_type(path: str) -> str:
+        with open(path, "rb") as f:
+            head = f.read(12)
+        for signature, content_type in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return content_type
+        return "application/octet-stream"
+
+    async def store_from_url(self, url: str) -> str:
+        """Stream the image at url into the store and return its sha256"""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                async with self._get_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        size += len(chunk)
+                        if size > settings.image_max_bytes:
+                            raise APIError(message="Generated image is too large", status_code=502)
+                        digest.update(chunk)
+                        tmp.write(chunk)
+
+            key = digest.hexdigest()
+            path = self.path_for(key)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                logger.info(f"Stored image {key} ({size} bytes)")
+        except APIError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to download generated image: {str(e)}", exc_info=True)
+            raise APIError(message="Failed to store generated image", status_code=502, details={"error": str(e)})
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        await self._ensure_thumbnail(key)
+        return key
+
+    async def _ensure_thumbnail(self, digest: str) -> None:
+        target = self.thumbnail_path_for(digest)
+        if os.path.exists(target):
+            return
+        tmp_target = target + ".part"
+        try:
+            # Decoding and resizing is CPU bound; keep it off the event loop
+            created = await asyncio.to_thread(_make_thumbnail, self.path_for(digest), tmp_target, settings.image_thumbnail_size)
+            if created:
+                os.replace(tmp_target, target)
+        except Exception as e:
+            logger.warning(f"Thumbnail generation failed for {digest}: {str(e)}")
+        finally:
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
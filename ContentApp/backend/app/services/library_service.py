@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np # type: ignore
+from bson import ObjectId
+from fastapi import UploadFile
+from pymongo.errors import DuplicateKeyError
+from .file_service import FileService
+from ..config import settings
+from ..database import db
+from ..utils.cache import LRUCache
+from ..utils.context_packing import chunk_document
+from ..utils.deadline import with_deadline
+from ..utils.error_handlers import APIError
+from ..utils.singleflight import SingleFlight
+from ..utils.vector_index import VectorFile, embed_texts
+
+logger = logging.getLogger(__name__)
+
+# Concurrent adds and deletes of one user retry their index update this often
+INDEX_UPDATE_ATTEMPTS = 8
+
+Ranges = List[List[int]]
+
+def _take_rows(free: Ranges, end: int, count: int) -> Tuple[Ranges, Ranges, int]:
+    """Row ranges for count rows, reusing freed rows first; returns (taken, still free, new end)"""
+    taken: Ranges = []
+    remaining: Ranges = []
+    for start, size in free:
+        use = min(size, count)
+        if use:
+            taken.append([start, use])
+            count -= use
+        if use < size:
+            remaining.append([start + use, size - use])
+    if count:
+        taken.append([end, count])
+        end += count
+    return taken, remaining, end
+
+def _release_rows(free: Ranges, end: int, ranges: Ranges) -> Tuple[Ranges, int]:
+    """Free ranges merged with adjacent ones; a free tail shortens the used rows instead"""
+    merged: Ranges = []
+    for start, size in sorted([*free, *ranges]):
+        if merged and merged[-1][0] + merged[-1][1] == start:
+            merged[-1][1] += size
+        else:
+            merged.append([start, size])
+    if merged and merged[-1][0] + merged[-1][1] == end:
+        end = merged.pop()[0]
+    return merged, end
+
+def _ranges(document: Dict[str, Any]) -> Ranges:
+    # Documents added before rows were reused hold a single range
+    return document.get("ranges") or [[document["first_row"], document["row_count"]]]
+
+class LibraryService:
+    """Documents a user saved once and reuses across generations.
+
+    Chunk texts live in Mongo; their hashed-feature vectors live in one
+    memory-mapped file per user, addressed by row. The user's index record
+    tracks the used rows and a list of freed ranges; deleting a document (or
+    failing to add one) frees its rows, and new documents fill freed ranges
+    before the file grows. Rows without a live document are masked out of
+    searches.
+    """
+
+    def __init__(self, file_service: FileService, root: str = None):
+        self.file_service = file_service
+        self.root = root or settings.library_dir
+        self._files = LRUCache(max_entries=settings.library_open_indexes, ttl_seconds=3600)
+        self._rebuilds = SingleFlight()
+
+    def _vector_file(self, user_id: str) -> VectorFile:
+        vector_file = self._files.get(user_id)
+        if vector_file is None:
+            folder = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+            vector_file = VectorFile(os.path.join(self.root, folder, "vectors.f32"), settings.library_embedding_dim)
+            self._files.set(user_id, vector_file)
+        return vector_file
+
+    async def _update_index(self, user_id: str, change: Callable[[Ranges, int], Tuple[Any, Ranges, int]]) -> Any:
+        """Apply change(free, rows) to the user's index record, retrying when another worker updated it first"""
+        for _ in range(INDEX_UPDATE_ATTEMPTS):
+            index = await db.library_indexes_collection.find_one({"_id": user_id}) or {}
+            result, free, rows = change(index.get("free", []), index.get("rows", 0))
+            try:
+                updated = await db.library_indexes_collection.update_one(
+                    {"_id": user_id, "version": index.get("version")},
+                    {"$set": {"rows": rows, "free": free, "version": (index.get("version") or 0) + 1}},
+                    upsert=not index
+                )
+            except DuplicateKeyError:
+                continue
+            if updated.matched_count or updated.upserted_id is not None:
+                return result
+        raise APIError(message="Document library is busy, try again", status_code=503, log_level="warning")
+
+    async def _allocate_rows(self, user_id: str, count: int) -> Ranges:
+        def take(free: Ranges, rows: int) -> Tuple[Ranges, Ranges, int]:
+            taken, free, rows = _take_rows(free, rows, count)
+            if rows > settings.library_max_rows:
+                raise APIError(
+                    message="Document library is full",
+                    status_code=413,
+                    details={"max_rows": settings.library_max_rows},
+                    log_level="warning"
+                )
+            return taken, free, rows
+
+        return await self._update_index(user_id, take)
+
+    async def _release_rows(self, user_id: str, ranges: Ranges) -> None:
+        def release(free: Ranges, rows: int) -> Tuple[None, Ranges, int]:
+            return (None, *_release_rows(free, rows, ranges))
+
+        await self._update_index(user_id, release)
+
+    async def add_documents(self, user_id: str, files: List[UploadFile]) -> List[Dict[str, Any]]:
+        if not files:
+            raise APIError(message="No documents to add", status_code=400, log_level="warning")
+        texts = await self.file_service.process_files(files, user_id=user_id)
+        return [await self._add(user_id, file.filename, text) for file, text in zip(files, texts)]
+
+    async def _add(self, user_id: str, filename: str, text: str) -> Dict[str, Any]:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        existing = await db.library_documents_collection.find_one({"user_id": user_id, "sha256": digest})
+        if existing:
+            return self._describe(existing)
+
+        chunks = chunk_document(text, settings.document_chunk_tokens, settings.openai_model)
+        if not chunks:
+            raise APIError(message=f"{filename} has no text to add", status_code=400, log_level="warning")
+        vectors = await asyncio.to_thread(embed_texts, [chunk for chunk, _ in chunks], settings.library_embedding_dim)
+
+        ranges = await self._allocate_rows(user_id, len(chunks))
+        rows = [start + offset for start, size in ranges for offset in range(size)]
+        document = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "filename": filename,
+            "sha256": digest,
+            "ranges": ranges,
+            "row_count": len(chunks),
+            "tokens": sum(tokens for _, tokens in chunks),
+            "created_at": datetime.utcnow()
+        }
+        try:
+            vector_file = self._vector_file(user_id)
+            done = 0
+            for start, size in ranges:
+                await asyncio.to_thread(vector_file.write, start, vectors[done:done + size])
+                done += size
+            await db.library_chunks_collection.insert_many([
+                {"user_id": user_id, "document_id": document["_id"], "row": row, "text": chunk}
+                for row, (chunk, _) in zip(rows, chunks)
+            ])
+            # Inserted last: its rows only count as live once their texts exist
+            await db.library_documents_collection.insert_one(document)
+        except BaseException as e:
+            # Give the rows back so a failed add does not use up the library
+            await db.library_chunks_collection.delete_many({"user_id": user_id, "document_id": document["_id"]})
+            await self._release_rows(user_id, ranges)
+            if isinstance(e, DuplicateKeyError):
+                # A concurrent add of the same text won the unique (user_id, sha256) index
+                existing = await db.library_documents_collection.find_one({"user_id": user_id, "sha256": digest})
+                if existing:
+                    return self._describe(existing)
+            raise
+        logger.info(f"Added {filename} to the library of {user_id}", extra={"chunks": len(chunks), "ranges": len(ranges)})
+        return self._describe(document)
+
+    def _describe(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "_id": str(document["_id"]),
+            "filename": document["filename"],
+            "chunks": document["row_count"],
+            "tokens": document["tokens"],
+            "created_at": document["created_at"]
+        }
+
+    async def list_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        documents = await with_deadline(
+            db.library_documents_collection.find({"user_id": user_id}).sort("created_at", -1).to_list(length=None),
+            "list library"
+        )
+        return [self._describe(document) for document in documents]
+
+    async def delete_document(self, user_id: str, document_id: str) -> bool:
+        if not ObjectId.is_valid(document_id):
+            return False
+        document = await db.library_documents_collection.find_one_and_delete({"_id": ObjectId(document_id), "user_id": user_id})
+        if document is None:
+            return False
+        # Without a document covering them the vectors are never returned; once the texts are gone the rows can be reused
+        await db.library_chunks_collection.delete_many({"user_id": user_id, "document_id": document["_id"]})
+        await self._release_rows(user_id, _ranges(document))
+        return True
+
+    async def _restore_vectors(self, user_id: str, vector_file: VectorFile, alive: np.ndarray) -> None:
+        """Re-embed live rows missing from the vector file, e.g. after it was lost with its container"""
+        missing = await asyncio.to_thread(vector_file.missing_rows, alive)
+        if len(missing):
+            chunks = await db.library_chunks_collection.find(
+                {"user_id": user_id, "row": {"$in": [int(row) for row in missing]}},
+                {"row": 1, "text": 1}
+            ).to_list(length=len(missing))
+            if chunks:
+                vectors = await asyncio.to_thread(embed_texts, [chunk["text"] for chunk in chunks], settings.library_embedding_dim)
+                await asyncio.to_thread(vector_file.write_rows, np.array([chunk["row"] for chunk in chunks]), vectors)
+            logger.warning(f"Rebuilt {len(chunks)} library vectors for {user_id} from stored chunks", extra={"missing_rows": len(missing)})
+        vector_file.verified = True
+
+    async def retrieve(self, user_id: str, query: str, k: int = None) -> List[str]:
+        """The user's library chunks most similar to the query, grouped into one text per document"""
+        documents = await with_deadline(
+            db.library_documents_collection.find(
+                {"user_id": user_id},
+                {"ranges": 1, "first_row": 1, "row_count": 1}
+            ).to_list(length=None),
+            "load library"
+        )
+        if not documents:
+            return []
+
+        start = time.perf_counter()
+        alive = np.zeros(max(first + size for doc in documents for first, size in _ranges(doc)), dtype=bool)
+        for doc in documents:
+            for first, size in _ranges(doc):
+                alive[first:first + size] = True
+        vector_file = self._vector_file(user_id)
+        if not vector_file.verified or vector_file.rows() < len(alive):
+            await self._rebuilds.do(user_id, lambda: self._restore_vectors(user_id, vector_file, alive))
+            start = time.perf_counter()
+        query_vector = embed_texts([query], settings.library_embedding_dim)[0]
+        hits = vector_file.search(query_vector, alive, k or settings.library_top_k)
+        search_ms = round((time.perf_counter() - start) * 1000, 2)
+        if not hits:
+            return []
+
+        rows = [row for row, _ in hits]
+        chunks = await with_deadline(
+            # Rows freed since the documents were loaded may already hold another document's chunks
+            db.library_chunks_collection.find({
+                "user_id": user_id,
+                "row": {"$in": rows},
+                "document_id": {"$in": [doc["_id"] for doc in documents]}
+            }).to_list(length=len(rows)),
+            "load library chunks"
+        )
+        logger.info(f"Retrieved {len(chunks)} library chunks for {user_id}", extra={"rows": int(alive.sum()), "search_ms": search_ms})
+
+        # Most relevant document first, chunks in reading order within it
+        rank = {row: position for position, (row, _) in enumerate(hits)}
+        by_document: Dict[Any, List[Dict[str, Any]]] = {}
+        for chunk in sorted(chunks, key=lambda chunk: rank[chunk["row"]]):
+            by_document.setdefault(chunk["document_id"], []).append(chunk)
+        return [
+            "\n\n".join(chunk["text"] for chunk in sorted(group, key=lambda chunk: chunk["row"]))
+            for group in by_document.values()
+        ]
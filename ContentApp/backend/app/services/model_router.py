@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+STATS_WINDOW_SECONDS = 60.0
+
+def is_retryable_error(error: Exception) -> bool:
+    """Errors another attempt or another backend may not hit: throttling, 5xx, network"""
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class ModelBackend:
+    """One OpenAI-compatible endpoint with rolling latency and error statistics"""
+
+    def __init__(self, name: str, client: AsyncOpenAI, model: Optional[str] = None, image_model: Optional[str] = None):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.image_model = image_model
+        self.ewma_latency: Optional[float] = None
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.selected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] <= now - STATS_WINDOW_SECONDS:
+            self._outcomes.popleft()
+
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def in_cooldown(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by the recent error rate"""
+        # Untried backends look as fast as the configured default so they get probed
+        latency = self.ewma_latency if self.ewma_latency is not None else settings.model_router_default_latency
+        return latency * (1 + 4 * self.error_rate())
+
+    def record_success(self, latency: float) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._outcomes.append((now, True))
+        alpha = settings.model_router_ewma_alpha
+        self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: Exception) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._outcomes.append((now, False))
+        self.consecutive_failures += 1
+        cooldown = retry_after_seconds(error)
+        if cooldown is None and self.consecutive_failures >= settings.model_router_failure_threshold:
+            cooldown = settings.model_router_cooldown_seconds
+        if cooldown:
+            self.cooldown_until = max(self.cooldown_until, now + cooldown)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "in_cooldown": self.in_cooldown(),
+            "selected": self.selected
+        }
+
+class ModelRouter:
+    """Sends each call to the healthiest, fastest backend and fails over on retryable errors"""
+
+    def __init__(self, backends: List[ModelBackend]):
+        if not backends:
+            raise ValueError("At least one model backend is required")
+        self.backends = backends
+        self.failovers = 0
+
+    @property
+    def primary(self) -> ModelBackend:
+        return self.backends[0]
+
+    def ranked(self) -> List[ModelBackend]:
+        # Backends in cooldown are still tried last rather than failing outright
+        return sorted(self.backends, key=lambda backend: (backend.in_cooldown(), backend.score()))
+
+    async def call(self, operation: str, fn: Callable[[ModelBackend], Awaitable[Any]]) -> Any:
+        candidates = self.ranked()
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(candidates):
+            backend.selected += 1
+            logger.info(
+                f"Routing {operation} to backend {backend.name}",
+                extra={"operation": operation, "backend": backend.name, "attempt": attempt, "score": round(backend.score(), 4)}
+            )
+            start = time.monotonic()
+            try:
+                result = await fn(backend)
+                backend.record_success(time.monotonic() - start)
+                return result
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                backend.record_failure(e)
+                last_error = e
+                if attempt + 1 < len(candidates):
+                    self.failovers += 1
+                    logger.warning(
+                        f"Backend {backend.name} failed for {operation}, failing over",
+                        extra={"operation": operation, "backend": backend.name, "error": str(e)}
+                    )
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "failovers": self.failovers,
+            "backends": [backend.stats() for backend in self.backends]
+        }
+
+def build_backends() -> List[ModelBackend]:
+    """Backends from MODEL_BACKENDS (a JSON list), or the single configured OpenAI endpoint"""
+    configs = json.loads(settings.model_backends) if settings.model_backends else []
+    if not configs:
+        configs = [{"name": "openai", "base_url": settings.openai_base_url, "api_key": settings.openai_api_key}]
+
+    backends = []
+    for i, config in enumerate(configs):
+        client = AsyncOpenAI(
+            api_key=config.get("api_key") or settings.openai_api_key,
+            base_url=config.get("base_url") or None,
+            max_retries=0  # Retries are handled by ModelService so they respect the request deadline
+        )
+        backends.append(ModelBackend(
+            name=config.get("name") or f"backend-{i}",
+            client=client,
+            model=config.get("model"),
+            image_model=config.get("image_model")
+        ))
+    return backends
@@ -1,21 +1,52 @@
-from openai import AsyncOpenAI  # Change to AsyncOpenAI
 import logging
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from ..config import settings
 from ..utils.error_handlers import APIError
-from ..utils.model_utils import get_text_generation_params, get_image_generation_params
+from ..utils.model_utils import get_text_generation_params, get_image_generation_params, estimate_tokens
+from ..utils.token_scheduler import Ticket, TokenBudgetScheduler
+from ..utils.resilience import ResilientCaller
+from ..utils.deadline import check_deadline, current_deadline, remaining
+from ..utils.circuit_breaker import CircuitBreaker, LoadShedder
+from .model_router import ModelRouter, ModelBackend, build_backends, is_retryable_error, retry_after_seconds
 
 logger = logging.getLogger(__name__)
 
 class ModelService:
     def __init__(self):
         self.client = None
+        self.router: ModelRouter = None
+        # Every worker process runs its own scheduler, so each gets an equal share of the account limits
+        workers = max(1, settings.server_workers)
+        self.scheduler = TokenBudgetScheduler(
+            tokens_per_minute=max(1, settings.openai_tokens_per_minute // workers),
+            requests_per_minute=max(1, settings.openai_requests_per_minute // workers),
+            default_weight=settings.scheduler_default_weight,
+            user_weights={"anonymous": settings.scheduler_anonymous_weight}
+        )
+        self.resilience = ResilientCaller(settings.model_call_policies, is_retryable_error, retry_after_seconds)
+        self.breakers = {
+            kind: CircuitBreaker(
+                name=kind,
+                is_failure=self._is_upstream_failure,
+                window_seconds=settings.circuit_breaker_window_seconds,
+                min_calls=settings.circuit_breaker_min_calls,
+                failure_rate_threshold=settings.circuit_breaker_failure_rate,
+                slow_call_seconds=slow_call_seconds,
+                slow_call_rate_threshold=settings.circuit_breaker_slow_call_rate,
+                open_seconds=settings.circuit_breaker_open_seconds,
+                half_open_max_calls=settings.circuit_breaker_half_open_calls
+            )
+            for kind, slow_call_seconds in settings.circuit_breaker_slow_call_seconds.items()
+        }
+        self.shedder = LoadShedder(settings.max_concurrent_generations)
         self._initialize_model()
     
     def _initialize_model(self):
         try:
-            logger.info("Initializing AsyncOpenAI client")
-            self.client = AsyncOpenAI(api_key=settings.openai_api_key)  # Use AsyncOpenAI
-            logger.info("AsyncOpenAI client initialized successfully")
+            logger.info("Initializing AsyncOpenAI clients")
+            self.router = ModelRouter(build_backends())
+            self.client = self.router.primary.client
+            logger.info(f"Initialized {len(self.router.backends)} model backend(s)")
         except Exception as e:
             logger.error("Failed to initialize OpenAI client", exc_info=True)
             raise APIError(
@@ -32,14 +63,136 @@ class ModelService:
             )
         return self.client
 
-    async def generate_text(self, prompt: str) -> str:
+    @staticmethod
+    def _is_upstream_failure(e: BaseException) -> bool:
+        # Client errors (bad request, content policy) say nothing about provider health, and neither
+        # does a timeout where the caller's own (possibly client-shortened) request budget ran out first
+        if isinstance(e, APIError):
+            return e.status_code == 504 and e.details.get("reason") == "policy_deadline"
+        return is_retryable_error(e)
+
+    def _release(self, ticket: Ticket, actual_tokens: Optional[int], upstream_calls: int, prompt_tokens: int) -> None:
+        # Every retry, hedge and failover reached the provider too: charge each a request and its prompt
+        extra = max(0, upstream_calls - 1)
+        self.scheduler.release(ticket, actual_tokens, extra_requests=extra, extra_tokens=extra * prompt_tokens)
+
+    @staticmethod
+    def _backend_params(params: Dict[str, Any], backend: ModelBackend, image: bool = False, explicit_model: bool = False) -> Dict[str, Any]:
+        # A model the caller asked for wins over the backend's default
+        model = None if explicit_model else backend.image_model if image else backend.model
+        return {**params, "model": model} if model else params
+
+    async def create_chat_completion(self, messages: List[Dict[str, str]], user_id: str = "anonymous", **overrides: Any):
         params = get_text_generation_params()
-        params["messages"] = [{"role": "user", "content": prompt}]
-        
-        response = await self.client.chat.completions.create(**params)
+        params.update(overrides)
+        params["messages"] = messages
+        upstream_calls = 0
+
+        async def attempt(timeout: float):
+            async def call(backend: ModelBackend):
+                nonlocal upstream_calls
+                upstream_calls += 1
+                return await backend.client.chat.completions.create(**self._backend_params(params, backend), timeout=timeout)
+            return await self.router.call("chat", call)
+
+        breaker = self.breakers["text"]
+        with self.shedder.slot():
+            check_deadline("model call")
+            breaker.check()
+            ticket = await self.scheduler.acquire(
+                user_id,
+                estimate_tokens(messages, params["max_tokens"], params.get("n", 1)),
+                remaining(settings.scheduler_max_wait_seconds)
+            )
+
+            actual_tokens = None
+            try:
+                async with breaker.guard():
+                    response = await self.resilience.call("chat", attempt, deadline=current_deadline())
+                if getattr(response, "usage", None):
+                    actual_tokens = response.usage.total_tokens
+                return response
+            finally:
+                self._release(ticket, actual_tokens, upstream_calls, estimate_tokens(messages, 0))
+
+    async def stream_chat_completion(self, messages: List[Dict[str, str]], user_id: str = "anonymous", **overrides: Any) -> AsyncIterator[str]:
+        """Yield content deltas of a chat completion as they arrive"""
+        params = get_text_generation_params()
+        params.update(overrides)
+        params["messages"] = messages
+        params["stream"] = True
+        upstream_calls = 0
+
+        async def attempt(timeout: float):
+            async def call(backend: ModelBackend):
+                nonlocal upstream_calls
+                upstream_calls += 1
+                # Failover only applies until the first token; deltas already sent cannot be replayed
+                stream = await backend.client.chat.completions.create(**self._backend_params(params, backend), timeout=timeout)
+                return await self._await_first_delta(stream)
+            return await self.router.call("chat_stream", call)
+
+        async def discard(opened: Tuple[Any, Any, Optional[str]]):
+            await opened[0].close()
+
+        breaker = self.breakers["text"]
+        with self.shedder.slot():
+            check_deadline("model call")
+            breaker.check()
+            ticket = await self.scheduler.acquire(
+                user_id,
+                estimate_tokens(messages, params["max_tokens"]),
+                remaining(settings.scheduler_max_wait_seconds)
+            )
+
+            # Streamed responses carry no usage block, so approximate it from the output
+            output_chars = 0
+            try:
+                # The breaker judges the provider on time-to-first-token
+                async with breaker.guard():
+                    stream, chunks, first_delta = await self.resilience.call("chat_stream", attempt, discard=discard, deadline=current_deadline())
+                try:
+                    if first_delta:
+                        output_chars += len(first_delta)
+                        yield first_delta
+                    async for chunk in chunks:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            output_chars += len(delta)
+                            yield delta
+                finally:
+                    # Release the upstream connection if the consumer stops early
+                    await stream.close()
+            finally:
+                prompt_tokens = estimate_tokens(messages, 0)
+                self._release(ticket, prompt_tokens + output_chars // 4, upstream_calls, prompt_tokens)
+
+    @staticmethod
+    async def _await_first_delta(stream) -> Tuple[Any, Any, Optional[str]]:
+        """Read a stream up to its first content delta so hedging can key on time-to-first-token"""
+        chunks = stream.__aiter__()
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    return stream, chunks, chunk.choices[0].delta.content
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, chunks, None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuits": {kind: breaker.stats() for kind, breaker in self.breakers.items()},
+            "load": self.shedder.stats()
+        }
+
+    async def generate_text(self, prompt: str) -> str:
+        response = await self.create_chat_completion([{"role": "user", "content": prompt}])
         return response.choices[0].message.content
 
-    async def generate_image(self, prompt: str, model: str = None) -> str:
+    async def generate_image(self, prompt: str, model: str = None, user_id: str = "anonymous") -> str:
         # Get standardized parameters and add prompt
         params = get_image_generation_params()
         params["prompt"] = prompt
@@ -47,7 +200,24 @@ class ModelService:
         # Override model if explicitly passed
         if model:
             params["model"] = model
-        
+        upstream_calls = 0
+
+        async def attempt(timeout: float):
+            async def call(backend: ModelBackend):
+                nonlocal upstream_calls
+                upstream_calls += 1
+                return await backend.client.images.generate(**self._backend_params(params, backend, image=True, explicit_model=bool(model)), timeout=timeout)
+            return await self.router.call("image", call)
+
         # Call the API with the correct parameters
-        response = await self.client.images.generate(**params)
+        with self.shedder.slot():
+            check_deadline("model call")
+            self.breakers["image"].check()
+            # Image calls use no text tokens but count against the requests-per-minute budget
+            ticket = await self.scheduler.acquire(user_id, 0, remaining(settings.scheduler_max_wait_seconds))
+            try:
+                async with self.breakers["image"].guard():
+                    response = await self.resilience.call("image", attempt, deadline=current_deadline())
+            finally:
+                self._release(ticket, 0, upstream_calls, 0)
         return response.data[0].url
@@ -1,40 +1,211 @@
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import AsyncIterator, Dict, Any, List, Optional
 from bson import ObjectId
+from pydantic import ValidationError
 from ..database import db
 from ..models import StoredPost
-from ..utils.pagination import paginate_query
+from ..utils.error_handlers import APIError
+from ..utils.pagination import KEYSET_SORT, paginate_query, paginate_keyset
+from ..utils.deadline import with_deadline
+from .search_service import search_service
+from .post_write_buffer import post_write_buffer
+from .history_cache import history_cache
+from .post_version_service import PostVersionService
+from .prompt_service import prompt_service
+from ..utils.etag import make_etag
 
 class PostService:
+    @staticmethod
+    def _validate(post_data: Dict[str, Any]) -> None:
+        """Reject a post before it is stored or buffered, rather than after it was acknowledged"""
+        try:
+            StoredPost(**post_data)
+        except ValidationError as e:
+            raise APIError(
+                message="Invalid post",
+                status_code=400,
+                details={"errors": [{"field": ".".join(map(str, error["loc"])), "message": error["msg"]} for error in e.errors()]},
+                log_level="warning"
+            )
+
     @staticmethod
     async def create_post(post_data: Dict[str, Any], user_id: str) -> StoredPost:
         post_data["user_id"] = user_id
         post_data["created_at"] = datetime.utcnow()
-        result = await db.posts_collection.insert_one(post_data)
+        PostService._validate(post_data)
+        prompt_service.link_posts([post_data])
+        document = dict(post_data)
+        if post_write_buffer.running:
+            # Prompt use is recorded when the buffer flushes
+            stored = (await post_write_buffer.submit([document]))[0]
+            return StoredPost(**{**post_data, "_id": stored["_id"]})
+        result = await with_deadline(db.posts_collection.insert_one(document), "save post")
         post_data["_id"] = str(result.inserted_id)
+        prompt_service.record_later([document])
+        await search_service.posts_added(user_id, [post_data])
         return StoredPost(**post_data)
 
     @staticmethod
-    async def get_user_posts(user_id: str, limit: int = 10, skip: int = 0, search: str = None):
-        query = {"user_id": user_id}
+    async def create_posts(posts_data: List[Dict[str, Any]], user_id: str) -> List[StoredPost]:
+        if not posts_data:
+            return []
+
+        created_at = datetime.utcnow()
+        for post_data in posts_data:
+            post_data["user_id"] = user_id
+            post_data["created_at"] = created_at
+            PostService._validate(post_data)
+        prompt_service.link_posts(posts_data)
+        documents = [dict(post_data) for post_data in posts_data]
+        if post_write_buffer.running:
+            stored = await post_write_buffer.submit(documents)
+            return [StoredPost(**{**post_data, "_id": post["_id"]}) for post_data, post in zip(posts_data, stored)]
+        result = await with_deadline(db.posts_collection.insert_many(documents), "save posts")
+        for post_data, inserted_id in zip(posts_data, result.inserted_ids):
+            post_data["_id"] = str(inserted_id)
+        prompt_service.record_later(documents)
+        await search_service.posts_added(user_id, posts_data)
+        return [StoredPost(**post_data) for post_data in posts_data]
+
+    @staticmethod
+    async def get_user_posts(user_id: str, limit: int = 10, skip: int = 0, search: str = None, cursor: Optional[str] = None, include_total: bool = False):
+        # Posts still in the write-behind buffer are shown on the first page so users see their own writes
+        first_page = (not cursor) and skip == 0
+        pending = post_write_buffer.pending_for(user_id) if first_page else []
+
+        async def load(version: Optional[int]) -> Dict[str, Any]:
+            if search:
+                # Results are ranked by relevance, so search pages by offset rather than cursor
+                return await search_service.search(user_id, search, limit, skip)
+
+            query = {"user_id": user_id}
+            if cursor is not None:
+                # A versioned key keeps the cached total exact
+                count_key = f"{user_id}:{version}" if version is not None else user_id
+                return await paginate_keyset(
+                    collection=db.posts_collection,
+                    query=query,
+                    limit=limit,
+                    cursor=cursor,
+                    count_key=count_key if include_total else None
+                )
+
+            return await paginate_query(
+                collection=db.posts_collection,
+                query=query,
+                limit=limit,
+                skip=skip,
+                sort=KEYSET_SORT
+            )
+
+        result = await history_cache.get_or_load(
+            user_id,
+            {"limit": limit, "skip": skip, "search": search, "cursor": cursor, "include_total": include_total},
+            load
+        )
         if search:
-            query["$or"] = [
-                {"objective": {"$regex": search, "$options": "i"}},
-                {"generated_content": {"$regex": search, "$options": "i"}}
-            ]
-        
-        return await paginate_query(
-            collection=db.posts_collection,
-            query=query,
-            limit=limit,
-            skip=skip,
-            sort=[("created_at", -1)]
+            pending = search_service.match_posts(pending, search)
+        result = PostService._with_pending(result, pending, limit)
+        await prompt_service.attach_context(result["posts"])
+        return result
+
+    @staticmethod
+    async def iter_posts(
+        user_id: str,
+        template: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """All of a user's posts, oldest first, streamed from a cursor one batch at a time"""
+        query: Dict[str, Any] = {"user_id": user_id}
+        if template:
+            query["template"] = template
+        if since or until:
+            query["created_at"] = {}
+            if since:
+                query["created_at"]["$gte"] = since
+            if until:
+                query["created_at"]["$lt"] = until
+
+        cursor = db.posts_collection.find(query).sort([("created_at", 1), ("_id", 1)]).batch_size(batch_size)
+        batch: List[Dict[str, Any]] = []
+        async for post in cursor:
+            batch.append(post)
+            if len(batch) >= batch_size:
+                # One prompt lookup per batch fills in the contexts
+                for linked in await prompt_service.attach_context(batch):
+                    yield linked
+                batch = []
+
+        # Buffered posts are the newest, so they go last
+        for post in reversed(post_write_buffer.pending_for(user_id)):
+            if template and post.get("template") != template:
+                continue
+            if (since and post["created_at"] < since) or (until and post["created_at"] >= until):
+                continue
+            batch.append(post)
+        for linked in await prompt_service.attach_context(batch):
+            yield linked
+
+    @staticmethod
+    async def history_etag(user_id: str, limit: int = 10, skip: int = 0, search: str = None, cursor: Optional[str] = None, include_total: bool = False) -> Optional[str]:
+        """ETag of a history page, computed from the post version alone"""
+        try:
+            version = await PostVersionService.get_version(user_id)
+        except Exception:
+            return None
+        pending = post_write_buffer.pending_for(user_id) if (not cursor) and skip == 0 else []
+        return make_etag(
+            "history", user_id, version, limit, skip, search, cursor, include_total,
+            [post["_id"] for post in pending]
         )
 
+    @staticmethod
+    async def post_etag(post_id: str, user_id: str) -> Optional[str]:
+        try:
+            version = await PostVersionService.get_version(user_id)
+        except Exception:
+            return None
+        return make_etag("post", user_id, version, post_id, post_write_buffer.is_pending(user_id, post_id))
+
+    @staticmethod
+    async def get_post(post_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        post = next((post for post in post_write_buffer.pending_for(user_id) if post["_id"] == post_id), None)
+        if post is None:
+            if not ObjectId.is_valid(post_id):
+                return None
+            post = await with_deadline(db.posts_collection.find_one({
+                "_id": ObjectId(post_id),
+                "user_id": user_id
+            }), "find post")
+            if post is None:
+                return None
+            post["_id"] = str(post["_id"])
+        await prompt_service.attach_context([post])
+        return post
+
+    @staticmethod
+    def _with_pending(result: Dict[str, Any], pending: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+        if not pending:
+            return result
+        flushed_ids = {post["_id"] for post in result["posts"]}
+        pending = [post for post in pending if post["_id"] not in flushed_ids]
+        result["posts"] = pending + result["posts"]
+        if "total" in result:
+            result["total"] += len(pending)
+        if "totalPages" in result:
+            result["totalPages"] = max(1, (result["total"] + limit - 1) // limit)
+        return result
+
     @staticmethod
     async def delete_post(post_id: str, user_id: str) -> bool:
-        result = await db.posts_collection.delete_one({
+        if post_write_buffer.discard(user_id, post_id):
+            return True
+        result = await with_deadline(db.posts_collection.delete_one({
             "_id": ObjectId(post_id),
             "user_id": user_id
-        })
+        }), "delete post")
+        if result.deleted_count:
+            await search_service.post_deleted(user_id, post_id)
         return result.deleted_count > 0
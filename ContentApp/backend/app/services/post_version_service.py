@@ -0,0 +1,35 @@
+import logging
+from typing import Optional
+from pymongo import ReturnDocument
+from ..database import db
+from ..utils.deadline import with_deadline
+
+logger = logging.getLogger(__name__)
+
+class PostVersionService:
+    """Per-user counter bumped on every change to a user's posts.
+
+    Caches derived from a user's posts (search indexes, history pages, ETags)
+    are keyed on this version, so a bump from any worker invalidates them all.
+    """
+
+    @staticmethod
+    async def get_version(user_id: str) -> int:
+        doc = await with_deadline(db.post_versions_collection.find_one({"_id": user_id}), "read post version")
+        return doc["version"] if doc else 0
+
+    @staticmethod
+    async def bump_version(user_id: str) -> Optional[int]:
+        if db.post_versions_collection is None:
+            return None
+        try:
+            doc = await db.post_versions_collection.find_one_and_update(
+                {"_id": user_id},
+                {"$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return doc["version"]
+        except Exception as e:
+            logger.warning(f"Failed to bump post version for {user_id}: {str(e)}")
+            return None
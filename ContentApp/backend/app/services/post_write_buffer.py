@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError, ExecutionTimeout, PyMongoError, WriteConcernError
+from ..config import settings
+from ..database import db
+from ..utils.deadline import with_deadline
+from ..utils.error_handlers import APIError
+from .prompt_service import prompt_service
+from .search_service import search_service
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+# Worth retrying: the database is unreachable or slow, not the posts wrong.
+# AutoReconnect covers NetworkTimeout, NotPrimaryError and ServerSelectionTimeoutError.
+TRANSIENT_ERRORS = (AutoReconnect, ExecutionTimeout, WriteConcernError)
+
+def _is_transient(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS) or (
+        isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+    )
+
+class PostWriteBuffer:
+    """Write-behind buffer that persists posts with batched insert_many.
+
+    Posts get their _id up front so callers can respond before the write lands.
+    Until a post is flushed it is kept in a per-user pending map that history
+    reads merge in. That map is per process: with several server workers, a
+    read served by another worker only sees the post once its batch is
+    written (within post_write_flush_seconds). Callers that need their
+    write visible everywhere submit with wait=True (or set
+    post_write_wait_for_flush), which still batches the insert but only
+    returns once it has landed.
+    A batch that fails because the database is unavailable is retried until
+    it lands, and meanwhile the bounded queue makes new writers wait. Posts
+    the database rejects outright are split off and logged, so they cannot
+    hold up the rest of the batch.
+    """
+
+    def __init__(self, max_batch: int = None, flush_interval: float = None, max_pending: int = None):
+        self.max_batch = max_batch or settings.post_write_batch_size
+        self.flush_interval = flush_interval or settings.post_write_flush_seconds
+        self.max_pending = max_pending or settings.post_write_max_pending
+        self.queue: Optional[asyncio.Queue] = None
+        self.flusher: Optional[asyncio.Task] = None
+        self._draining: Optional[asyncio.Event] = None
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._deleted: Set[str] = set()
+        # Callers waiting for their posts to be written, by post id
+        self._written: Dict[str, asyncio.Future] = {}
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.rejected = 0
+        self.failing = False
+
+    @property
+    def running(self) -> bool:
+        return self.flusher is not None and not self.flusher.done()
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self._draining = asyncio.Event()
+        self.flusher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered, then stop the flusher"""
+        if not self.running:
+            return
+        # Flush partial batches right away instead of waiting out the interval
+        self._draining.set()
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=settings.post_write_drain_seconds)
+        except asyncio.TimeoutError:
+            unwritten = sum(len(posts) for posts in self._pending.values())
+            logger.error(f"Stopping post write buffer with {unwritten} posts not yet written")
+        self.flusher.cancel()
+        await asyncio.gather(self.flusher, return_exceptions=True)
+        self.flusher = None
+        logger.info(f"Post write buffer drained after {self.flushed} posts in {self.batches} batches")
+
+    async def submit(self, posts: List[Dict[str, Any]], wait: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Queue posts for insertion and return them as stored, waiting if the buffer is full.
+
+        With wait, return only once the posts are in the database, so every worker sees them.
+        """
+        wait = settings.post_write_wait_for_flush if wait is None else wait
+        loop = asyncio.get_running_loop()
+        stored = []
+        written = []
+        for post in posts:
+            post.setdefault("_id", ObjectId())
+            post_id = str(post["_id"])
+            self._pending[post["user_id"]][post_id] = post
+            if wait:
+                # Registered before queueing so a fast flush cannot miss it
+                written.append(self._written.setdefault(post_id, loop.create_future()))
+            try:
+                # A full queue is backpressure: callers wait for the flusher to catch up
+                await with_deadline(self.queue.put(post), "buffer post")
+            except BaseException:
+                self._pending[post["user_id"]].pop(post_id, None)
+                self._written.pop(post_id, None)
+                raise
+            stored.append({**post, "_id": post_id})
+        if written:
+            results = await with_deadline(asyncio.gather(*written), "write post")
+            if not all(results):
+                raise APIError(message="Post could not be saved", status_code=500)
+        return stored
+
+    def _resolve(self, posts: List[Dict[str, Any]], written: Set[str]) -> None:
+        for post in posts:
+            post_id = str(post["_id"])
+            future = self._written.pop(post_id, None)
+            if future is not None and not future.done():
+                future.set_result(post_id in written)
+
+    def pending_for(self, user_id: str) -> List[Dict[str, Any]]:
+        """Unflushed posts of a user, newest first"""
+        posts = self._pending.get(user_id)
+        if not posts:
+            return []
+        return [
+            {**post, "_id": post_id}
+            for post_id, post in sorted(posts.items(), key=lambda item: item[1]["created_at"], reverse=True)
+        ]
+
+    def is_pending(self, user_id: str, post_id: str) -> bool:
+        return post_id in self._pending.get(user_id, {})
+
+    def discard(self, user_id: str, post_id: str) -> bool:
+        """Delete a post that has not been flushed yet"""
+        post = self._pending.get(user_id, {}).pop(post_id, None)
+        if post is None:
+            return False
+        self._deleted.add(post_id)
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            flush_at = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch and not self._draining.is_set():
+                timeout = flush_at - loop.time()
+                if timeout <= 0:
+                    break
+                getter = asyncio.ensure_future(self.queue.get())
+                drained = asyncio.ensure_future(self._draining.wait())
+                await asyncio.wait({getter, drained}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                drained.cancel()
+                if not getter.done():
+                    getter.cancel()
+                    # The item may have arrived just as the wait gave up
+                    await asyncio.gather(getter, return_exceptions=True)
+                if getter.done() and not getter.cancelled():
+                    batch.append(getter.result())
+                else:
+                    break
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Post flush failed: {str(e)}", exc_info=True)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        # Posts deleted while still buffered are never written
+        skipped = {str(post["_id"]) for post in batch} & self._deleted
+        self._deleted -= skipped
+        self._resolve([post for post in batch if str(post["_id"]) in skipped], skipped)
+        posts = [post for post in batch if str(post["_id"]) not in skipped]
+        if not posts:
+            return
+
+        # Counted once per batch, before the retries; posts of a prompt that could not be recorded keep their context
+        written = {str(document["_id"]) for document in await self._insert(await prompt_service.record_posts(posts))}
+        for post in posts:
+            self._pending.get(post["user_id"], {}).pop(str(post["_id"]), None)
+        for user_id in {post["user_id"] for post in posts}:
+            if not self._pending.get(user_id):
+                self._pending.pop(user_id, None)
+        self._resolve(posts, written)
+        posts = [post for post in posts if str(post["_id"]) in written]
+        if not posts:
+            return
+
+        self.flushed += len(posts)
+        self.batches += 1
+        by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for post in posts:
+            by_user[post["user_id"]].append({**post, "_id": str(post["_id"])})
+        for user_id, user_posts in by_user.items():
+            await search_service.posts_added(user_id, user_posts)
+
+        # Deleted while the batch was in flight: remove what was just written
+        for post in posts:
+            post_id = str(post["_id"])
+            if post_id in self._deleted:
+                self._deleted.discard(post_id)
+                await db.posts_collection.delete_one({"_id": post["_id"], "user_id": post["user_id"]})
+                await search_service.post_deleted(post["user_id"], post_id)
+
+    def _reject(self, posts: List[Dict[str, Any]], error: Exception) -> None:
+        self.rejected += len(posts)
+        logger.error(
+            f"Dropping {len(posts)} posts the database rejected: {str(error)}",
+            extra={"post_ids": [str(post["_id"]) for post in posts], "user_ids": sorted({post["user_id"] for post in posts})}
+        )
+
+    async def _insert(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write the batch, retrying transient failures until it lands; returns the posts written"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await db.posts_collection.insert_many(posts, ordered=False)
+                self.failing = False
+                return posts
+            except BulkWriteError as e:
+                # An earlier attempt may have landed before failing; _ids are fixed, so duplicates mean written
+                rejected = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY
+                }
+                if rejected:
+                    self._reject([posts[index] for index in sorted(rejected)], e)
+                    posts = [post for index, post in enumerate(posts) if index not in rejected]
+                if not e.details.get("writeConcernErrors") or not posts:
+                    self.failing = False
+                    return posts
+                error = e
+            except Exception as e:
+                if not _is_transient(e):
+                    # Encoding and size errors fail the whole call: halve the batch until the bad post is alone
+                    if len(posts) == 1:
+                        self._reject(posts, e)
+                        return []
+                    middle = len(posts) // 2
+                    return await self._insert(posts[:middle]) + await self._insert(posts[middle:])
+                error = e
+            self.failing = True
+            self.retries += 1
+            # Stays at warning for blips, escalates once the database has been gone for a while
+            log = logger.error if attempt % 10 == 0 else logger.warning
+            log(f"Post batch write failed (attempt {attempt}), retrying {len(posts)} posts: {str(error)}")
+            await asyncio.sleep(min(0.1 * 2 ** attempt, settings.post_write_retry_max_delay))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "pending_users": len(self._pending),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "failing": self.failing
+        }
+
+post_write_buffer = PostWriteBuffer()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from pymongo import ReturnDocument
+from ..config import settings
+from ..database import db
+from ..utils.cache import LRUCache
+from ..utils.deadline import with_deadline
+from ..utils.singleflight import SingleFlight
+from .cache_service import make_generation_key
+
+logger = logging.getLogger(__name__)
+
+ALL_TEMPLATES = "*"
+
+def prompt_key(user_id: str, template: str, objective: str, context: str) -> str:
+    """Stable id of a user's prompt; whitespace and case differences map to the same prompt"""
+    return make_generation_key("prompt", template, objective, context, params={"user_id": user_id})
+
+class PromptService:
+    """Deduplicated prompts with use counts, shared by every post a user made from them.
+
+    Each post links to its prompt by an id derived from the prompt text, so
+    saving a post needs no lookup; use counts are recorded when the post is
+    written, off the request path. The prompt's context is stored once and
+    dropped from the post when it matches exactly, then filled back in on
+    reads. Prompts belong to the user who wrote them, so a user's popular
+    prompts are served from a small top-K list per (user, template) that is
+    refreshed from the (user_id, template, use_count) index every few seconds.
+    """
+
+    def __init__(self, top_k: int = None, popular_ttl_seconds: float = None):
+        self.top_k = top_k or settings.popular_prompts_top_k
+        self._popular = LRUCache(
+            max_entries=settings.prompt_cache_max_entries,
+            ttl_seconds=popular_ttl_seconds or settings.popular_prompts_cache_seconds
+        )
+        self._refreshes = SingleFlight()
+        # Prompt text never changes once inserted, so lookups can be cached for long
+        self._prompts = LRUCache(max_entries=settings.prompt_cache_max_entries, ttl_seconds=3600)
+        self._tasks: Set[asyncio.Task] = set()
+        self.recorded = 0
+        self.errors = 0
+
+    async def record_use(self, user_id: str, template: str, objective: str, context: str, count: int = 1) -> Optional[Dict[str, Any]]:
+        """Upsert the prompt and bump its use count; None when the prompts collection is unavailable"""
+        if db.prompts_collection is None:
+            return None
+        prompt_id = prompt_key(user_id, template, objective, context)
+        try:
+            prompt = await db.prompts_collection.find_one_and_update(
+                {"_id": prompt_id},
+                {
+                    "$inc": {"use_count": count},
+                    "$set": {"last_used_at": datetime.utcnow()},
+                    "$setOnInsert": {
+                        "user_id": user_id,
+                        "template": template,
+                        "objective": objective,
+                        "context": context,
+                        "created_at": datetime.utcnow()
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Failed to record prompt use: {str(e)}")
+            return None
+        self.recorded += count
+        self._prompts.set(prompt_id, prompt)
+        return prompt
+
+    @staticmethod
+    def _prompt_of(post: Dict[str, Any]) -> Optional[Tuple[str, str, str, str]]:
+        if post.get("user_id") and post.get("template") and post.get("objective") and post.get("context"):
+            return post["user_id"], post["template"], post["objective"], post["context"]
+        return None
+
+    def link_posts(self, posts: List[Dict[str, Any]]) -> None:
+        """Set the prompt id of posts; it is a hash of the prompt, so nothing is read or written"""
+        for post in posts:
+            prompt = self._prompt_of(post)
+            if prompt is not None:
+                post["prompt_id"] = prompt_key(*prompt)
+
+    async def record_posts(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bump the use counts of the posts' prompts; returns the documents to store, with the context moved onto the prompt"""
+        counts = Counter(prompt for prompt in map(self._prompt_of, posts) if prompt is not None)
+        prompts = {}
+        # A batch usually shares one prompt, so this is one upsert per distinct prompt
+        for (user_id, template, objective, context), count in counts.items():
+            prompts[(user_id, template, objective, context)] = await self.record_use(user_id, template, objective, context, count)
+
+        documents = []
+        for post in posts:
+            document = dict(post)
+            prompt = prompts.get(self._prompt_of(post))
+            # Normalisation can match a prompt saved with different casing; keep the exact text then
+            if prompt is not None and prompt["context"] == post["context"]:
+                del document["context"]
+            documents.append(document)
+        return documents
+
+    def record_later(self, posts: List[Dict[str, Any]]) -> None:
+        """Record prompt use in the background for posts that were stored with their context"""
+        task = asyncio.ensure_future(self.record_posts(posts))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self) -> None:
+        """Wait for prompt uses still being recorded in the background"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def attach_context(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in the context of posts that only store their prompt id"""
+        missing = {post["prompt_id"] for post in posts if "context" not in post and post.get("prompt_id")}
+        if not missing:
+            return posts
+
+        prompts = {}
+        for prompt_id in missing:
+            prompt = self._prompts.get(prompt_id)
+            if prompt is not None:
+                prompts[prompt_id] = prompt
+        unknown = list(missing - prompts.keys())
+        if unknown and db.prompts_collection is not None:
+            try:
+                found = await with_deadline(
+                    db.prompts_collection.find({"_id": {"$in": unknown}}).to_list(length=len(unknown)),
+                    "load prompts"
+                )
+            except Exception as e:
+                # Posts are still worth showing without their context
+                self.errors += 1
+                logger.warning(f"Failed to load prompts for posts: {str(e)}")
+                found = []
+            for prompt in found:
+                self._prompts.set(prompt["_id"], prompt)
+                prompts[prompt["_id"]] = prompt
+
+        for post in posts:
+            if "context" not in post and post.get("prompt_id"):
+                prompt = prompts.get(post["prompt_id"])
+                post["context"] = prompt["context"] if prompt else ""
+        return posts
+
+    async def popular(self, user_id: str, limit: int = 5, template: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A user's most used prompts, overall or for one template"""
+        key = f"{user_id}:{template or ALL_TEMPLATES}"
+        top = self._popular.get(key)
+        if top is None:
+            top = await self._refreshes.do(key, lambda: self._load_popular(user_id, template))
+            self._popular.set(key, top)
+        return [dict(prompt) for prompt in top[:limit]]
+
+    async def _load_popular(self, user_id: str, template: Optional[str]) -> List[Dict[str, Any]]:
+        if db.prompts_collection is None:
+            return []
+        query = {"user_id": user_id, "template": template} if template else {"user_id": user_id}
+        cursor = db.prompts_collection.find(
+            query,
+            {"template": 1, "objective": 1, "context": 1, "created_at": 1, "use_count": 1}
+        ).sort([("use_count", -1), ("_id", 1)]).limit(self.top_k)
+        return await with_deadline(cursor.to_list(length=self.top_k), "load popular prompts")
+
+    def clear(self) -> None:
+        self._popular.clear()
+        self._prompts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "errors": self.errors,
+            "popular": self._popular.stats(),
+            "prompts": self._prompts.stats()
+        }
+
+prompt_service = PromptService()
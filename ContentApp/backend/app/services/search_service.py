@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from ..config import settings
+from ..database import db
+from ..utils.cache import LRUCache
+from ..utils.context_packing import tokenize
+from ..utils.deadline import with_deadline
+from ..utils.inverted_index import InvertedIndex, highlight_spans
+from ..utils.pagination import KEYSET_SORT, paginate_query
+from ..utils.singleflight import SingleFlight
+from .post_version_service import PostVersionService
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ("objective", "generated_content")
+
+class UserSearchIndex:
+    def __init__(self, version: int):
+        self.version = version
+        self.index = InvertedIndex()
+
+    def add(self, post: Dict[str, Any]) -> None:
+        self.index.add(str(post["_id"]), " ".join(post.get(field) or "" for field in SEARCH_FIELDS))
+
+class SearchService:
+    """Ranked prefix search over a user's posts from per-worker inverted indexes.
+
+    Every write to a user's posts bumps a version counter in post_versions.
+    An index built at an older version (e.g. after a write on another worker)
+    is rebuilt on the next search; writes on this worker are applied in place.
+    """
+
+    def __init__(self, max_users: int = None):
+        self._indexes = LRUCache(
+            max_entries=max_users or settings.search_index_max_users,
+            ttl_seconds=settings.search_index_ttl_seconds
+        )
+        self._builds = SingleFlight()
+        self.searches = 0
+        self.rebuilds = 0
+        self.fallbacks = 0
+
+    async def _bump_version(self, user_id: str) -> Optional[int]:
+        version = await PostVersionService.bump_version(user_id)
+        if version is None:
+            # Other workers can't see this change; drop ours so it is rebuilt
+            self._indexes.delete(user_id)
+        return version
+
+    async def posts_added(self, user_id: str, posts: List[Dict[str, Any]]) -> None:
+        version = await self._bump_version(user_id)
+        user_index = self._indexes.get(user_id)
+        if user_index is None:
+            return
+        if version is None or user_index.version != version - 1:
+            self._indexes.delete(user_id)
+            return
+        for post in posts:
+            user_index.add(post)
+        user_index.version = version
+
+    async def post_deleted(self, user_id: str, post_id: str) -> None:
+        version = await self._bump_version(user_id)
+        user_index = self._indexes.get(user_id)
+        if user_index is None:
+            return
+        if version is None or user_index.version != version - 1:
+            self._indexes.delete(user_id)
+            return
+        user_index.index.remove(post_id)
+        user_index.version = version
+
+    async def _build(self, user_id: str, version: int) -> Optional[UserSearchIndex]:
+        start = time.perf_counter()
+        cursor = db.posts_collection.find(
+            {"user_id": user_id},
+            {field: 1 for field in SEARCH_FIELDS}
+        ).limit(settings.search_max_indexed_posts + 1)
+        posts = await cursor.to_list(length=settings.search_max_indexed_posts + 1)
+        if len(posts) > settings.search_max_indexed_posts:
+            logger.info(f"History of {user_id} too large to index, using regex search")
+            return None
+
+        def build() -> UserSearchIndex:
+            user_index = UserSearchIndex(version)
+            for post in posts:
+                user_index.add(post)
+            return user_index
+
+        # Tokenizing thousands of posts is CPU work; keep it off the event loop
+        user_index = await asyncio.to_thread(build)
+        self.rebuilds += 1
+        logger.info(
+            f"Built search index for {user_id}",
+            extra={"posts": len(posts), "version": version, "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+        )
+        return user_index
+
+    async def _index_for(self, user_id: str) -> Optional[UserSearchIndex]:
+        version = await PostVersionService.get_version(user_id)
+        user_index = self._indexes.get(user_id)
+        if user_index is not None and user_index.version == version:
+            return user_index
+        user_index = await self._builds.do(f"{user_id}:{version}", lambda: self._build(user_id, version))
+        if user_index is not None:
+            self._indexes.set(user_id, user_index)
+        return user_index
+
+    async def search(self, user_id: str, query: str, limit: int, skip: int = 0) -> Dict[str, Any]:
+        self.searches += 1
+        user_index = None
+        if tokenize(query) and db.post_versions_collection is not None:
+            try:
+                user_index = await self._index_for(user_id)
+            except Exception as e:
+                logger.warning(f"Search index unavailable for {user_id}, using regex search: {str(e)}")
+        if user_index is None:
+            return await self._regex_search(user_id, query, limit, skip)
+
+        hits, total = user_index.index.search(query, limit=skip + limit)
+        page_ids = [doc_id for doc_id, _ in hits[skip:skip + limit]]
+        posts = await self._load_posts(user_id, page_ids)
+        for post in posts:
+            post["highlights"] = {field: highlight_spans(post.get(field) or "", query) for field in SEARCH_FIELDS}
+
+        return {
+            "posts": posts,
+            "total": total,
+            "page": (skip // limit) + 1,
+            "totalPages": max(1, (total + limit - 1) // limit)
+        }
+
+    def match_posts(self, posts: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+        """Rank a handful of posts that are not in the index yet (e.g. still buffered)"""
+        if not posts or not tokenize(query):
+            return []
+        scratch = UserSearchIndex(0)
+        for post in posts:
+            scratch.add(post)
+        by_id = {str(post["_id"]): post for post in posts}
+        hits, _ = scratch.index.search(query)
+        matched = []
+        for doc_id, _ in hits:
+            post = by_id[doc_id]
+            post["highlights"] = {field: highlight_spans(post.get(field) or "", query) for field in SEARCH_FIELDS}
+            matched.append(post)
+        return matched
+
+    async def _load_posts(self, user_id: str, post_ids: List[str]) -> List[Dict[str, Any]]:
+        if not post_ids:
+            return []
+        object_ids = [ObjectId(post_id) if ObjectId.is_valid(post_id) else post_id for post_id in post_ids]
+        posts = await with_deadline(
+            db.posts_collection.find({"_id": {"$in": object_ids}, "user_id": user_id}).to_list(length=len(object_ids)),
+            "load search results"
+        )
+        by_id = {str(post["_id"]): post for post in posts}
+        ordered = []
+        for post_id in post_ids:
+            post = by_id.get(post_id)
+            if post is not None:
+                post["_id"] = post_id
+                ordered.append(post)
+        return ordered
+
+    async def _regex_search(self, user_id: str, query: str, limit: int, skip: int) -> Dict[str, Any]:
+        self.fallbacks += 1
+        # User input is matched literally, never interpreted as a pattern
+        pattern = re.escape(query)
+        return await paginate_query(
+            collection=db.posts_collection,
+            query={
+                "user_id": user_id,
+                "$or": [{field: {"$regex": pattern, "$options": "i"}} for field in SEARCH_FIELDS]
+            },
+            limit=limit,
+            skip=skip,
+            sort=KEYSET_SORT
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "indexed_users": len(self._indexes),
+            "searches": self.searches,
+            "rebuilds": self.rebuilds,
+            "regex_fallbacks": self.fallbacks
+        }
+
+search_service = SearchService()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from .model_service import ModelService
+from .cache_service import GenerationCache, make_generation_key
+from ..config import settings
+from ..utils.context_packing import chunk_document
+from ..utils.error_handlers import APIError
+from ..utils.model_utils import count_tokens
+from ..utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarize the following excerpt of a document for someone writing a LinkedIn post about it. "
+    "Keep concrete facts, figures, names and claims; drop boilerplate. Answer with the summary only."
+)
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+class SummaryService:
+    """Map-reduce condensing of documents too large to pack into one prompt.
+
+    Documents are cut into large chunks that are summarized concurrently (map),
+    then groups of summaries are summarized again until each document fits its
+    share of the prompt's document budget (reduce). Summaries are cached by the
+    hash of the text they summarize, so a re-uploaded report costs nothing.
+    """
+
+    def __init__(self, model_service: ModelService, cache: Optional[GenerationCache] = None):
+        self.model_service = model_service
+        self.cache = cache or GenerationCache()
+        self.single_flight = SingleFlight()
+        self.summarized = 0
+        self.cache_hits = 0
+
+    def _document_tokens(self, text: str) -> int:
+        # Same chunking as the prompt builder, so this is usually already memoized
+        return sum(tokens for _, tokens in chunk_document(text, settings.document_chunk_tokens, settings.openai_model))
+
+    def needs_pipeline(self, document_texts: Optional[List[str]]) -> bool:
+        if not document_texts:
+            return False
+        return sum(self._document_tokens(text) for text in document_texts) > settings.summary_pipeline_min_tokens
+
+    async def condense(self, document_texts: List[str], user_id: str = "anonymous", on_progress: Optional[ProgressCallback] = None) -> List[str]:
+        """Documents as they are if they fit the prompt, otherwise each replaced by its summary"""
+        if not self.needs_pipeline(document_texts):
+            return document_texts
+
+        total_tokens = sum(self._document_tokens(text) for text in document_texts)
+        if total_tokens > settings.summary_max_input_tokens:
+            raise APIError(
+                message="Documents are too long to summarize",
+                status_code=413,
+                details={"tokens": total_tokens, "max_tokens": settings.summary_max_input_tokens},
+                log_level="warning"
+            )
+
+        semaphore = asyncio.Semaphore(settings.summary_concurrency)
+        target = max(1, settings.document_context_tokens // len(document_texts))
+        chunked = [
+            [chunk for chunk, _ in chunk_document(text, settings.summary_chunk_tokens, settings.openai_model)]
+            for text in document_texts
+        ]
+        progress = {"stage": "map", "done": 0, "total": sum(len(chunks) for chunks in chunked if len(chunks) > 1)}
+
+        async def summarize(text: str) -> str:
+            async with semaphore:
+                summary = await self._summarize(text, user_id)
+            progress["done"] += 1
+            if on_progress:
+                on_progress(dict(progress))
+            return summary
+
+        async def condense_document(text: str, chunks: List[str]) -> str:
+            if len(chunks) <= 1:
+                # Small documents are packed as they are
+                return text
+            summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+            for _ in range(settings.summary_max_reduce_levels):
+                if len(summaries) <= 1 or sum(count_tokens(s, settings.openai_model) for s in summaries) <= target:
+                    break
+                groups = self._group(summaries)
+                if len(groups) == len(summaries):
+                    break
+                progress["stage"] = "reduce"
+                progress["total"] += len(groups)
+                summaries = await asyncio.gather(*(summarize("\n\n".join(group)) for group in groups))
+            return "\n\n".join(summaries)
+
+        condensed = await asyncio.gather(*(
+            condense_document(text, chunks) for text, chunks in zip(document_texts, chunked)
+        ))
+        logger.info(
+            "Condensed documents with map-reduce summarization",
+            extra={"documents": len(document_texts), "input_tokens": total_tokens, "calls": progress["done"]}
+        )
+        return condensed
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Consecutive summaries packed into groups that fit one summarization call"""
+        groups: List[List[str]] = []
+        size = 0
+        for summary in summaries:
+            tokens = count_tokens(summary, settings.openai_model)
+            if groups and size + tokens <= settings.summary_chunk_tokens:
+                groups[-1].append(summary)
+                size += tokens
+            else:
+                groups.append([summary])
+                size = tokens
+        return groups
+
+    async def _summarize(self, text: str, user_id: str) -> str:
+        key = make_generation_key("summary", "", "", "", [text], {
+            "model": settings.openai_model,
+            "max_tokens": settings.summary_max_tokens,
+            "prompt": SUMMARY_PROMPT
+        })
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        async def produce() -> str:
+            response = await self.model_service.create_chat_completion(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": text}
+                ],
+                user_id=user_id,
+                max_tokens=settings.summary_max_tokens,
+                temperature=0.2,
+                presence_penalty=0,
+                frequency_penalty=0
+            )
+            summary = (response.choices[0].message.content or "").strip() if response.choices else ""
+            if summary:
+                self.summarized += 1
+                await self.cache.set(key, summary)
+            # An empty answer should not drop the excerpt altogether
+            return summary or text[:settings.summary_max_tokens * 4]
+
+        # The same chunk shows up concurrently when one report is attached to parallel requests
+        return await self.single_flight.do(key, produce)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"summarized": self.summarized, "cache_hits": self.cache_hits}
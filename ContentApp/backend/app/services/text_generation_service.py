@@ -1,8 +1,10 @@
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from openai.types.chat import ChatCompletion
 from .model_service import ModelService
 from ..config import settings
+from ..utils.context_packing import pack_context
+from ..utils.model_utils import count_tokens, get_context_window
 
 logger = logging.getLogger(__name__)
 
@@ -23,16 +25,36 @@ class TextGenerationService:
             "7. Format using LinkedIn-optimized structure\n"
         )
 
+    def _document_token_budget(self, base_prompt: str) -> int:
+        """Tokens left for documents once the system prompt, request and completion are reserved"""
+        model = settings.openai_model
+        reserved = (
+            count_tokens(self._create_system_prompt(), model)
+            + count_tokens(base_prompt, model)
+            + settings.max_tokens
+            + 64  # Chat framing and the document headers
+        )
+        return max(0, min(settings.document_context_tokens, get_context_window(model) - reserved))
+
     def _create_prompt(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None) -> str:
         prompt = f"Topic: {objective}\n\nContext: {context}\n\n"
+        guidelines = f"Template Guidelines: {template}\n\n"
         
         if document_texts and len(document_texts) > 0:
-            prompt += "\nAdditional Context from Documents:\n"
-            for i, text in enumerate(document_texts, 1):
-                summary = text[:1000] + "..." if len(text) > 1000 else text
-                prompt += f"Document {i}:\n{summary}\n\n"
+            packed = pack_context(
+                document_texts,
+                query=f"{objective} {context}",
+                token_budget=self._document_token_budget(prompt + guidelines),
+                chunk_tokens=settings.document_chunk_tokens,
+                model=settings.openai_model
+            )
+            if packed:
+                prompt += "\nAdditional Context from Documents:\n"
+                for doc_index, chunks in packed:
+                    excerpt = "\n...\n".join(chunks)
+                    prompt += f"Document {doc_index + 1}:\n{excerpt}\n\n"
         
-        prompt += f"Template Guidelines: {template}\n\n"
+        prompt += guidelines
         return prompt
 
     def _validate_response(self, response: ChatCompletion) -> None:
@@ -43,21 +65,19 @@ class TextGenerationService:
         if not response.choices[0].message.content:
             raise ValueError("Empty message content")
 
-    async def generate(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None) -> str:
+    def _build_messages(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self._create_system_prompt()},
+            {"role": "user", "content": self._create_prompt(
+                template, objective, context, document_texts
+            )}
+        ]
+
+    async def generate(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None, user_id: str = "anonymous") -> str:
         try:
-            client = self.model_service.get_model()
-            response = await client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {"role": "system", "content": self._create_system_prompt()},
-                    {"role": "user", "content": self._create_prompt(
-                        template, objective, context, document_texts
-                    )}
-                ],
-                max_tokens=settings.max_tokens,
-                temperature=settings.temperature,
-                presence_penalty=settings.presence_penalty,
-                frequency_penalty=settings.frequency_penalty
+            response = await self.model_service.create_chat_completion(
+                self._build_messages(template, objective, context, document_texts),
+                user_id=user_id
             )
             
             self._validate_response(response)
@@ -66,3 +86,34 @@ class TextGenerationService:
         except Exception as e:
             logger.error(f"Text generation failed: {str(e)}", exc_info=True)
             raise
+
+    async def generate_variants(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None, n: int = 1, user_id: str = "anonymous") -> List[str]:
+        """Generate n drafts from one prompt using the API's n parameter"""
+        try:
+            response = await self.model_service.create_chat_completion(
+                self._build_messages(template, objective, context, document_texts),
+                user_id=user_id,
+                n=n
+            )
+            
+            self._validate_response(response)
+            return [
+                choice.message.content.strip()
+                for choice in response.choices
+                if choice.message and choice.message.content
+            ]
+
+        except Exception as e:
+            logger.error(f"Variant generation failed: {str(e)}", exc_info=True)
+            raise
+
+    async def generate_stream(self, template: str, objective: str, context: str, document_texts: Optional[List[str]] = None, user_id: str = "anonymous") -> AsyncIterator[str]:
+        try:
+            async for delta in self.model_service.stream_chat_completion(
+                self._build_messages(template, objective, context, document_texts),
+                user_id=user_id
+            ):
+                yield delta
+        except Exception as e:
+            logger.error(f"Streaming text generation failed: {str(e)}", exc_info=True)
+            raise
@@ -0,0 +1,207 @@
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, Tuple
+from .error_handlers import APIError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Fails fast while the upstream is erroring or slow, then probes it with a few calls.
+
+    Outcomes are kept in a rolling time window. The breaker opens once the window
+    holds at least min_calls outcomes and either the failure rate or the share of
+    calls slower than slow_call_seconds crosses its threshold. After open_seconds
+    it lets half_open_max_calls probes through; they close it again only if all
+    of them succeed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        is_failure: Callable[[BaseException], bool],
+        window_seconds: float = 60.0,
+        min_calls: int = 10,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 2
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.outcomes: Deque[Tuple[float, bool, bool]] = deque()  # (timestamp, failed, slow)
+        self.half_open_in_flight = 0
+        self.half_open_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _expire(self, now: float) -> None:
+        while self.outcomes and self.outcomes[0][0] < now - self.window_seconds:
+            self.outcomes.popleft()
+
+    def _transition(self, state: str, now: float) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit '{self.name}' {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = now
+            self.times_opened += 1
+        if state != HALF_OPEN:
+            self.half_open_in_flight = 0
+            self.half_open_successes = 0
+        if state == CLOSED:
+            self.outcomes.clear()
+
+    def retry_after(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + self.open_seconds - now)
+
+    def allow(self) -> None:
+        """Reserve permission for one call or raise a 503 if the circuit is open"""
+        now = time.monotonic()
+        if self.state == OPEN and self.retry_after(now) <= 0:
+            self._transition(HALF_OPEN, now)
+
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and self.half_open_in_flight < self.half_open_max_calls:
+            self.half_open_in_flight += 1
+            return
+
+        self._reject(now)
+
+    def check(self) -> None:
+        """Raise early if the circuit is open, without reserving a call"""
+        now = time.monotonic()
+        if self.state == OPEN and self.retry_after(now) > 0:
+            self._reject(now)
+
+    def _reject(self, now: float) -> None:
+        self.rejected += 1
+        retry_after = max(1, math.ceil(self.retry_after(now)))
+        raise APIError(
+            message="AI service is temporarily unavailable, please try again shortly",
+            status_code=503,
+            details={"reason": "circuit_open", "circuit": self.name, "retry_after": retry_after},
+            log_level="warning",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def record(self, failed: bool, duration: float) -> None:
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+
+        if self.state == HALF_OPEN:
+            self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+            if failed or slow:
+                self._transition(OPEN, now)
+                return
+            self.half_open_successes += 1
+            if self.half_open_successes >= self.half_open_max_calls:
+                self._transition(CLOSED, now)
+            return
+        if self.state == OPEN:
+            # A call admitted before the circuit opened; it no longer changes anything
+            return
+
+        self.outcomes.append((now, failed, slow))
+        self._expire(now)
+        calls = len(self.outcomes)
+        if calls < self.min_calls:
+            return
+        failure_rate = sum(1 for _, f, _ in self.outcomes if f) / calls
+        slow_rate = sum(1 for _, _, s in self.outcomes if s) / calls
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            logger.warning(
+                f"Opening circuit '{self.name}'",
+                extra={"failure_rate": round(failure_rate, 3), "slow_call_rate": round(slow_rate, 3), "calls": calls}
+            )
+            self._transition(OPEN, now)
+
+    def release(self) -> None:
+        """Give back a half-open slot for a call that ended without an outcome (e.g. cancelled)"""
+        if self.state == HALF_OPEN:
+            self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+
+    @asynccontextmanager
+    async def guard(self):
+        self.allow()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record(self.is_failure(e), time.monotonic() - start)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(False, time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._expire(now)
+        calls = len(self.outcomes)
+        return {
+            "state": self.state,
+            "calls_in_window": calls,
+            "failure_rate": round(sum(1 for _, f, _ in self.outcomes if f) / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(sum(1 for _, _, s in self.outcomes if s) / calls, 3) if calls else 0.0,
+            "retry_after": round(self.retry_after(now), 1) if self.state == OPEN else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+class LoadShedder:
+    """Rejects work outright once max_in_flight operations are already running"""
+
+    def __init__(self, max_in_flight: int, retry_after: int = 5):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.shed = 0
+
+    @contextmanager
+    def slot(self):
+        if self.in_flight >= self.max_in_flight:
+            self.shed += 1
+            logger.warning(f"Shedding load with {self.in_flight} generations in flight")
+            raise APIError(
+                message="Server is busy, please try again shortly",
+                status_code=503,
+                details={"reason": "overloaded", "in_flight": self.in_flight},
+                log_level="warning",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "shed": self.shed
+        }
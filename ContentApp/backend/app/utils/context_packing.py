@@ -0,0 +1,151 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
+from .cache import LRUCache
+from .model_utils import count_tokens
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+_WORD_SPAN_RE = re.compile(_WORD_RE.pattern, re.IGNORECASE | re.ASCII)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# (text hash, chunk size, model) -> [(chunk, tokens)], so repeat documents skip chunking and token counting
+_chunk_cache = LRUCache(max_entries=256, ttl_seconds=3600)
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with we our you your they their i".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word terms with stopwords removed, used for ranking"""
+    return [term for term in _WORD_RE.findall(text.lower()) if term not in STOPWORDS]
+
+def term_spans(text: str) -> Iterator[Tuple[str, int, int]]:
+    """(term, start, end) for every word in text, offsets into the original string"""
+    for match in _WORD_SPAN_RE.finditer(text):
+        yield match.group().lower(), match.start(), match.end()
+
+def split_into_chunks(text: str, max_tokens: int = 200, model: Optional[str] = None) -> List[str]:
+    """Split text on paragraph and sentence boundaries into chunks of at most max_tokens"""
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph, model) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(s for s in _SENTENCE_RE.split(paragraph) if s.strip())
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece, model)
+        if piece_tokens > max_tokens:
+            # A single overlong sentence is hard-split on characters
+            step = max_tokens * 4
+            for start in range(0, len(piece), step):
+                chunks.append(piece[start:start + step])
+            continue
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def _chunk_key(text: str, max_tokens: int, model: Optional[str]) -> Tuple[str, int, Optional[str]]:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest(), max_tokens, model
+
+def chunk_document(text: str, max_tokens: int = 200, model: Optional[str] = None) -> List[Tuple[str, int]]:
+    """Chunks of a document with their token counts, memoized by content hash"""
+    key = _chunk_key(text, max_tokens, model)
+    chunks = _chunk_cache.get(key)
+    if chunks is None:
+        chunks = [(chunk, count_tokens(chunk, model)) for chunk in split_into_chunks(text, max_tokens, model)]
+        _chunk_cache.set(key, chunks)
+    return chunks
+
+def seed_chunks(text: str, max_tokens: int, model: Optional[str], chunks: List[Tuple[str, int]]) -> None:
+    """Reuse chunks computed elsewhere (e.g. loaded from the document cache)"""
+    _chunk_cache.set(_chunk_key(text, max_tokens, model), chunks)
+
+class BM25:
+    """Okapi BM25 scoring over a fixed set of tokenized chunks"""
+
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(terms) for terms in corpus]
+        self.lengths = [len(terms) for terms in corpus]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freq: Counter = Counter()
+        for freqs in self.term_freqs:
+            doc_freq.update(freqs.keys())
+        total = len(corpus)
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+    def score(self, query_terms: List[str], index: int) -> float:
+        freqs = self.term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+        total = 0.0
+        for term in set(query_terms):
+            tf = freqs.get(term)
+            if tf:
+                total += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return total
+
+    def scores(self, query_terms: List[str]) -> List[float]:
+        return [self.score(query_terms, i) for i in range(len(self.term_freqs))]
+
+def pack_context(
+    document_texts: List[str],
+    query: str,
+    token_budget: int,
+    chunk_tokens: int = 200,
+    model: Optional[str] = None
+) -> List[Tuple[int, List[str]]]:
+    """Select the most query-relevant chunks that fit the token budget.
+
+    Returns (document_index, chunks) pairs with chunks kept in their original
+    order so the packed excerpt still reads naturally.
+    """
+    if token_budget <= 0:
+        return []
+
+    candidates: List[Tuple[int, int, str, int]] = []  # (doc, position, text, tokens)
+    for doc_index, text in enumerate(document_texts):
+        for position, (chunk, tokens) in enumerate(chunk_document(text, chunk_tokens, model)):
+            candidates.append((doc_index, position, chunk, tokens))
+    if not candidates:
+        return []
+
+    ranker = BM25([tokenize(chunk) for _, _, chunk, _ in candidates])
+    scores = ranker.scores(tokenize(query))
+    # Highest score first; ties (including zero-relevance chunks) keep document order
+    ranked = sorted(range(len(candidates)), key=lambda i: (-scores[i], candidates[i][0], candidates[i][1]))
+
+    selected = []
+    remaining = token_budget
+    for i in ranked:
+        tokens = candidates[i][3]
+        if tokens <= remaining:
+            selected.append(i)
+            remaining -= tokens
+
+    packed: List[Tuple[int, List[str]]] = []
+    for i in sorted(selected, key=lambda i: (candidates[i][0], candidates[i][1])):
+        doc_index, _, chunk, _ = candidates[i]
+        if packed and packed[-1][0] == doc_index:
+            packed[-1][1].append(chunk)
+        else:
+            packed.append((doc_index, [chunk]))
+    return packed
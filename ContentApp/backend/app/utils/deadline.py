@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import json
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from .error_handlers import APIError
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline of the current request on the event loop clock (loop.time())
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+def current_deadline() -> Optional[float]:
+    return _request_deadline.get()
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the request deadline, or default when no deadline is set"""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - asyncio.get_running_loop().time()
+    return left if default is None else min(left, default)
+
+def check_deadline(operation: str = "request") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise APIError(message="Request deadline exceeded", status_code=504, details={"operation": operation}, log_level="warning")
+
+async def with_deadline(coroutine: Awaitable[Any], operation: str) -> Any:
+    """Await coroutine using the remaining request time as its timeout"""
+    left = remaining()
+    if left is None:
+        return await coroutine
+    if left <= 0:
+        if asyncio.iscoroutine(coroutine):
+            coroutine.close()
+        check_deadline(operation)
+    try:
+        return await asyncio.wait_for(coroutine, timeout=left)
+    except asyncio.TimeoutError:
+        raise APIError(message="Request deadline exceeded", status_code=504, details={"operation": operation}, log_level="warning")
+
+def max_time_ms() -> Optional[int]:
+    """Remaining request time as a MongoDB maxTimeMS value"""
+    left = remaining()
+    return None if left is None else max(1, int(left * 1000))
+
+class RequestDeadlineMiddleware:
+    """Sets a per-request deadline and cancels the handler when it passes or the client disconnects.
+
+    The deadline is the configured timeout, optionally shortened by an
+    X-Request-Timeout header, and is visible to downstream code through
+    current_deadline()/remaining().
+    """
+
+    def __init__(self, app, timeout_seconds: float, grace_seconds: float = 1.0, path_timeouts: Optional[Dict[str, float]] = None, min_timeout_seconds: float = 1.0):
+        self.app = app
+        self.timeout_seconds = timeout_seconds
+        # X-Request-Timeout comes from the client; tiny budgets only produce noise timeouts downstream
+        self.min_timeout_seconds = min_timeout_seconds
+        # Longer limits for specific paths, e.g. streaming exports
+        self.path_timeouts = path_timeouts or {}
+        # Lets handlers turn their own deadline errors into a response before the hard cancel
+        self.grace_seconds = grace_seconds
+
+    @staticmethod
+    def _has_body(scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"transfer-encoding" or (name == b"content-length" and value.strip() != b"0"):
+                return True
+        return False
+
+    def _timeout(self, scope) -> float:
+        limit = self.path_timeouts.get(scope.get("path"), self.timeout_seconds)
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    return min(limit, max(float(value), self.min_timeout_seconds))
+                except ValueError:
+                    break
+        return limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        timeout = self._timeout(scope)
+        token = _request_deadline.set(loop.time() + timeout)
+        body_received = asyncio.Event()
+        if not self._has_body(scope):
+            # Nothing to read, so the watcher can own receive() from the start
+            body_received.set()
+        forwarded: asyncio.Queue = asyncio.Queue()
+        response_started = False
+        # Servers report a disconnect once the response is done; work after that (background tasks) must finish
+        response_complete = False
+
+        async def wrapped_receive():
+            if body_received.is_set():
+                # After the body, messages come through the disconnect watcher
+                return await forwarded.get()
+            message = await receive()
+            if message["type"] == "http.disconnect" or not message.get("more_body", False):
+                body_received.set()
+            return message
+
+        async def wrapped_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+
+        try:
+            # The handler task inherits the deadline through the copied context
+            handler = asyncio.ensure_future(self.app(scope, wrapped_receive, wrapped_send))
+        finally:
+            _request_deadline.reset(token)
+
+        async def watch_disconnect():
+            await body_received.wait()
+            while True:
+                message = await receive()
+                await forwarded.put(message)
+                if message["type"] == "http.disconnect":
+                    break
+            if not handler.done() and not response_complete:
+                logger.info(f"Client disconnected, cancelling {scope['method']} {scope['path']}")
+                handler.cancel()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait_for(asyncio.shield(handler), timeout=timeout + self.grace_seconds)
+        except asyncio.TimeoutError:
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            logger.warning(f"Request deadline exceeded for {scope['method']} {scope['path']}")
+            if not response_started:
+                body = json.dumps({"error": "Request deadline exceeded", "details": {}}).encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                })
+                await send({"type": "http.response.body", "body": body})
+        except asyncio.CancelledError:
+            if not handler.cancelled():
+                # The server is cancelling us; take the handler down with it
+                handler.cancel()
+                raise
+            # Cancelled because the client went away; there is nobody left to answer
+        finally:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
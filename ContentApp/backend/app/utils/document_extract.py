@@ -0,0 +1,109 @@
+import io
+import re
+import time
+import zipfile
+from typing import List
+from xml.etree.ElementTree import ParseError, iterparse
+
+# These run in worker processes, so they only take and return plain values
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_BODY = "word/document.xml"
+# Printable runs in the two encodings Word 97-2003 stores text in
+UTF16_RUN_RE = re.compile(rb"(?:[\x20-\x7e\t\r\n]\x00){12,}")
+BYTE_RUN_RE = re.compile(rb"[\x20-\x7e\t\r\n\x91-\x97\xa0-\xff]{12,}")
+# OLE container and property set names that show up as printable runs
+DOC_NOISE_RE = re.compile(
+    r"^(Root Entry|WordDocument|SummaryInformation|DocumentSummaryInformation|CompObj|ObjectPool|"
+    r"Microsoft (Office )?Word.*|Normal(\.dot)?|Times New Roman|Symbol|Arial|Default Paragraph Font)$"
+)
+
+class DocumentExtractionError(ValueError):
+    """The document is corrupt, unsupported or over a safety limit"""
+
+class _LimitedReader(io.RawIOBase):
+    """Counts decompressed bytes as the parser pulls them and stops past the limit"""
+
+    def __init__(self, stream, limit: int, deadline: float):
+        self.stream = stream
+        self.limit = limit
+        self.deadline = deadline
+        self.consumed = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if time.monotonic() > self.deadline:
+            raise DocumentExtractionError("Document took too long to process")
+        data = self.stream.read(len(buffer))
+        self.consumed += len(data)
+        # Header sizes can lie, so the limit is enforced on what actually inflates
+        if self.consumed > self.limit:
+            raise DocumentExtractionError("Document expands past the decompressed size limit")
+        buffer[:len(data)] = data
+        return len(data)
+
+def extract_docx(data: bytes, max_decompressed_bytes: int, max_ratio: float, timeout_seconds: float) -> str:
+    """Paragraph text of a .docx, parsed as a stream so the XML is never held in memory"""
+    deadline = time.monotonic() + timeout_seconds
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise DocumentExtractionError("Not a valid .docx file")
+
+    with archive:
+        try:
+            info = archive.getinfo(DOCX_BODY)
+        except KeyError:
+            raise DocumentExtractionError("Not a valid .docx file")
+        if info.file_size > max_decompressed_bytes:
+            raise DocumentExtractionError("Document expands past the decompressed size limit")
+        if info.compress_size and info.file_size / info.compress_size > max_ratio:
+            raise DocumentExtractionError("Document compression ratio is suspiciously high")
+
+        paragraphs: List[str] = []
+        runs: List[str] = []
+        try:
+            with archive.open(info) as stream:
+                reader = io.BufferedReader(_LimitedReader(stream, max_decompressed_bytes, deadline))
+                for event, element in iterparse(reader, events=("end",)):
+                    tag = element.tag
+                    if tag == WORD_NS + "t":
+                        runs.append(element.text or "")
+                    elif tag == WORD_NS + "tab":
+                        runs.append("\t")
+                    elif tag in (WORD_NS + "br", WORD_NS + "cr"):
+                        runs.append("\n")
+                    elif tag == WORD_NS + "p":
+                        paragraphs.append("".join(runs))
+                        runs = []
+                        # Drop finished paragraphs so memory stays flat on long documents
+                        element.clear()
+        except ParseError:
+            raise DocumentExtractionError("Document XML is malformed")
+        except (zipfile.BadZipFile, EOFError, NotImplementedError):
+            raise DocumentExtractionError("Not a valid .docx file")
+
+    return "\n".join(paragraphs).strip()
+
+def extract_doc(data: bytes, timeout_seconds: float) -> str:
+    """Best-effort text of a Word 97-2003 .doc from printable runs in its binary streams"""
+    deadline = time.monotonic() + timeout_seconds
+    if not data.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        raise DocumentExtractionError("Not a valid .doc file")
+
+    # Text is either UTF-16LE or 8-bit cp1252 depending on the document; keep whichever yields more
+    wide = [match.decode("utf-16-le") for match in UTF16_RUN_RE.findall(data)]
+    if time.monotonic() > deadline:
+        raise DocumentExtractionError("Document took too long to process")
+    narrow = [match.decode("cp1252", errors="ignore") for match in BYTE_RUN_RE.findall(data)]
+    runs = wide if sum(map(len, wide)) >= sum(map(len, narrow)) else narrow
+
+    lines = []
+    for run in runs:
+        for line in run.replace("\r", "\n").split("\n"):
+            line = line.strip()
+            if line and not DOC_NOISE_RE.match(line):
+                lines.append(line)
+    return "\n".join(lines)
@@ -13,12 +13,14 @@ class APIError(Exception):
         message: str, 
         status_code: int = 500, 
         details: Optional[Dict[str, Any]] = None,
-        log_level: str = "error"
+        log_level: str = "error",
+        headers: Optional[Dict[str, str]] = None
     ):
         self.message = message
         self.status_code = status_code
         self.details = details or {}
         self.log_level = log_level
+        self.headers = headers
         super().__init__(self.message)
 
 async def handle_api_error(error: APIError) -> JSONResponse:
@@ -37,7 +39,8 @@ async def handle_api_error(error: APIError) -> JSONResponse:
     
     return JSONResponse(
         status_code=error.status_code,
-        content={"error": error.message, "details": error.details}
+        content={"error": error.message, "details": error.details},
+        headers=error.headers
     )
 
 def handle_openai_error(error: OpenAIError) -> APIError:
@@ -82,6 +85,9 @@ async def handle_api_operation(
             extra={"operation": operation_name}
         )
         return result
+    except APIError:
+        # Already carries the right status (e.g. 429 from admission control)
+        raise
     except Exception as e:
         logger.error(
             f"{operation_name} failed",
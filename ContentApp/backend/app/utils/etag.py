@@ -0,0 +1,20 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+# Per-user data: browsers may keep it but must revalidate, shared caches must not store it
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from a stable JSON encoding of parts"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return f'"{hashlib.sha256(encoded.encode()).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match evaluation (weak comparison, as RFC 9110 requires for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+EXPORT_FIELDS = ["_id", "template", "objective", "context", "generated_content", "created_at"]
+# Spreadsheet apps treat cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _value(post: Dict[str, Any], field: str) -> Any:
+    value = post.get(field)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        return str(value)
+    return value
+
+async def ndjson_lines(posts: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for post in posts:
+        yield (json.dumps({field: _value(post, field) for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n").encode()
+
+async def csv_lines(posts: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def row(values: List[Any]) -> bytes:
+        writer.writerow(values)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line.encode()
+
+    # BOM so spreadsheet apps detect UTF-8
+    yield "\ufeff".encode() + row(EXPORT_FIELDS)
+    async for post in posts:
+        values = []
+        for field in EXPORT_FIELDS:
+            value = _value(post, field)
+            if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+                value = "'" + value
+            values.append("" if value is None else value)
+        yield row(values)
+
+async def coalesce_chunks(chunks: AsyncIterator[bytes], min_bytes: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Group small chunks so the response isn't written one line at a time"""
+    parts: List[bytes] = []
+    size = 0
+    async for chunk in chunks:
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= min_bytes:
+            yield b"".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b"".join(parts)
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], flush_bytes: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Compress a byte stream into one gzip member, flushing so the client sees steady progress"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    async for chunk in chunks:
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            output += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if output:
+            yield output
+    yield compressor.flush()
@@ -0,0 +1,131 @@
+import heapq
+import math
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+from .context_packing import term_spans, tokenize
+
+class InvertedIndex:
+    """Incremental BM25 index with prefix matching.
+
+    Documents can be added and removed one at a time. The sorted vocabulary
+    used for prefix lookups is rebuilt lazily on the next search after a change.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_expansions: int = 50):
+        self.k1 = k1
+        self.b = b
+        self.max_expansions = max_expansions
+        self.postings: Dict[str, Dict[Hashable, int]] = {}
+        self.doc_terms: Dict[Hashable, Counter] = {}
+        self.lengths: Dict[Hashable, int] = {}
+        self.total_length = 0
+        self._vocabulary: List[str] = []
+        self._vocabulary_stale = False
+        self._norms: Optional[Dict[Hashable, float]] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, doc_id: Hashable, text: str) -> None:
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        self._norms = None
+        freqs = Counter(tokenize(text))
+        self.doc_terms[doc_id] = freqs
+        self.lengths[doc_id] = sum(freqs.values())
+        self.total_length += self.lengths[doc_id]
+        for term, tf in freqs.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                self._vocabulary_stale = True
+            posting[doc_id] = tf
+
+    def remove(self, doc_id: Hashable) -> None:
+        freqs = self.doc_terms.pop(doc_id, None)
+        if freqs is None:
+            return
+        self._norms = None
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in freqs:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+                self._vocabulary_stale = True
+
+    def expand(self, term: str) -> List[str]:
+        """Indexed terms starting with term, the exact term first"""
+        if self._vocabulary_stale:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_stale = False
+        matches = [term] if term in self.postings else []
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and len(matches) < self.max_expansions:
+            candidate = self._vocabulary[position]
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                matches.append(candidate)
+            position += 1
+        return matches
+
+    def _document_norms(self) -> Dict[Hashable, float]:
+        # BM25 length normalisation only changes when documents do
+        if self._norms is None:
+            avg_length = (self.total_length / len(self.lengths)) or 1
+            k1, b = self.k1, self.b
+            self._norms = {doc_id: k1 * (1 - b + b * length / avg_length) for doc_id, length in self.lengths.items()}
+        return self._norms
+
+    def search(self, query: str, limit: Optional[int] = None) -> Tuple[List[Tuple[Hashable, float]], int]:
+        """Top documents matching every query term (as a word prefix) and the total match count"""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms or not self.doc_terms:
+            return [], 0
+
+        norms = self._document_norms()
+        total_docs = len(self.doc_terms)
+        k1_plus_one = self.k1 + 1
+        # Rarest term first so later terms only touch documents still in the running
+        expansions = sorted(
+            ((query_term, self.expand(query_term)) for query_term in query_terms),
+            key=lambda item: sum(len(self.postings[term]) for term in item[1])
+        )
+        scores: Optional[Dict[Hashable, float]] = None
+        for query_term, terms in expansions:
+            term_scores: Dict[Hashable, float] = {}
+            for term in terms:
+                posting = self.postings[term]
+                idf = math.log(1 + (total_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                # Prefix expansions rank below exact hits on the same word
+                weight = idf * k1_plus_one if term == query_term else idf * k1_plus_one * 0.8
+                for doc_id, tf in posting.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    score = weight * tf / (tf + norms[doc_id])
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: scores[doc_id] + score for doc_id, score in term_scores.items()}
+            if not scores:
+                return [], 0
+
+        if limit is None:
+            return sorted(scores.items(), key=itemgetter(1), reverse=True), len(scores)
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1)), len(scores)
+
+def highlight_spans(text: str, query: str) -> List[List[int]]:
+    """[start, end] offsets of words in text that match a query term or start with one"""
+    query_terms: Set[str] = set(tokenize(query))
+    if not text or not query_terms:
+        return []
+    return [
+        [start, end]
+        for term, start, end in term_spans(text)
+        if any(term.startswith(query_term) for query_term in query_terms)
+    ]
@@ -1,6 +1,20 @@
-from typing import Dict, Any
+import logging
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
+# Context window sizes (prompt + completion tokens) of supported chat models
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
 def get_text_generation_params() -> Dict[str, Any]:
     """Centralize text generation parameters"""
     return {
@@ -20,3 +34,41 @@ def get_image_generation_params() -> Dict[str, Any]:
         "quality": "standard",
         "response_format": "url"
     }
+
+def get_context_window(model: Optional[str] = None) -> int:
+    model = model or settings.openai_model
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    # Dated snapshots such as gpt-4-0613 share the base model's window
+    for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    try:
+        import tiktoken # type: ignore
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable for {model}, falling back to estimates: {str(e)}")
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens with the model's tokenizer, or estimate ~4 characters per token"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.openai_model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int, n: int = 1) -> int:
+    """Upper bound of prompt plus completion tokens for admission control"""
+    prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+    # Per-message framing overhead of the chat format
+    prompt_tokens += 4 * len(messages)
+    return prompt_tokens + max_tokens * n
@@ -1,5 +1,21 @@
-from typing import Dict, Any, List, Tuple
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
 from motor.motor_asyncio import AsyncIOMotorCollection # type: ignore
+from ..config import settings
+from .cache import LRUCache
+from .deadline import max_time_ms, with_deadline
+from .error_handlers import APIError
+
+# Newest first with _id breaking ties, the order cursors are encoded over
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+# Short-lived counts so cursor clients that ask for a total don't recount on every page
+_count_cache = LRUCache(max_entries=1024, ttl_seconds=settings.history_count_cache_seconds)
 
 async def paginate_query(
     collection: AsyncIOMotorCollection,
@@ -11,17 +27,23 @@ async def paginate_query(
     """
     Generic pagination utility for MongoDB queries
     """
+    # Bound both queries by the remaining request time, server- and client-side
+    time_limit = max_time_ms()
+    count_options = {"maxTimeMS": time_limit} if time_limit else {}
+
     # Get total count
-    total = await collection.count_documents(query)
+    total = await with_deadline(collection.count_documents(query, **count_options), "count posts")
     
     # Build cursor
     cursor = collection.find(query)
+    if time_limit:
+        cursor.max_time_ms(time_limit)
     if sort:
         cursor.sort(sort)
     cursor.skip(skip).limit(limit)
     
     # Get documents
-    documents = await cursor.to_list(length=limit)
+    documents = await with_deadline(cursor.to_list(length=limit), "find posts")
     
     # Convert _id to string
     for doc in documents:
@@ -35,5 +57,93 @@ async def paginate_query(
         "posts": documents,
         "total": total,
         "page": current_page,
-        "totalPages": max(1, total_pages)
+        "totalPages": max(1, total_pages),
+        # Lets offset clients continue with keyset pagination from here; only valid in keyset order
+        "nextCursor": encode_cursor(documents[-1], "next") if sort == KEYSET_SORT and documents and skip + len(documents) < total and "created_at" in documents[-1] else None
     }
+
+def encode_cursor(document: Dict[str, Any], direction: str) -> str:
+    """Opaque cursor pointing just past document in the given direction"""
+    payload = {
+        "t": document["created_at"].isoformat(),
+        "id": str(document["_id"]),
+        "d": direction
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = datetime.fromisoformat(payload["t"])
+        direction = payload["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        try:
+            document_id = ObjectId(payload["id"])
+        except InvalidId:
+            document_id = payload["id"]
+        return created_at, document_id, direction
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise APIError(message="Invalid pagination cursor", status_code=400, details={"error": str(e)}, log_level="warning")
+
+async def cached_count(collection: AsyncIOMotorCollection, query: Dict[str, Any], cache_key: str) -> int:
+    total = _count_cache.get(cache_key)
+    if total is None:
+        time_limit = max_time_ms()
+        count_options = {"maxTimeMS": time_limit} if time_limit else {}
+        total = await with_deadline(collection.count_documents(query, **count_options), "count posts")
+        _count_cache.set(cache_key, total)
+    return total
+
+async def paginate_keyset(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    count_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Cursor pagination over (created_at, _id), newest first.
+    Costs one index range scan per page regardless of depth; pass count_key
+    to include a cached total.
+    """
+    direction = "next"
+    page_query = dict(query)
+    if cursor:
+        created_at, document_id, direction = decode_cursor(cursor)
+        op = "$lt" if direction == "next" else "$gt"
+        page_query = {"$and": [query, {"$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: document_id}}
+        ]}]}
+
+    # Walk backwards in ascending order for previous pages, then flip back
+    order = -1 if direction == "next" else 1
+    find = collection.find(page_query).sort([(field, order) for field, _ in KEYSET_SORT]).limit(limit + 1)
+    time_limit = max_time_ms()
+    if time_limit:
+        find.max_time_ms(time_limit)
+    documents = await with_deadline(find.to_list(length=limit + 1), "find posts")
+
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if direction == "prev":
+        documents.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = bool(cursor), has_more
+
+    result = {
+        "posts": documents,
+        "limit": limit,
+        "nextCursor": encode_cursor(documents[-1], "next") if documents and has_older else None,
+        "prevCursor": encode_cursor(documents[0], "prev") if documents and has_newer else None
+    }
+    if count_key:
+        result["total"] = await cached_count(collection, query, count_key)
+
+    for doc in documents:
+        if "_id" in doc:
+            doc["_id"] = str(doc["_id"])
+    return result
@@ -3,6 +3,7 @@ from typing import Dict, Tuple
 from fastapi import Request
 import logging
 from .error_handlers import APIError
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -56,4 +57,4 @@ class RateLimiter:
             }
         )
 
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(settings.rate_limit_per_minute)
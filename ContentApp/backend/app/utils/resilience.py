@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque, defaultdict
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from .error_handlers import APIError
+
+logger = logging.getLogger(__name__)
+
+# Tried per attempt: the remaining time in seconds -> the attempt's result
+AttemptFn = Callable[[float], Awaitable[Any]]
+
+# Attempts get this much longer than the deadline, so the caller's own timer always ends them first
+# and a timeout can be attributed to the policy or to the caller's shorter budget
+ATTEMPT_TIMEOUT_SLACK = 1.0
+
+class LatencyTracker:
+    """Rolling latency samples for one route, used to learn the hedging delay"""
+
+    def __init__(self, max_samples: int = 500):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class ResilientCaller:
+    """Deadline-bounded retries with jittered exponential backoff plus optional request hedging.
+
+    Each route ("chat", "chat_stream", "image") has its own policy: a dict with
+    max_attempts, base_delay, max_delay, deadline, hedge, hedge_percentile and
+    hedge_min_samples.
+    """
+
+    def __init__(self, policies: Dict[str, Dict[str, Any]], is_retryable: Callable[[Exception], bool], retry_after: Callable[[Exception], Optional[float]]):
+        self.policies = policies
+        self.is_retryable = is_retryable
+        self.retry_after = retry_after
+        self.trackers: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _policy(self, route: str) -> Dict[str, Any]:
+        return self.policies.get(route) or self.policies["default"]
+
+    def _hedge_delay(self, route: str, policy: Dict[str, Any]) -> Optional[float]:
+        tracker = self.trackers[route]
+        if not policy.get("hedge") or len(tracker.samples) < policy.get("hedge_min_samples", 20):
+            return None
+        return tracker.percentile(policy.get("hedge_percentile", 95))
+
+    async def _hedged_attempt(self, route: str, attempt: AttemptFn, deadline: float, discard: Optional[Callable[[Any], Awaitable[None]]]) -> Any:
+        policy = self._policy(route)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        primary = asyncio.ensure_future(attempt(deadline - start + ATTEMPT_TIMEOUT_SLACK))
+        tasks = [primary]
+        winner: Optional[asyncio.Future] = None
+        hedge_delay = self._hedge_delay(route, policy)
+
+        try:
+            if hedge_delay is not None and hedge_delay < deadline - start:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self.counters[route]["hedges_fired"] += 1
+                    logger.info(f"Hedging slow {route} call after {hedge_delay:.2f}s", extra={"route": route})
+                    tasks.append(asyncio.ensure_future(attempt(deadline - loop.time() + ATTEMPT_TIMEOUT_SLACK)))
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = error or task.exception()
+                if winner:
+                    if winner is not primary:
+                        self.counters[route]["hedges_won"] += 1
+                    self.trackers[route].record(loop.time() - start)
+                    return winner.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if discard:
+                # Both copies can succeed together; release any result not handed to the caller
+                for task in tasks:
+                    if task is not winner and not task.cancelled() and task.exception() is None:
+                        try:
+                            await discard(task.result())
+                        except Exception as e:
+                            logger.warning(f"Failed to discard losing hedged result: {str(e)}")
+
+    async def call(self, route: str, attempt: AttemptFn, discard: Optional[Callable[[Any], Awaitable[None]]] = None, deadline: Optional[float] = None) -> Any:
+        """Run attempt until it succeeds, a non-retryable error occurs or the deadline passes.
+
+        A timeout is a 504 whose details name the deadline that ran out: "policy_deadline" when the
+        provider took longer than the route allows, "request_deadline" when the caller's shorter
+        budget ended first, which says nothing about the provider.
+        """
+        policy = self._policy(route)
+        loop = asyncio.get_running_loop()
+        # A caller-supplied deadline (e.g. the request's) can only shorten the policy deadline
+        policy_deadline = loop.time() + policy["deadline"]
+        request_bound = deadline is not None and deadline < policy_deadline
+        deadline = policy_deadline if deadline is None else min(deadline, policy_deadline)
+        reason = "request_deadline" if request_bound else "policy_deadline"
+        counters = self.counters[route]
+
+        for attempt_number in range(1, policy["max_attempts"] + 1):
+            counters["attempts"] += 1
+            try:
+                return await self._hedged_attempt(route, attempt, deadline, discard)
+            except asyncio.TimeoutError:
+                counters["deadline_exceeded" if not request_bound else "request_deadline_exceeded"] += 1
+                raise APIError(message="Model request timed out", status_code=504, details={"route": route, "reason": reason}, log_level="warning")
+            except Exception as e:
+                if not self.is_retryable(e) or attempt_number == policy["max_attempts"]:
+                    raise
+                backoff = random.uniform(0, min(policy["max_delay"], policy["base_delay"] * 2 ** (attempt_number - 1)))
+                backoff = max(backoff, self.retry_after(e) or 0.0)
+                if loop.time() + backoff >= deadline:
+                    counters["deadline_exceeded"] += 1
+                    raise
+                counters["retries"] += 1
+                logger.warning(
+                    f"Retrying {route} call in {backoff:.2f}s after error: {str(e)}",
+                    extra={"route": route, "attempt": attempt_number}
+                )
+                await asyncio.sleep(backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            route: {
+                **dict(self.counters[route]),
+                "p50_ms": round((self.trackers[route].percentile(50) or 0) * 1000, 1),
+                "p95_ms": round((self.trackers[route].percentile(95) or 0) * 1000, 1),
+                "hedge_delay_ms": round((self._hedge_delay(route, self._policy(route)) or 0) * 1000, 1)
+            }
+            for route in set(self.counters) | set(self.trackers)
+        }
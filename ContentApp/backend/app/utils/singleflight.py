@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorCollection # type: ignore
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one shared execution.
+
+    The shared call keeps running while any caller still waits for it, and is
+    cancelled once the last waiting caller has been cancelled.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.cancelled = 0
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.followers += 1
+            logger.info("Joining in-flight generation", extra={"singleflight_key": key})
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        abandoned = False
+        try:
+            # Shield so one cancelled caller does not cancel the call the others share
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            abandoned = True
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+                if abandoned and not task.done():
+                    # Nobody is left to use the result; new callers start a fresh call
+                    self._forget(key, task)
+                    task.cancel()
+                    self.cancelled += 1
+                    logger.info("Cancelling in-flight call without waiters", extra={"singleflight_key": key})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "cancelled": self.cancelled
+        }
+
+class MongoLease:
+    """Short-lived lock record marking which worker is running a given call"""
+
+    def __init__(self, collection: AsyncIOMotorCollection, key: str, ttl_seconds: float):
+        self.collection = collection
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+
+    async def acquire(self) -> bool:
+        now = datetime.utcnow()
+        lease = {
+            "_id": self.key,
+            "owner": WORKER_ID,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds)
+        }
+        try:
+            await self.collection.insert_one(lease)
+            return True
+        except DuplicateKeyError:
+            # Take over a lease whose owner died without releasing it
+            taken = await self.collection.find_one_and_update(
+                {"_id": self.key, "expires_at": {"$lte": now}},
+                {"$set": {"owner": WORKER_ID, "expires_at": lease["expires_at"]}}
+            )
+            return taken is not None
+
+    async def is_held(self) -> bool:
+        doc = await self.collection.find_one({
+            "_id": self.key,
+            "expires_at": {"$gt": datetime.utcnow()}
+        })
+        return doc is not None
+
+    async def release(self) -> None:
+        await self.collection.delete_one({"_id": self.key, "owner": WORKER_ID})
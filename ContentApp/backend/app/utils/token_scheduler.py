@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import deque, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from .error_handlers import APIError
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60.0
+
+@dataclass
+class Ticket:
+    user_id: str
+    estimated_tokens: int
+    granted_at: float = 0.0
+    ledger_entry: Optional[List[float]] = None
+
+@dataclass(order=True)
+class _Waiter:
+    finish_tag: float
+    seq: int
+    ticket: Ticket = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default=0.0)
+
+class TokenBudgetScheduler:
+    """Admission control for upstream calls against tokens/requests-per-minute budgets.
+
+    Waiting requests are served in weighted fair queuing order: each user's
+    requests get virtual finish tags proportional to their token cost divided
+    by the user's weight, so one user's burst cannot starve everyone else.
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, default_weight: float = 1.0, user_weights: Optional[Dict[str, float]] = None):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.default_weight = default_weight
+        self.user_weights = user_weights or {}
+        # Each entry is [granted_at, tokens]; tokens are corrected to actual usage on release
+        self._ledger: Deque[List[float]] = deque()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        # Only users whose last finish tag is ahead of the virtual clock; the rest start from it anyway
+        self._last_finish: Dict[str, float] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._wait_times: Deque[float] = deque(maxlen=500)
+        self.granted = 0
+        self.rejected = 0
+
+    def _weight(self, user_id: str) -> float:
+        return self.user_weights.get(user_id, self.default_weight)
+
+    def _expire(self, now: float) -> None:
+        while self._ledger and self._ledger[0][0] <= now - WINDOW_SECONDS:
+            self._ledger.popleft()
+
+    def _used(self) -> Tuple[float, int]:
+        return sum(entry[1] for entry in self._ledger), len(self._ledger)
+
+    def _fits(self, tokens: int) -> bool:
+        used_tokens, used_requests = self._used()
+        if used_requests + 1 > self.requests_per_minute:
+            return False
+        # A single request larger than the whole budget is admitted on an idle window
+        return used_tokens + tokens <= self.tokens_per_minute or not self._ledger
+
+    def _estimate_wait(self, tokens_needed: float, requests_needed: int, now: float) -> float:
+        """Seconds until the window frees enough budget for the given demand"""
+        used_tokens, used_requests = self._used()
+        if used_tokens + tokens_needed <= self.tokens_per_minute and used_requests + requests_needed <= self.requests_per_minute:
+            return 0.0
+
+        freed_tokens = 0.0
+        freed_requests = 0
+        for granted_at, tokens in self._ledger:
+            freed_tokens += tokens
+            freed_requests += 1
+            if (used_tokens - freed_tokens + tokens_needed <= self.tokens_per_minute
+                    and used_requests - freed_requests + requests_needed <= self.requests_per_minute):
+                return max(0.0, granted_at + WINDOW_SECONDS - now)
+
+        # Demand exceeds a full window; assume it drains at the budgeted rate
+        windows = max(tokens_needed / self.tokens_per_minute, requests_needed / self.requests_per_minute)
+        last_expiry = self._ledger[-1][0] + WINDOW_SECONDS - now if self._ledger else 0.0
+        return max(0.0, last_expiry) + (windows - 1) * WINDOW_SECONDS
+
+    def _grant(self, waiter: _Waiter, now: float) -> None:
+        entry = [now, float(waiter.ticket.estimated_tokens)]
+        self._ledger.append(entry)
+        waiter.ticket.granted_at = now
+        waiter.ticket.ledger_entry = entry
+        self._virtual_time = max(self._virtual_time, waiter.finish_tag)
+        self._wait_times.append(now - waiter.enqueued_at)
+        self.granted += 1
+        waiter.future.set_result(waiter.ticket)
+
+    def _dispatch(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        self._expire(now)
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if not self._fits(head.ticket.estimated_tokens):
+                break
+            heapq.heappop(self._queue)
+            self._grant(head, now)
+
+        if self._queue:
+            delay = self._estimate_wait(self._queue[0].ticket.estimated_tokens, 1, now)
+            self._timer = asyncio.get_running_loop().call_later(max(delay, 0.05), self._dispatch)
+        elif self._last_finish:
+            self._prune_finish_tags()
+
+    def _prune_finish_tags(self) -> None:
+        """Forget users whose next request would start from the virtual clock anyway"""
+        self._last_finish = {
+            user_id: finish for user_id, finish in self._last_finish.items()
+            if finish > self._virtual_time
+        }
+
+    async def acquire(self, user_id: str, estimated_tokens: int, max_wait: float) -> Ticket:
+        now = time.monotonic()
+        self._expire(now)
+        ticket = Ticket(user_id=user_id, estimated_tokens=estimated_tokens)
+
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish_tag = start + estimated_tokens / self._weight(user_id)
+
+        # Everything with an earlier finish tag is served first
+        ahead = [w for w in self._queue if w.finish_tag <= finish_tag and not w.future.done()]
+        expected_wait = self._estimate_wait(
+            sum(w.ticket.estimated_tokens for w in ahead) + estimated_tokens,
+            len(ahead) + 1,
+            now
+        )
+        if expected_wait > max_wait:
+            self.rejected += 1
+            retry_after = max(1, math.ceil(expected_wait))
+            logger.warning(
+                "Rejecting model request: token budget queue exceeds deadline",
+                extra={"user_id": user_id, "expected_wait": round(expected_wait, 2), "queue_depth": len(self._queue)}
+            )
+            raise APIError(
+                message="Model capacity exhausted. Please try again later.",
+                status_code=429,
+                details={"retry_after": retry_after},
+                log_level="warning",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+        self._last_finish[user_id] = finish_tag
+        waiter = _Waiter(finish_tag, next(self._seq), ticket, asyncio.get_running_loop().create_future(), now)
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            waiter.future.cancel()
+            self.rejected += 1
+            retry_after = max(1, math.ceil(self._estimate_wait(estimated_tokens, 1, time.monotonic())))
+            raise APIError(
+                message="Model capacity exhausted. Please try again later.",
+                status_code=429,
+                details={"retry_after": retry_after},
+                log_level="warning",
+                headers={"Retry-After": str(retry_after)}
+            )
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just before the caller went away; give the budget back
+                self.release(waiter.future.result(), 0)
+            else:
+                waiter.future.cancel()
+            raise
+
+    def release(self, ticket: Ticket, actual_tokens: Optional[int] = None, extra_requests: int = 0, extra_tokens: int = 0) -> None:
+        """Reconcile the estimate with actual usage and wake up waiting requests.
+
+        extra_requests are further upstream calls made under the same ticket (retries, hedges,
+        failovers); they are charged now, sharing extra_tokens between them.
+        """
+        if ticket.ledger_entry is not None and actual_tokens is not None:
+            ticket.ledger_entry[1] = float(actual_tokens)
+        if ticket.ledger_entry is not None and extra_requests > 0:
+            now = time.monotonic()
+            self._ledger.extend([now, extra_tokens / extra_requests] for _ in range(extra_requests))
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._expire(now)
+        used_tokens, used_requests = self._used()
+        depth_by_user: Dict[str, int] = defaultdict(int)
+        for waiter in self._queue:
+            if not waiter.future.done():
+                depth_by_user[waiter.ticket.user_id] += 1
+        waits = sorted(self._wait_times)
+        return {
+            "tokens_used_last_minute": int(used_tokens),
+            "tokens_per_minute": self.tokens_per_minute,
+            "requests_last_minute": used_requests,
+            "requests_per_minute": self.requests_per_minute,
+            "queue_depth": sum(depth_by_user.values()),
+            "queue_depth_by_user": dict(depth_by_user),
+            "tracked_users": len(self._last_finish),
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+                "max": round(waits[-1], 4) if waits else 0.0
+            }
+        }
@@ -0,0 +1,100 @@
+import os
+import zlib
+from typing import List, Optional, Tuple
+import numpy as np # type: ignore
+from .context_packing import tokenize
+
+def _features(text: str) -> List[str]:
+    terms = tokenize(text)
+    # Bigrams give the bag of words a little phrase sensitivity
+    return terms + [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+
+def embed_texts(texts: List[str], dim: int) -> np.ndarray:
+    """Signed hashing-trick vectors with sublinear term frequency, L2-normalised float32 rows"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            # crc32 is stable across processes, unlike hash()
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vectors[row, digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors.astype(np.float32, copy=False)
+
+class VectorFile:
+    """Float32 matrix on disk, read through a memory map.
+
+    Rows are written in place at offsets handed out by the caller, so several
+    processes can write to one file without coordinating beyond the row
+    allocation. Rows never move; freed rows are masked at query time until
+    they are handed out again.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self._map: Optional[np.memmap] = None
+        self._mapped_rows = 0
+        # Set once the live rows have been checked against the file in this process
+        self.verified = False
+
+    def write(self, start_row: int, vectors: np.ndarray) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.pwrite(fd, data, start_row * self.row_bytes)
+        finally:
+            os.close(fd)
+
+    def write_rows(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Write vectors to scattered rows, one write per run of consecutive rows"""
+        order = np.argsort(rows)
+        rows, vectors = rows[order], vectors[order]
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        for run_rows, run_vectors in zip(np.split(rows, breaks), np.split(vectors, breaks)):
+            self.write(int(run_rows[0]), run_vectors)
+
+    def missing_rows(self, alive: np.ndarray) -> np.ndarray:
+        """Live rows past the end of the file or never written (all zeros, e.g. a hole left by a lost file)"""
+        matrix = self.matrix()
+        rows = 0 if matrix is None else min(len(matrix), len(alive))
+        missing = np.flatnonzero(alive[rows:]) + rows
+        if rows:
+            empty = alive[:rows] & ~np.any(matrix[:rows], axis=1)
+            missing = np.concatenate([np.flatnonzero(empty), missing])
+        return missing
+
+    def rows(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self.row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def matrix(self) -> Optional[np.ndarray]:
+        """All rows written so far; the map is only reopened when the file has grown"""
+        rows = self.rows()
+        if rows == 0:
+            return None
+        if self._map is None or rows != self._mapped_rows:
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            self._mapped_rows = rows
+        return self._map
+
+    def search(self, query: np.ndarray, alive: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top-k (row, cosine) among rows where alive is True"""
+        matrix = self.matrix()
+        if matrix is None or k <= 0:
+            return []
+        rows = min(len(matrix), len(alive))
+        scores = matrix[:rows] @ query
+        scores[~alive[:rows]] = -np.inf
+        candidates = int(np.count_nonzero(alive[:rows]))
+        if candidates == 0:
+            return []
+        k = min(k, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
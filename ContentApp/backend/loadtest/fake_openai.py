@@ -0,0 +1,205 @@
+"""Local stand-in for the OpenAI API used for load testing.
+
+Serves chat completions (plain and streaming) and image generations with
+configurable latency, error rate and 429 behaviour, so the backend can be
+driven at load without spending real tokens. Run with:
+
+    python -m loadtest.fake_openai --port 8100 --latency-ms 800 --error-rate 0.01
+
+and point the backend at it with OPENAI_BASE_URL=http://localhost:8100/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+import uuid
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 800.0  # Median time to first token / full response
+    latency_sigma: float = 0.5  # Log-normal spread; 0 gives a fixed latency
+    tokens_per_second: float = 60.0  # Streaming speed after the first token
+    completion_tokens: int = 150
+    error_rate: float = 0.0  # Fraction of requests failing with 500
+    rate_limit_rate: float = 0.0  # Fraction of requests randomly answered with 429
+    requests_per_minute: int = 0  # Sliding-window limit producing 429s; 0 disables
+    image_latency_ms: float = 4000.0
+
+config = FakeConfig()
+app = FastAPI(title="Fake OpenAI")
+_request_times: Deque[float] = deque()
+
+WORDS = (
+    "innovation teams growth insight strategy product customers launch data "
+    "platform leadership future impact journey lessons market momentum"
+).split()
+
+def _png(width: int = 64, height: int = 64) -> bytes:
+    """A tiny solid-colour PNG, built without extra dependencies"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    raw = b"".join(b"\x00" + bytes([30, 90, 160]) * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+IMAGE_BYTES = _png()
+
+def _latency(median_ms: float) -> float:
+    if config.latency_sigma <= 0:
+        return median_ms / 1000
+    return random.lognormvariate(0, config.latency_sigma) * median_ms / 1000
+
+def _error(status_code: int, message: str, error_type: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": error_type}},
+        headers=headers
+    )
+
+def _admission_error():
+    """Apply the configured RPM window and random failure rates"""
+    now = time.monotonic()
+    while _request_times and _request_times[0] <= now - 60:
+        _request_times.popleft()
+    if config.requests_per_minute and len(_request_times) >= config.requests_per_minute:
+        retry_after = max(1, int(_request_times[0] + 60 - now))
+        return _error(429, "Rate limit reached for requests", "rate_limit_error", {"retry-after": str(retry_after)})
+    _request_times.append(now)
+
+    roll = random.random()
+    if roll < config.rate_limit_rate:
+        return _error(429, "Rate limit reached for tokens", "rate_limit_error", {"retry-after": "1"})
+    if roll < config.rate_limit_rate + config.error_rate:
+        return _error(500, "The server had an error while processing your request", "api_error")
+    return None
+
+def _words(count: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(count))
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = _admission_error()
+    if error:
+        await asyncio.sleep(_latency(config.latency_ms) / 10)
+        return error
+
+    model = body.get("model", "gpt-3.5-turbo")
+    n = body.get("n", 1)
+    tokens = min(body.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(_latency(config.latency_ms))
+            for i in range(tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": ("" if i == 0 else " ") + random.choice(WORDS)},
+                        "finish_reason": None
+                    }]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / config.tokens_per_second)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Non-streaming responses arrive once the whole completion would have been generated
+    await asyncio.sleep(_latency(config.latency_ms) + tokens / config.tokens_per_second)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": _words(tokens)},
+                "finish_reason": "stop"
+            }
+            for i in range(n)
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": tokens * n,
+            "total_tokens": prompt_tokens + tokens * n
+        }
+    }
+
+@app.post("/v1/images/generations")
+async def image_generations(request: Request):
+    body = await request.json()
+    error = _admission_error()
+    if error:
+        return error
+
+    await asyncio.sleep(_latency(config.image_latency_ms))
+    base_url = str(request.base_url).rstrip("/")
+    return {
+        "created": int(time.time()),
+        "data": [
+            {"url": f"{base_url}/files/{uuid.uuid4().hex}.png", "revised_prompt": body.get("prompt")}
+            for _ in range(body.get("n", 1))
+        ]
+    }
+
+@app.get("/files/{name}")
+async def image_file(name: str):
+    return Response(content=IMAGE_BYTES, media_type="image/png")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=config.latency_sigma)
+    parser.add_argument("--tokens-per-second", type=float, default=config.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=config.rate_limit_rate)
+    parser.add_argument("--requests-per-minute", type=int, default=config.requests_per_minute)
+    parser.add_argument("--image-latency-ms", type=float, default=config.image_latency_ms)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.latency_sigma = args.latency_sigma
+    config.tokens_per_second = args.tokens_per_second
+    config.completion_tokens = args.completion_tokens
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.requests_per_minute = args.requests_per_minute
+    config.image_latency_ms = args.image_latency_ms
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
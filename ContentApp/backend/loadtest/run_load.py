@@ -0,0 +1,184 @@
+"""Open-loop load test for the generation and history endpoints.
+
+Drives /api/generate, /api/history and /api/posts at a target request rate
+and reports latency percentiles, throughput and errors per endpoint. By
+default the app runs in-process against mongomock and the fake OpenAI
+server; pass --base-url to target a running deployment instead:
+
+    python -m loadtest.fake_openai --port 8100 &
+    python -m loadtest.run_load --rps 20 --duration 60 --openai-base-url http://127.0.0.1:8100/v1
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+OBJECTIVES = [
+    "Discuss the impact of AI on software development",
+    "Share lessons learned from scaling an engineering team",
+    "Announce our new analytics dashboard for small businesses",
+    "Analyze how remote work is reshaping hiring in tech",
+    "Explain why observability matters for growing startups",
+]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights.append((name.strip(), float(weight or 1)))
+    return weights
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, token: str, args: argparse.Namespace):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.args = args
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+
+    async def _generate(self) -> httpx.Response:
+        path = "/api/generate/stream" if self.args.stream else "/api/generate"
+        data = {
+            "template": random.choice(["tech-insight", "startup-story", "product-launch", "industry-update"]),
+            "objective": random.choice(OBJECTIVES),
+            "context": f"Load test context {random.randrange(self.args.unique_contexts)}",
+            "use_cache": "false" if self.args.no_cache else "true",
+        }
+        if self.args.stream:
+            async with self.client.stream("POST", path, data=data, headers=self.headers) as response:
+                async for _ in response.aiter_lines():
+                    pass
+                return response
+        return await self.client.post(path, data=data, headers=self.headers)
+
+    async def _history(self) -> httpx.Response:
+        return await self.client.get("/api/history", params={"limit": 10}, headers=self.headers)
+
+    async def _posts(self) -> httpx.Response:
+        return await self.client.post("/api/posts", headers=self.headers, json={
+            "template": "tech-insight",
+            "objective": random.choice(OBJECTIVES),
+            "context": "Saved from load test",
+            "generated_content": "Load test post body",
+        })
+
+    async def _one(self, endpoint: str) -> None:
+        handler = {"generate": self._generate, "history": self._history, "posts": self._posts}[endpoint]
+        start = time.perf_counter()
+        try:
+            response = await handler()
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                self.errors[endpoint][f"HTTP {response.status_code}"] += 1
+            else:
+                self.latencies[endpoint].append(elapsed)
+        except Exception as e:
+            self.errors[endpoint][e.__class__.__name__] += 1
+
+    async def run(self) -> float:
+        mix = parse_mix(self.args.mix)
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        total = int(self.args.rps * self.args.duration)
+        start = time.perf_counter()
+        tasks = []
+        # Open loop: arrivals follow the schedule regardless of how slow responses are
+        for i in range(total):
+            delay = start + i / self.args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._one(random.choices(names, weights)[0])))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> str:
+        lines = [
+            f"Ran {self.args.duration}s at {self.args.rps} rps target (wall time {elapsed:.1f}s)",
+            f"{'endpoint':<10} {'ok':>6} {'err':>5} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  errors",
+        ]
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = self.latencies[endpoint]
+            errors = self.errors[endpoint]
+            lines.append(
+                f"{endpoint:<10} {len(latencies):>6} {sum(errors.values()):>5} "
+                f"{len(latencies) / elapsed:>7.2f} "
+                f"{percentile(latencies, 50) * 1000:>8.0f} "
+                f"{percentile(latencies, 95) * 1000:>8.0f} "
+                f"{percentile(latencies, 99) * 1000:>8.0f}  "
+                f"{dict(errors) if errors else '-'}"
+            )
+        return "\n".join(lines)
+
+async def _in_process_client(args: argparse.Namespace) -> Tuple[httpx.AsyncClient, str]:
+    # Settings are read at import time, so configure the environment first
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["OPENAI_BASE_URL"] = args.openai_base_url
+    os.environ["RATE_LIMIT_PER_MINUTE"] = str(10 ** 9)
+    from app.appmain import app
+    from app.config import settings
+    from app.database import db, Database, connect_to_mongo
+    from app.utils.token_utils import create_token
+
+    if args.mongodb_url:
+        settings.mongodb_url = args.mongodb_url
+        await connect_to_mongo()
+    else:
+        from mongomock_motor import AsyncMongoMockClient # type: ignore
+        db.client = AsyncMongoMockClient()
+        for name in Database.__annotations__:
+            if name.endswith("_collection"):
+                setattr(db, name, db.client[settings.mongodb_name][name[:-len("_collection")]])
+
+    token = create_token("loadtest-user", settings.jwt_secret, settings.jwt_algorithm, 1)
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout), token
+
+async def main_async(args: argparse.Namespace) -> None:
+    if args.base_url:
+        from jose import jwt # type: ignore
+        from datetime import datetime, timedelta
+        token = jwt.encode(
+            {"sub": "loadtest-user", "exp": datetime.utcnow() + timedelta(days=1)},
+            args.jwt_secret,
+            algorithm="HS256"
+        )
+        limits = httpx.Limits(max_connections=args.max_connections)
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits)
+    else:
+        client, token = await _in_process_client(args)
+
+    async with client:
+        load_test = LoadTest(client, token, args)
+        elapsed = await load_test.run()
+    print(load_test.report(elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ContentAI backend")
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--jwt-secret", default=os.getenv("JWT_SECRET", "your-secret-key"))
+    parser.add_argument("--openai-base-url", default="http://127.0.0.1:8100/v1", help="Fake OpenAI server for in-process runs")
+    parser.add_argument("--mongodb-url", help="Use a real MongoDB for in-process runs instead of mongomock")
+    parser.add_argument("--rps", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", default="generate=1,history=4,posts=1", help="Weighted endpoint mix")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming generate endpoint")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the generation cache")
+    parser.add_argument("--unique-contexts", type=int, default=1000, help="Distinct contexts; lower values raise cache hit rates")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-connections", type=int, default=200)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ from fastapi.testclient import TestClient
 from mongomock_motor import AsyncMongoMockClient # type: ignore
 from app.config import settings
 from app.database import db
+from app.services.history_cache import history_cache
+from app.services.prompt_service import prompt_service
 from app.appmain import app
 import asyncio
 from datetime import datetime, timedelta
@@ -23,7 +25,20 @@ async def mock_db() -> AsyncGenerator:
     db.posts_collection = mock_client[settings.mongodb_name]["posts"]
     db.prompts_collection = mock_client[settings.mongodb_name]["prompts"]
     db.users_collection = mock_client[settings.mongodb_name]["users"]
+    db.generation_cache_collection = mock_client[settings.mongodb_name]["generation_cache"]
+    db.generation_leases_collection = mock_client[settings.mongodb_name]["generation_leases"]
+    db.image_jobs_collection = mock_client[settings.mongodb_name]["image_jobs"]
+    db.post_versions_collection = mock_client[settings.mongodb_name]["post_versions"]
+    db.document_cache_collection = mock_client[settings.mongodb_name]["document_cache"]
+    db.library_documents_collection = mock_client[settings.mongodb_name]["library_documents"]
+    db.library_chunks_collection = mock_client[settings.mongodb_name]["library_chunks"]
+    db.library_indexes_collection = mock_client[settings.mongodb_name]["library_indexes"]
+    # Versions restart at zero with every mock database
+    history_cache.cache.clear()
+    prompt_service.clear()
     yield mock_client
+    # Background prompt writes belong to this database
+    await prompt_service.drain()
     mock_client.close()
 
 @pytest.fixture
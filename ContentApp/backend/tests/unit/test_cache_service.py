@@ -0,0 +1,42 @@
+import pytest # type: ignore
+from app.services.cache_service import GenerationCache, make_generation_key
+from app.utils.cache import LRUCache
+
+def test_generation_key_is_normalized():
+    key = make_generation_key("text", "tech", "Impact of  AI", "Dev teams", ["doc"], {"model": "m"})
+    same = make_generation_key("text", "tech", "  impact of ai ", "dev\nteams", ["doc"], {"model": "m"})
+    other = make_generation_key("text", "tech", "Impact of AI", "Dev teams", ["other doc"], {"model": "m"})
+
+    assert key == same
+    assert key != other
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+async def test_generation_cache_falls_back_to_shared_tier(mock_db):
+    writer = GenerationCache(max_entries=4, ttl_seconds=60)
+    await writer.set("key", "cached text")
+
+    # A second worker has an empty local tier but shares the Mongo collection
+    reader = GenerationCache(max_entries=4, ttl_seconds=60)
+    assert await reader.get("key") == "cached text"
+    assert reader.stats()["shared"]["hits"] == 1
+    assert await reader.get("missing") is None
+
+def test_lru_cache_evicts_to_stay_under_byte_bound():
+    cache = LRUCache(max_entries=10, ttl_seconds=60, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None and len(cache) == 2
@@ -0,0 +1,66 @@
+import pytest # type: ignore
+from app.utils.circuit_breaker import CircuitBreaker, LoadShedder
+from app.utils.error_handlers import APIError
+
+class Upstream(Exception):
+    pass
+
+def _breaker(**overrides):
+    options = {"min_calls": 4, "failure_rate_threshold": 0.5, "slow_call_seconds": 10.0, "open_seconds": 30.0, "half_open_max_calls": 1}
+    options.update(overrides)
+    return CircuitBreaker("text", lambda e: isinstance(e, Upstream), **options)
+
+async def _fail(breaker, error):
+    with pytest.raises(type(error)):
+        async with breaker.guard():
+            raise error
+
+async def test_opens_after_failure_rate_and_fails_fast():
+    breaker = _breaker()
+    for _ in range(4):
+        await _fail(breaker, Upstream())
+    assert breaker.state == "open"
+
+    with pytest.raises(APIError) as exc_info:
+        async with breaker.guard():
+            raise AssertionError("must not reach upstream")
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.details["reason"] == "circuit_open"
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+    assert breaker.stats()["rejected"] == 1
+
+async def test_client_errors_do_not_open_the_circuit():
+    breaker = _breaker()
+    for _ in range(6):
+        await _fail(breaker, ValueError("bad request"))
+    assert breaker.state == "closed"
+
+async def test_slow_calls_open_the_circuit():
+    breaker = _breaker(slow_call_seconds=0.0, slow_call_rate_threshold=0.75)
+    for _ in range(4):
+        async with breaker.guard():
+            pass
+    assert breaker.state == "open"
+
+async def test_half_open_probe_closes_or_reopens():
+    breaker = _breaker(open_seconds=0.0)
+    for _ in range(4):
+        await _fail(breaker, Upstream())
+
+    # The open period has elapsed, so the next call is a probe
+    await _fail(breaker, Upstream())
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+    async with breaker.guard():
+        pass
+    assert breaker.state == "closed"
+
+def test_load_shedder_rejects_beyond_limit():
+    shedder = LoadShedder(max_in_flight=1)
+    with shedder.slot():
+        with pytest.raises(APIError) as exc_info:
+            with shedder.slot():
+                pass
+    assert exc_info.value.status_code == 503
+    assert shedder.stats() == {"in_flight": 0, "max_in_flight": 1, "peak_in_flight": 1, "shed": 1}
@@ -0,0 +1,31 @@
+from app.utils.context_packing import chunk_document, pack_context, split_into_chunks
+from app.utils.model_utils import count_tokens
+
+def test_split_into_chunks_respects_token_limit():
+    text = "\n\n".join(f"Paragraph {i} talks about topic {i}. " * 5 for i in range(20))
+    chunks = split_into_chunks(text, max_tokens=50)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+def test_pack_context_prefers_relevant_chunks_within_budget():
+    filler = "\n\n".join("Office furniture catalogue and chair prices for the season." for _ in range(30))
+    relevant = "Our AI code review assistant cut review time for developer teams by half."
+    documents = [filler, relevant]
+
+    packed = pack_context(documents, "AI impact on developer teams", token_budget=40, chunk_tokens=30)
+
+    assert packed[0][0] == 1
+    assert relevant in packed[0][1][0]
+    assert sum(count_tokens(chunk) for _, chunks in packed for chunk in chunks) <= 40
+
+def test_pack_context_with_no_budget_returns_nothing():
+    assert pack_context(["Some document text"], "query", token_budget=0) == []
+
+def test_chunk_document_memoizes_chunks_and_token_counts():
+    text = "\n\n".join(f"Section {i} covers pricing tiers." for i in range(10))
+    chunks = chunk_document(text, max_tokens=20)
+
+    assert chunk_document(text, max_tokens=20) is chunks
+    assert [chunk for chunk, _ in chunks] == split_into_chunks(text, max_tokens=20)
+    assert all(tokens == count_tokens(chunk) for chunk, tokens in chunks)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest # type: ignore
+from app.utils.deadline import RequestDeadlineMiddleware, remaining, with_deadline
+from app.utils.error_handlers import APIError
+
+async def _run(app, headers=None, disconnect_after=None, min_timeout_seconds=0.05):
+    middleware = RequestDeadlineMiddleware(app, timeout_seconds=0.2, grace_seconds=0.05, min_timeout_seconds=min_timeout_seconds)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers or []}
+    sent = []
+    delivered = False
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent
+
+async def test_handler_sees_remaining_request_time():
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["remaining"] = remaining()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = await _run(app, headers=[(b"x-request-timeout", b"0.1")])
+    assert sent[0]["status"] == 200
+    assert 0 < seen["remaining"] <= 0.1
+
+async def test_request_timeout_header_cannot_go_below_the_floor():
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["remaining"] = remaining()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    await _run(app, headers=[(b"x-request-timeout", b"0.001")], min_timeout_seconds=0.15)
+    assert 0.1 < seen["remaining"] <= 0.15
+
+async def test_slow_handler_gets_504_and_is_cancelled():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    sent = await _run(app)
+    assert sent[0]["status"] == 504
+    assert json.loads(sent[1]["body"])["error"] == "Request deadline exceeded"
+    assert cancelled.is_set()
+
+async def test_client_disconnect_cancels_handler():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await receive()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    sent = await _run(app, disconnect_after=0.01)
+    assert sent == []
+    assert cancelled.is_set()
+
+async def test_disconnect_after_the_response_does_not_cancel_background_work():
+    finished = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+        # Like a background task: the server sends http.disconnect while this runs
+        await asyncio.sleep(0.05)
+        finished.set()
+
+    sent = await _run(app, disconnect_after=0.01)
+    assert sent[0]["status"] == 200
+    assert finished.is_set()
+
+async def test_with_deadline_is_a_no_op_outside_requests():
+    assert remaining() is None
+    assert await with_deadline(asyncio.sleep(0, result="done"), "noop") == "done"
+
+async def test_with_deadline_raises_504_when_time_runs_out():
+    async def app(scope, receive, send):
+        with pytest.raises(APIError) as exc_info:
+            await with_deadline(asyncio.sleep(5), "slow query")
+        assert exc_info.value.status_code == 504
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = await _run(app, headers=[(b"x-request-timeout", b"0.1")])
+    assert sent[0]["status"] == 200
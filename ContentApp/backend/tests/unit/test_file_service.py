@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import io
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+import pytest # type: ignore
+from fastapi import HTTPException, UploadFile
+from app.config import settings
+from app.database import db
+from app.services.document_cache import DocumentCache
+from app.services.document_extractor import DocumentExtractor
+from app.services.file_service import FileService
+from app.utils.document_extract import DocumentExtractionError, extract_doc, extract_docx
+
+class CountingBytesIO(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def _upload(name: str, data: bytes) -> UploadFile:
+    return UploadFile(file=CountingBytesIO(data), filename=name)
+
+@pytest.fixture
+def service():
+    service = FileService()
+    service.CHUNK_SIZE = 4
+    return service
+
+async def test_reads_files_in_order_across_chunk_boundaries(service):
+    # "é" and "€" straddle 4-byte chunk boundaries
+    files = [_upload("a.txt", "abcé and €".encode()), _upload("b.txt", b"plain")]
+    assert await service.process_files(files) == ["abcé and €", "plain"]
+
+async def test_oversized_file_is_rejected_before_it_is_read_fully(service):
+    service.MAX_FILE_SIZE = 8
+    upload = _upload("big.txt", b"x" * 1000)
+    with pytest.raises(HTTPException) as exc:
+        await service.process_files([upload])
+    assert exc.value.status_code == 400
+    assert upload.file.bytes_read <= 12
+
+async def test_total_limit_spans_concurrent_files(service):
+    service.MAX_TOTAL_SIZE = 10
+    files = [_upload("a.txt", b"x" * 8), _upload("b.txt", b"y" * 8)]
+    with pytest.raises(HTTPException) as exc:
+        await service.process_files(files)
+    assert "Total size" in exc.value.detail
+
+async def test_invalid_utf8_fails_at_first_bad_byte(service):
+    upload = _upload("bad.txt", b"ok" + b"\xff" + b"z" * 1000)
+    with pytest.raises(HTTPException) as exc:
+        await service.process_files([upload])
+    assert "not a valid text document" in exc.value.detail
+    assert upload.file.bytes_read == 4
+
+async def test_disallowed_extension_is_rejected_without_reading(service):
+    good = _upload("a.txt", b"text")
+    with pytest.raises(HTTPException):
+        await service.process_files([good, _upload("run.exe", b"MZ")])
+    assert good.file.bytes_read == 0
+
+def _docx(body: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr(
+            "word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            + body + "</w:body></w:document>"
+        )
+    return buffer.getvalue()
+
+def test_extract_docx_keeps_paragraphs_tabs_and_breaks():
+    data = _docx(
+        "<w:p><w:r><w:t>Brand</w:t></w:r><w:r><w:tab/><w:t xml:space=\"preserve\"> voice</w:t></w:r></w:p>"
+        "<w:p><w:r><w:t>Line</w:t><w:br/><w:t>two</w:t></w:r></w:p>"
+    )
+    assert extract_docx(data, 1024 * 1024, 100, 5) == "Brand\t voice\nLine\ntwo"
+
+def test_extract_docx_rejects_zip_bombs():
+    data = _docx("<w:p><w:r><w:t>" + "a" * 200_000 + "</w:t></w:r></w:p>")
+    with pytest.raises(DocumentExtractionError, match="ratio"):
+        extract_docx(data, 10 * 1024 * 1024, 100, 5)
+    with pytest.raises(DocumentExtractionError, match="decompressed size"):
+        extract_docx(data, 1000, 10_000, 5)
+    with pytest.raises(DocumentExtractionError):
+        extract_docx(b"not a zip", 1000, 100, 5)
+
+def test_extract_doc_scans_utf16_text():
+    text = "Quarterly product update for the sales team"
+    data = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 64 + "Root Entry".encode("utf-16-le") + b"\x01\x02" + text.encode("utf-16-le") + b"\x00\x07"
+    assert extract_doc(data, 2) == text
+    with pytest.raises(DocumentExtractionError):
+        extract_doc(b"plain bytes", 2)
+
+async def test_word_uploads_are_extracted_in_worker_processes():
+    service = FileService()
+    try:
+        texts = await service.process_files([
+            _upload("notes.txt", b"plain"),
+            _upload("guide.docx", _docx("<w:p><w:r><w:t>Use short sentences</w:t></w:r></w:p>"))
+        ])
+        assert texts == ["plain", "Use short sentences"]
+
+        with pytest.raises(HTTPException) as exc:
+            await service.process_files([_upload("broken.docx", b"PK not really")])
+        assert "Could not read text" in exc.value.detail
+    finally:
+        service.extractor.close()
+
+async def test_recycling_the_pool_ends_stuck_workers():
+    extractor = DocumentExtractor(max_workers=1)
+    stuck = asyncio.get_running_loop().run_in_executor(extractor._pool(), time.sleep, 60)
+    for _ in range(100):
+        processes = list(extractor.pool._processes.values())
+        if processes and processes[0].is_alive():
+            break
+        await asyncio.sleep(0.05)
+
+    extractor.close()
+    with pytest.raises(BrokenProcessPool):
+        await asyncio.wait_for(stuck, 5)
+    processes[0].join(5)
+    assert not processes[0].is_alive()
+
+async def test_repeat_upload_reuses_cached_extraction(mock_db, monkeypatch):
+    service = FileService()
+    service.cache = DocumentCache()
+    data = _docx("<w:p><w:r><w:t>Brand guidelines v2</w:t></w:r></w:p>")
+    calls = []
+
+    async def extract(file_ext, content):
+        calls.append(file_ext)
+        return "Brand guidelines v2"
+
+    monkeypatch.setattr(service.extractor, "extract", extract)
+    assert await service.process_files([_upload("guide.docx", data)], user_id="user_a") == ["Brand guidelines v2"]
+    assert await service.process_files([_upload("copy.docx", data)], user_id="user_a") == ["Brand guidelines v2"]
+    assert calls == [".docx"]
+
+    # Another worker finds text, chunks and token counts in Mongo
+    record = await DocumentCache().get(hashlib.sha256(data).hexdigest())
+    assert record["chunks"] == [("Brand guidelines v2", record["tokens"])]
+
+async def test_documents_can_be_referenced_by_hash_by_their_uploader(mock_db):
+    service = FileService()
+    service.cache = DocumentCache()
+    data = "Product sheet: the new widget ships in May.".encode()
+    digest = hashlib.sha256(data).hexdigest()
+    await service.process_files([_upload("sheet.txt", data)], user_id="user_a")
+
+    texts = await service.process_files([_upload("notes.txt", b"notes")], [digest.upper()], user_id="user_a")
+    assert texts == ["notes", data.decode()]
+    assert (await service.describe(digest, "user_a"))["filename"] == "sheet.txt"
+
+    for user_id in ("user_b", "anonymous"):
+        with pytest.raises(HTTPException) as exc:
+            await service.process_files([], [digest], user_id=user_id)
+        assert exc.value.status_code == 404
+
+async def test_owners_of_unshared_documents_are_known_to_every_worker(mock_db, monkeypatch):
+    monkeypatch.setattr(settings, "document_cache_max_shared_chars", 10)
+    worker_a, worker_b = FileService(), FileService()
+    worker_a.cache, worker_b.cache = DocumentCache(), DocumentCache()
+    data = "Product sheet: the new widget ships in May.".encode()
+    digest = hashlib.sha256(data).hexdigest()
+    await worker_a.process_files([_upload("sheet.txt", data)], user_id="user_a")
+    await worker_b.process_files([_upload("sheet.txt", data)], user_id="user_b")
+
+    # Too large to share, so only the owners reach Mongo
+    shared = await db.document_cache_collection.find_one({"_id": digest})
+    assert "text" not in shared and set(shared["owners"]) == {"user_a", "user_b"}
+    # user_b uploaded through worker B, yet worker A, which holds the text, lets them reuse it
+    assert await worker_a.process_files([], [digest], user_id="user_b") == [data.decode()]
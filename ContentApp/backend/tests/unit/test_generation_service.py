@@ -0,0 +1,128 @@
+import asyncio
+import pytest # type: ignore
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from app.services.generation_service import GenerationService
+from app.services.cache_service import GenerationCache
+from app.database import db
+from app.utils.deadline import _request_deadline
+from app.utils.error_handlers import APIError
+from app.utils.singleflight import SingleFlight
+
+def _service(generate):
+    service = GenerationService(MagicMock(), cache=GenerationCache(max_entries=16, ttl_seconds=60))
+    service.text_service = MagicMock()
+    service.text_service.generate = generate
+    return service
+
+async def test_identical_concurrent_requests_share_one_call(mock_db):
+    calls = 0
+
+    async def generate(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "Shared post"
+
+    service = _service(generate)
+    results = await asyncio.gather(*[
+        service.generate_text("tech", "Test objective", "Test context") for _ in range(5)
+    ])
+
+    assert results == ["Shared post"] * 5
+    assert calls == 1
+    assert await db.generation_leases_collection.count_documents({}) == 0
+
+async def test_follower_waits_for_lease_held_by_other_worker(mock_db):
+    async def generate(*args, **kwargs):
+        raise AssertionError("follower must not call upstream")
+
+    service = _service(generate)
+    key = service._text_cache_key("tech", "Test objective", "Test context", None)
+    await db.generation_leases_collection.insert_one({
+        "_id": key,
+        "owner": "other-worker",
+        "expires_at": datetime.utcnow() + timedelta(seconds=60)
+    })
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.1)
+        await GenerationCache().set(key, "Post from other worker")
+        await db.generation_leases_collection.delete_one({"_id": key})
+
+    result, _ = await asyncio.gather(
+        service.generate_text("tech", "Test objective", "Test context"),
+        other_worker_finishes()
+    )
+    assert result == "Post from other worker"
+
+async def test_follower_stops_waiting_at_the_request_deadline(mock_db):
+    async def generate(*args, **kwargs):
+        raise AssertionError("follower must not call upstream")
+
+    service = _service(generate)
+    key = service._text_cache_key("tech", "Test objective", "Test context", None)
+    await db.generation_leases_collection.insert_one({
+        "_id": key,
+        "owner": "other-worker",
+        "expires_at": datetime.utcnow() + timedelta(seconds=60)
+    })
+
+    loop = asyncio.get_running_loop()
+    token = _request_deadline.set(loop.time() + 0.1)
+    try:
+        start = loop.time()
+        with pytest.raises(APIError) as exc_info:
+            await service.generate_text("tech", "Test objective", "Test context")
+    finally:
+        _request_deadline.reset(token)
+    assert exc_info.value.status_code == 504
+    assert loop.time() - start < 1
+
+async def test_shared_call_is_cancelled_with_its_last_waiter():
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    single_flight = SingleFlight()
+    first = asyncio.ensure_future(single_flight.do("key", slow))
+    second = asyncio.ensure_future(single_flight.do("key", slow))
+    await started.wait()
+
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    second.cancel()
+    await asyncio.gather(second, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert cancelled.is_set()
+    assert single_flight.stats()["in_flight"] == 0 and single_flight.stats()["cancelled"] == 1
+
+async def test_open_circuit_serves_previous_post(mock_db):
+    async def generate(*args, **kwargs):
+        raise APIError("AI service is temporarily unavailable", 503, details={"reason": "circuit_open"})
+
+    service = _service(generate)
+    await db.posts_collection.insert_one({
+        "user_id": "user-1",
+        "template": "tech",
+        "objective": "Test objective",
+        "context": "Older context",
+        "generated_content": "Earlier post",
+        "created_at": datetime.utcnow()
+    })
+
+    result = await service.generate_text("tech", "Test objective", "Test context", user_id="user-1")
+    assert result == "Earlier post"
+
+    with pytest.raises(APIError):
+        await service.generate_text("tech", "Test objective", "Test context", user_id="user-2")
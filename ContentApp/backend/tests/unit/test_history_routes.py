@@ -0,0 +1,127 @@
+import csv
+import gzip
+import io
+import json
+import httpx # type: ignore
+from datetime import datetime
+import pytest # type: ignore
+from app.appmain import app
+from app.services.post_service import PostService
+from app.database import db
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+async def test_history_revalidates_with_etag(mock_db, auth_token, monkeypatch):
+    await PostService.create_post({
+        "template": "tech-insight",
+        "objective": "Test",
+        "context": "Context",
+        "generated_content": "Content"
+    }, "test_user_id")
+
+    async with _client() as client:
+        first = await client.get("/api/history", headers={"Authorization": auth_token})
+        assert first.status_code == 200
+        assert first.headers["Cache-Control"] == "private, no-cache"
+        etag = first.headers["ETag"]
+
+        async def must_not_load(*args, **kwargs):
+            raise AssertionError("a 304 must not read posts")
+
+        monkeypatch.setattr(PostService, "get_user_posts", must_not_load)
+        second = await client.get("/api/history", headers={"Authorization": auth_token, "If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.headers["ETag"] == etag
+        monkeypatch.undo()
+
+        await PostService.create_post({
+            "template": "tech-insight",
+            "objective": "Another",
+            "context": "Context",
+            "generated_content": "Content"
+        }, "test_user_id")
+        third = await client.get("/api/history", headers={"Authorization": auth_token, "If-None-Match": etag})
+        assert third.status_code == 200
+        assert third.headers["ETag"] != etag
+        assert third.json()["total"] == 2
+
+async def test_post_resource_supports_conditional_get(mock_db, auth_token):
+    post = await PostService.create_post({
+        "template": "tech-insight",
+        "objective": "Test",
+        "context": "Context",
+        "generated_content": "Content"
+    }, "test_user_id")
+
+    async with _client() as client:
+        first = await client.get(f"/api/posts/{post.id}", headers={"Authorization": auth_token})
+        assert first.status_code == 200 and first.json()["objective"] == "Test"
+        second = await client.get(f"/api/posts/{post.id}", headers={"Authorization": auth_token, "If-None-Match": first.headers["ETag"]})
+        assert second.status_code == 304
+
+        missing = await client.get("/api/posts/000000000000000000000000", headers={"Authorization": auth_token})
+        assert missing.status_code == 404
+
+async def _seed_export_posts():
+    for i, template in enumerate(["tech-insight", "career-story", "tech-insight"]):
+        await db.posts_collection.insert_one({
+            "user_id": "test_user_id",
+            "template": template,
+            "objective": f"Objective {i}",
+            "context": "Context",
+            "generated_content": "=SUM(A1:A2)" if i == 1 else f"Content {i}",
+            "created_at": datetime(2024, 1, 1 + i)
+        })
+
+async def test_export_streams_ndjson_with_filters(mock_db, auth_token):
+    await _seed_export_posts()
+    async with _client() as client:
+        response = await client.get(
+            "/api/history/export",
+            params={"template": "tech-insight", "since": "2024-01-01T00:00:00", "batch_size": 1},
+            headers={"Authorization": auth_token}
+        )
+    assert response.status_code == 200
+    assert response.headers["Content-Disposition"] == 'attachment; filename="posts.ndjson"'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["objective"] for row in rows] == ["Objective 0", "Objective 2"]
+    assert rows[0]["created_at"] == "2024-01-01T00:00:00"
+
+async def test_export_csv_gzip(mock_db, auth_token):
+    await _seed_export_posts()
+    async with _client() as client:
+        response = await client.get(
+            "/api/history/export",
+            params={"format": "csv", "gzip": "true", "until": "2024-01-03T00:00:00"},
+            headers={"Authorization": auth_token}
+        )
+    assert response.headers["Content-Type"] == "application/gzip"
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.content).decode("utf-8-sig"))))
+    assert rows[0][:3] == ["_id", "template", "objective"]
+    assert len(rows) == 3
+    # Formula-looking cells are neutralised for spreadsheet apps
+    assert rows[2][4] == "'=SUM(A1:A2)"
+
+async def test_export_accepts_timezone_aware_bounds(mock_db, auth_token):
+    await _seed_export_posts()
+    async with _client() as client:
+        response = await client.get(
+            "/api/history/export",
+            # 2024-01-01T23:00 UTC, mixed with a naive bound
+            params={"since": "2024-01-02T01:00:00+02:00", "until": "2024-01-03T00:00:00"},
+            headers={"Authorization": auth_token}
+        )
+        reversed_bounds = await client.get(
+            "/api/history/export",
+            params={"since": "2024-01-03T00:00:00Z", "until": "2024-01-02T00:00:00"},
+            headers={"Authorization": auth_token}
+        )
+    assert response.status_code == 200
+    assert [json.loads(line)["objective"] for line in response.text.splitlines()] == ["Objective 1"]
+    assert reversed_bounds.status_code == 400
+
+async def test_export_rejects_unknown_format(mock_db, auth_token):
+    async with _client() as client:
+        response = await client.get("/api/history/export", params={"format": "xml"}, headers={"Authorization": auth_token})
+    assert response.status_code == 400
@@ -0,0 +1,130 @@
+import asyncio
+import pytest # type: ignore
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, AsyncMock
+from app.config import settings
+from app.services.image_job_service import ImageJobService
+from app.services.post_service import PostService
+from app.database import db
+
+def _service(generate_image):
+    generation_service = MagicMock()
+    generation_service.generate_image = generate_image
+    return ImageJobService(generation_service, PostService(), workers=1)
+
+async def test_submitted_job_runs_and_can_be_long_polled(mock_db):
+    service = _service(AsyncMock(return_value="http://images/1.png"))
+    await service.start()
+    try:
+        job = await service.submit("tech-insight", "Test objective", "Test context", "test_user")
+        assert job["status"] == "queued"
+
+        result = await service.get_job(job["job_id"], "test_user", wait=5)
+        assert result["status"] == "succeeded"
+        assert result["result"]["image_url"] == "http://images/1.png"
+        assert await db.posts_collection.count_documents({"type": "image"}) == 1
+    finally:
+        await service.stop()
+
+async def test_failed_job_records_error(mock_db):
+    service = _service(AsyncMock(side_effect=ValueError("upstream failed")))
+    await service.start()
+    try:
+        job = await service.submit("tech-insight", "Test objective", "Test context", "test_user")
+        result = await service.get_job(job["job_id"], "test_user", wait=5)
+        assert result["status"] == "failed"
+        assert "upstream failed" in result["error"]
+    finally:
+        await service.stop()
+
+async def test_queued_jobs_are_recovered_on_start(mock_db):
+    service = _service(AsyncMock(return_value="http://images/2.png"))
+    await db.image_jobs_collection.insert_one({
+        "_id": "leftover",
+        "user_id": "test_user",
+        "template": "tech-insight",
+        "objective": "Test objective",
+        "context": "Test context",
+        "status": "queued",
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    })
+
+    await service.start()
+    try:
+        result = await service.get_job("leftover", "test_user", wait=5)
+        assert result["status"] == "succeeded"
+    finally:
+        await service.stop()
+
+def _running_job(job_id, attempts):
+    return {
+        "_id": job_id,
+        "user_id": "test_user",
+        "template": "tech-insight",
+        "objective": "Test objective",
+        "context": "Test context",
+        "status": "running",
+        "attempts": attempts,
+        "lease_expires_at": datetime.utcnow() - timedelta(seconds=1),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
+async def test_jobs_of_dead_workers_are_recovered_while_running(mock_db, monkeypatch):
+    monkeypatch.setattr(settings, "image_job_recovery_seconds", 0.05)
+    service = _service(AsyncMock(return_value="http://images/3.png"))
+    await service.start()
+    try:
+        # Stranded after startup, e.g. by another process that died mid-job
+        await db.image_jobs_collection.insert_many([_running_job("orphan", 1), _running_job("cursed", 3)])
+        result = await service.get_job("orphan", "test_user", wait=5)
+        assert result["status"] == "succeeded"
+        assert (await db.image_jobs_collection.find_one({"_id": "orphan"}))["attempts"] == 2
+
+        cursed = await service.get_job("cursed", "test_user")
+        assert cursed["status"] == "failed" and "3 attempts" in cursed["error"]
+    finally:
+        await service.stop()
+
+async def test_recovery_skips_jobs_already_queued(mock_db):
+    service = _service(AsyncMock(return_value="http://images/4.png"))
+    service.queue = asyncio.Queue(maxsize=10)
+    await db.image_jobs_collection.insert_one({**_running_job("waiting", 0), "status": "queued"})
+
+    assert await service.recover_jobs() == 1
+    assert await service.recover_jobs() == 0
+    assert service.queue.qsize() == 1
+
+async def test_lease_is_renewed_while_a_job_runs(mock_db, monkeypatch):
+    monkeypatch.setattr(settings, "image_job_lease_seconds", 0.15)
+    monkeypatch.setattr(settings, "image_job_recovery_seconds", 0.05)
+
+    async def slow_generate_image(**kwargs):
+        await asyncio.sleep(0.5)
+        return "http://images/5.png"
+
+    service = _service(slow_generate_image)
+    await service.start()
+    try:
+        job = await service.submit("tech-insight", "Test objective", "Test context", "test_user")
+        result = await service.get_job(job["job_id"], "test_user", wait=5)
+        assert result["status"] == "succeeded"
+        # Recovery never saw the lease lapse, so the job ran once
+        assert (await db.image_jobs_collection.find_one({"_id": job["job_id"]}))["attempts"] == 1
+    finally:
+        await service.stop()
+
+async def test_long_polls_that_time_out_leave_no_events(mock_db):
+    service = _service(AsyncMock(return_value="http://images/6.png"))
+    # Never started, so the job stays queued
+    service.queue = asyncio.Queue(maxsize=10)
+    job = await service.submit("tech-insight", "Test objective", "Test context", "test_user")
+
+    results = await asyncio.gather(
+        service.get_job(job["job_id"], "test_user", wait=0.1),
+        service.get_job(job["job_id"], "test_user", wait=0.2)
+    )
+    assert [result["status"] for result in results] == ["queued", "queued"]
+    assert service._done_events == {} and service._done_waiters == {}
@@ -0,0 +1,46 @@
+import hashlib
+import pytest # type: ignore
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routes import images
+from app.services.image_store_service import ImageStoreService
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+@pytest.fixture
+def stored_image(tmp_path, monkeypatch):
+    store = ImageStoreService(root=str(tmp_path))
+    digest = hashlib.sha256(PNG_BYTES).hexdigest()
+    path = store.path_for(digest)
+    (tmp_path / digest[:2] / digest[2:4]).mkdir(parents=True)
+    with open(path, "wb") as f:
+        f.write(PNG_BYTES)
+    monkeypatch.setattr(images.generation_service, "image_store", store)
+
+    app = FastAPI()
+    app.include_router(images.router)
+    return TestClient(app), digest
+
+def test_image_is_served_with_immutable_caching(stored_image):
+    client, digest = stored_image
+    response = client.get(f"/api/images/{digest}")
+
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+    assert response.headers["content-type"] == "image/png"
+    assert "immutable" in response.headers["cache-control"]
+
+    cached = client.get(f"/api/images/{digest}", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+def test_image_range_request(stored_image):
+    client, digest = stored_image
+    response = client.get(f"/api/images/{digest}", headers={"Range": "bytes=8-15"})
+
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[8:16]
+    assert response.headers["content-range"] == f"bytes 8-15/{len(PNG_BYTES)}"
+
+def test_unknown_image_returns_404(stored_image):
+    client, _ = stored_image
+    assert client.get("/api/images/not-a-digest").status_code == 404
@@ -0,0 +1,155 @@
+import asyncio
+import io
+import json
+import os
+from unittest.mock import MagicMock
+import httpx # type: ignore
+import numpy as np # type: ignore
+import pytest # type: ignore
+from fastapi import UploadFile
+from app.appmain import app
+from app.config import settings
+from app.database import db
+from app.controllers.post_controller import PostController
+from app.routes import api
+from app.services.file_service import FileService
+from app.services.library_service import LibraryService, _release_rows, _take_rows
+from app.utils.error_handlers import APIError
+from app.services.post_service import PostService
+from app.services.summary_service import SummaryService
+from app.utils.vector_index import VectorFile, embed_texts
+
+BRAND = "Brand voice: we write in a warm, direct tone.\n\nAvoid jargon and never use exclamation marks."
+PRODUCT = "The Acme widget ships in May.\n\nPricing starts at 20 dollars per seat for small teams."
+
+def _upload(name: str, text: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(text.encode()), filename=name)
+
+@pytest.fixture
+def library(mock_db, tmp_path, monkeypatch):
+    # Small chunks so each paragraph is retrieved on its own
+    monkeypatch.setattr(settings, "document_chunk_tokens", 15)
+    return LibraryService(FileService(), root=str(tmp_path))
+
+def test_vector_file_appends_rows_and_masks_deleted_ones(tmp_path):
+    texts = ["pricing per seat", "brand tone of voice", "pricing tiers for teams"]
+    vector_file = VectorFile(str(tmp_path / "vectors.f32"), 256)
+    vector_file.write(0, embed_texts(texts[:2], 256))
+    vector_file.write(2, embed_texts(texts[2:], 256))
+    assert vector_file.rows() == 3
+
+    query = embed_texts(["pricing for teams"], 256)[0]
+    hits = vector_file.search(query, np.ones(3, dtype=bool), k=2)
+    assert [row for row, _ in hits] == [2, 0]
+
+    alive = np.array([True, True, False])
+    assert [row for row, _ in vector_file.search(query, alive, k=2)] == [0]
+
+async def test_retrieves_relevant_chunks_and_forgets_deleted_documents(library):
+    brand, product = await library.add_documents("user_a", [_upload("brand.txt", BRAND), _upload("product.txt", PRODUCT)])
+    # The second document starts where the first ended
+    ranges = {doc["filename"]: doc["ranges"] for doc in await db.library_documents_collection.find().to_list(length=None)}
+    assert ranges["product.txt"][0][0] == sum(ranges["brand.txt"][0])
+    again = await library.add_documents("user_a", [_upload("copy.txt", BRAND)])
+    assert again[0]["_id"] == brand["_id"]
+
+    texts = await library.retrieve("user_a", "pricing per seat for teams", k=1)
+    assert texts == ["Pricing starts at 20 dollars per seat for small teams."]
+    assert await library.retrieve("user_b", "pricing per seat") == []
+
+    assert await library.delete_document("user_a", product["_id"])
+    assert all("Pricing" not in text for text in await library.retrieve("user_a", "pricing per seat for teams"))
+
+    # The deleted document was at the end, so the next one takes over its rows
+    pricing = await library.add_documents("user_a", [_upload("pricing.txt", "Enterprise pricing is per seat, billed yearly.")])
+    assert (await db.library_documents_collection.find_one({"filename": "pricing.txt"}))["ranges"] == [[ranges["product.txt"][0][0], 1]]
+    texts = await library.retrieve("user_a", "pricing per seat", k=1)
+    assert texts == ["Enterprise pricing is per seat, billed yearly."]
+    assert pricing[0]["chunks"] == 1
+
+async def test_lost_vector_file_is_rebuilt_from_stored_chunks(library, tmp_path):
+    await library.add_documents("user_a", [_upload("brand.txt", BRAND)])
+    os.remove(library._vector_file("user_a").path)
+
+    # A fresh process adds a document on top of the lost file, leaving a hole where the old rows were
+    restarted = LibraryService(FileService(), root=str(tmp_path))
+    await restarted.add_documents("user_a", [_upload("product.txt", PRODUCT)])
+    texts = await restarted.retrieve("user_a", "warm direct tone of voice", k=1)
+    assert texts == ["Brand voice: we write in a warm, direct tone."]
+    assert restarted._vector_file("user_a").missing_rows(np.ones(restarted._vector_file("user_a").rows(), dtype=bool)).size == 0
+
+async def test_concurrent_adds_of_the_same_text_keep_one_document(library):
+    await db.library_documents_collection.create_index([("user_id", 1), ("sha256", 1)], unique=True)
+    first, second = await asyncio.gather(
+        library.add_documents("user_a", [_upload("brand.txt", BRAND)]),
+        library.add_documents("user_a", [_upload("copy.txt", BRAND)])
+    )
+    assert first[0]["_id"] == second[0]["_id"]
+    assert await db.library_documents_collection.count_documents({}) == 1
+    # The loser's chunks and rows were given back
+    document = await db.library_documents_collection.find_one()
+    assert await db.library_chunks_collection.count_documents({}) == document["row_count"]
+    index = await db.library_indexes_collection.find_one({"_id": "user_a"})
+    assert sum(size for _, size in index["free"]) + document["row_count"] == index["rows"]
+
+def test_rows_are_taken_from_freed_ranges_first():
+    taken, free, end = _take_rows([[2, 3], [10, 2]], 20, 6)
+    assert (taken, free, end) == ([[2, 3], [10, 2], [20, 1]], [], 21)
+    assert _take_rows([[2, 3]], 20, 2) == ([[2, 2]], [[4, 1]], 20)
+
+    # Adjacent ranges merge, and a free tail gives its rows back to the end
+    assert _release_rows([[2, 3]], 20, [[5, 2], [18, 2]]) == ([[2, 5]], 18)
+
+async def test_deleted_documents_make_room_in_a_full_library(library, monkeypatch):
+    monkeypatch.setattr(settings, "library_max_rows", 3)
+    brand = (await library.add_documents("user_a", [_upload("brand.txt", BRAND)]))[0]
+    with pytest.raises(APIError) as exc_info:
+        await library.add_documents("user_a", [_upload("product.txt", PRODUCT)])
+    assert exc_info.value.status_code == 413
+
+    assert await library.delete_document("user_a", brand["_id"])
+    await library.add_documents("user_a", [_upload("product.txt", PRODUCT)])
+    assert await library.retrieve("user_a", "pricing per seat for teams")
+
+async def test_failed_add_releases_its_rows(library, monkeypatch):
+    async def failing_insert(document):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(db.library_documents_collection, "insert_one", failing_insert)
+    with pytest.raises(RuntimeError):
+        await library.add_documents("user_a", [_upload("brand.txt", BRAND)])
+
+    index = await db.library_indexes_collection.find_one({"_id": "user_a"})
+    assert index["rows"] == 0 and index["free"] == []
+    assert await db.library_chunks_collection.count_documents({}) == 0
+
+async def test_library_routes(library, auth_token, monkeypatch):
+    monkeypatch.setattr(api, "library_service", library)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        headers = {"Authorization": auth_token}
+        added = await client.post("/api/library", headers=headers, files={"documents": ("brand.txt", BRAND.encode())})
+        assert added.status_code == 200
+        document_id = added.json()["documents"][0]["_id"]
+
+        listed = await client.get("/api/library", headers=headers)
+        assert [doc["_id"] for doc in listed.json()["documents"]] == [document_id]
+
+        assert (await client.delete(f"/api/library/{document_id}", headers=headers)).status_code == 200
+        assert (await client.delete(f"/api/library/{document_id}", headers=headers)).status_code == 404
+
+async def test_generation_can_use_the_library(library):
+    await library.add_documents("user_a", [_upload("product.txt", PRODUCT)])
+    seen = []
+
+    async def fake_stream(template, objective, context, document_texts, **kwargs):
+        seen.append(document_texts)
+        yield "Post"
+
+    generation_service = MagicMock()
+    generation_service.generate_text_stream = fake_stream
+    generation_service.summaries = SummaryService(MagicMock())
+    controller = PostController(PostService(), generation_service, library.file_service, library)
+
+    events = await controller.generate_post_stream("tech-insight", "Seat pricing", "Small teams", [], "user_a", use_library=True)
+    assert [json.loads(line)["type"] async for line in events][-1] == "done"
+    assert any("per seat" in text for text in seen[0])
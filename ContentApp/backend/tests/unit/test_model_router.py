@@ -0,0 +1,48 @@
+import httpx
+import pytest # type: ignore
+from unittest.mock import MagicMock
+from openai import RateLimitError, BadRequestError
+from app.services.model_router import ModelRouter, ModelBackend
+
+def _error(cls, status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "http://backend"))
+    return cls("error", response=response, body=None)
+
+def _backend(name):
+    return ModelBackend(name=name, client=MagicMock())
+
+async def test_router_fails_over_on_rate_limit():
+    primary, secondary = _backend("primary"), _backend("secondary")
+    router = ModelRouter([primary, secondary])
+
+    async def call(backend):
+        if backend is primary:
+            raise _error(RateLimitError, 429, {"retry-after": "20"})
+        return "ok"
+
+    assert await router.call("chat", call) == "ok"
+    assert router.failovers == 1
+    assert primary.in_cooldown()
+    # The throttled backend is now ranked last
+    assert router.ranked()[0] is secondary
+
+async def test_router_prefers_faster_backend():
+    slow, fast = _backend("slow"), _backend("fast")
+    slow.record_success(3.0)
+    fast.record_success(0.5)
+    router = ModelRouter([slow, fast])
+
+    assert router.ranked()[0] is fast
+
+async def test_router_does_not_fail_over_on_client_errors():
+    primary, secondary = _backend("primary"), _backend("secondary")
+    router = ModelRouter([primary, secondary])
+    called = []
+
+    async def call(backend):
+        called.append(backend.name)
+        raise _error(BadRequestError, 400)
+
+    with pytest.raises(BadRequestError):
+        await router.call("chat", call)
+    assert called == ["primary"]
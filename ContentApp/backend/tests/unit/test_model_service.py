@@ -1,5 +1,9 @@
+import httpx
 import pytest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
+from openai import RateLimitError
+from app.services.model_router import ModelBackend, ModelRouter
 from app.services.model_service import ModelService
 from app.utils.error_handlers import APIError
 
@@ -23,3 +27,42 @@ def test_get_model_without_client():
         service.get_model()
     assert exc_info.value.status_code == 500
     assert "OpenAI client not initialized" in str(exc_info.value)
+
+async def test_failed_over_calls_are_charged_to_the_scheduler():
+    service = ModelService()
+    throttled = httpx.Response(429, request=httpx.Request("POST", "http://backend"))
+
+    async def rate_limited(**kwargs):
+        raise RateLimitError("slow down", response=throttled, body=None)
+
+    async def completed(**kwargs):
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=30), choices=[])
+
+    primary, secondary = ModelBackend(name="primary", client=MagicMock()), ModelBackend(name="secondary", client=MagicMock())
+    primary.client.chat.completions.create = rate_limited
+    secondary.client.chat.completions.create = completed
+    service.router = ModelRouter([primary, secondary])
+
+    await service.create_chat_completion([{"role": "user", "content": "hello"}])
+    stats = service.scheduler.stats()
+    # The throttled call costs a request and its prompt on top of the winner's usage
+    assert stats["requests_last_minute"] == 2
+    assert stats["tokens_used_last_minute"] > 30
+
+async def test_image_calls_take_a_ticket_and_keep_an_explicit_model():
+    service = ModelService()
+    models = []
+
+    async def generate(**kwargs):
+        models.append(kwargs["model"])
+        return SimpleNamespace(data=[SimpleNamespace(url="http://images/1.png")])
+
+    backend = ModelBackend(name="primary", client=MagicMock(), image_model="backend-image-model")
+    backend.client.images.generate = generate
+    service.router = ModelRouter([backend])
+
+    await service.generate_image("a chart", model="dall-e-3", user_id="user")
+    await service.generate_image("a chart", user_id="user")
+    assert models == ["dall-e-3", "backend-image-model"]
+    stats = service.scheduler.stats()
+    assert stats["requests_last_minute"] == 2 and stats["tokens_used_last_minute"] == 0
@@ -0,0 +1,56 @@
+import json
+import pytest # type: ignore
+from unittest.mock import MagicMock, AsyncMock
+from app.controllers.post_controller import PostController
+from app.services.post_service import PostService
+from app.services.summary_service import SummaryService
+from app.database import db
+
+def _controller(deltas):
+    async def fake_stream(*args, **kwargs):
+        for delta in deltas:
+            yield delta
+
+    generation_service = MagicMock()
+    generation_service.generate_text_stream = fake_stream
+    generation_service.summaries = SummaryService(MagicMock())
+    file_service = MagicMock()
+    file_service.process_files = AsyncMock(return_value=[])
+    return PostController(PostService(), generation_service, file_service)
+
+async def test_generate_post_stream_emits_deltas_and_persists(mock_db):
+    controller = _controller(["Hello", " world"])
+
+    events = await controller.generate_post_stream("tech-insight", "Test objective", "Test context", [], "test_user")
+    lines = [json.loads(line) async for line in events]
+
+    assert [e["content"] for e in lines if e["type"] == "delta"] == ["Hello", " world"]
+    assert lines[-1]["type"] == "done"
+    assert lines[-1]["post"] == "Hello world"
+    assert await db.posts_collection.count_documents({"user_id": "test_user"}) == 1
+
+async def test_generate_post_stream_rejects_invalid_template(mock_db):
+    controller = _controller([])
+
+    with pytest.raises(Exception) as exc_info:
+        await controller.generate_post_stream("unknown", "Test objective", "Test context", [], "test_user")
+    assert exc_info.value.status_code == 400
+
+async def test_generate_posts_batch_reports_per_item_results(mock_db):
+    async def fake_variants(template, objective, context, document_texts, n=1, user_id="anonymous"):
+        if "startup" in template:
+            raise ValueError("upstream failed")
+        return [f"Draft {i}" for i in range(n)]
+
+    controller = _controller([])
+    controller.generation_service.generate_text_variants = fake_variants
+
+    result = await controller.generate_posts_batch(
+        ["tech-insight", "startup-story"], "Test objective", "Test context", [], "test_user", variants=2
+    )
+
+    assert result["succeeded"] == 2
+    assert result["failed"] == 1
+    assert [r["post"] for r in result["results"] if "post" in r] == ["Draft 0", "Draft 1"]
+    assert controller.file_service.process_files.await_count == 1
+    assert await db.posts_collection.count_documents({"user_id": "test_user"}) == 2
@@ -3,6 +3,9 @@ from datetime import datetime
 from app.services.post_service import PostService
 from app.models import StoredPost
 from bson import ObjectId
+from app.utils.error_handlers import APIError
+from app.database import db
+from app.services.history_cache import history_cache
 
 async def test_create_post(mock_db):
     post_data = {
@@ -68,3 +71,80 @@ async def test_delete_post(mock_db):
     # Verify post was deleted
     post = await mock_db.posts_collection.find_one({"_id": post_id})
     assert post is None
+
+async def test_get_user_posts_with_cursor(mock_db):
+    created_at = datetime(2024, 1, 1)
+    # Five posts share a timestamp so the _id tie-breaker is exercised
+    await db.posts_collection.insert_many([
+        {
+            "user_id": "test_user",
+            "template": "tech-insight",
+            "objective": f"Test {i}",
+            "context": "Context",
+            "generated_content": f"Content {i}",
+            "created_at": created_at if i < 5 else datetime(2024, 1, 2)
+        }
+        for i in range(7)
+    ])
+
+    first = await PostService.get_user_posts("test_user", limit=3, cursor="", include_total=True)
+    second = await PostService.get_user_posts("test_user", limit=3, cursor=first["nextCursor"])
+    third = await PostService.get_user_posts("test_user", limit=3, cursor=second["nextCursor"])
+
+    seen = [post["_id"] for page in (first, second, third) for post in page["posts"]]
+    assert len(seen) == len(set(seen)) == 7
+    assert first["total"] == 7 and first["prevCursor"] is None
+    assert "total" not in second
+    assert third["nextCursor"] is None
+
+    back = await PostService.get_user_posts("test_user", limit=3, cursor=second["prevCursor"])
+    assert [post["_id"] for post in back["posts"]] == [post["_id"] for post in first["posts"]]
+
+async def test_offset_page_continues_with_cursor_over_tied_timestamps(mock_db):
+    created_at = datetime(2024, 1, 1)
+    await db.posts_collection.insert_many([
+        {
+            "user_id": "test_user",
+            "template": "tech-insight",
+            "objective": f"Batch {i}",
+            "context": "Context",
+            "generated_content": f"Content {i}",
+            "created_at": created_at
+        }
+        for i in range(6)
+    ])
+
+    first = await PostService.get_user_posts("test_user", limit=3, skip=0)
+    second = await PostService.get_user_posts("test_user", limit=3, cursor=first["nextCursor"])
+
+    seen = [post["_id"] for page in (first, second) for post in page["posts"]]
+    assert len(seen) == len(set(seen)) == 6
+    assert seen == sorted(seen, reverse=True)
+
+async def test_get_user_posts_rejects_bad_cursor(mock_db):
+    with pytest.raises(APIError) as exc_info:
+        await PostService.get_user_posts("test_user", limit=3, cursor="not-a-cursor")
+    assert exc_info.value.status_code == 400
+
+async def test_get_user_posts_is_cached_until_posts_change(mock_db):
+    await PostService.create_post({
+        "template": "tech-insight",
+        "objective": "First",
+        "context": "Context",
+        "generated_content": "Content"
+    }, "test_user")
+    stats = history_cache.stats()
+
+    first = await PostService.get_user_posts("test_user", limit=10, skip=0)
+    again = await PostService.get_user_posts("test_user", limit=10, skip=0)
+    assert again == first
+    assert history_cache.stats()["hits"] == stats["hits"] + 1
+
+    # Any worker's write bumps the version, so the cached page is bypassed
+    await PostService.create_post({
+        "template": "tech-insight",
+        "objective": "Second",
+        "context": "Context",
+        "generated_content": "Content"
+    }, "test_user")
+    assert (await PostService.get_user_posts("test_user", limit=10, skip=0))["total"] == 2
@@ -0,0 +1,135 @@
+import asyncio
+import pytest # type: ignore
+from pymongo.errors import AutoReconnect
+from bson import ObjectId
+from app.config import settings
+from app.services import post_service as post_service_module
+from app.services.post_service import PostService
+from app.services.post_write_buffer import PostWriteBuffer
+from app.database import db
+from app.utils.error_handlers import APIError
+
+def _post(objective):
+    return {"template": "tech-insight", "objective": objective, "context": "Context", "generated_content": f"Content about {objective}"}
+
+@pytest.fixture
+async def buffer(mock_db, monkeypatch):
+    buffer = PostWriteBuffer(max_batch=2, flush_interval=5.0, max_pending=2)
+    monkeypatch.setattr(post_service_module, "post_write_buffer", buffer)
+    await buffer.start()
+    yield buffer
+    await buffer.stop()
+
+async def test_buffered_posts_are_visible_before_flush(buffer):
+    post = await PostService.create_post(_post("Kubernetes"), "test_user")
+    assert await db.posts_collection.count_documents({}) == 0
+
+    history = await PostService.get_user_posts("test_user", limit=10, skip=0)
+    assert [p["_id"] for p in history["posts"]] == [post.id]
+    assert history["total"] == 1
+
+    found = await PostService.get_user_posts("test_user", limit=10, search="kube")
+    assert [p["_id"] for p in found["posts"]] == [post.id]
+
+async def test_flushes_with_insert_many_on_batch_size(buffer):
+    await PostService.create_posts([_post("One"), _post("Two")], "test_user")
+    for _ in range(50):
+        if buffer.flushed == 2:
+            break
+        await asyncio.sleep(0.01)
+
+    assert buffer.batches == 1
+    assert await db.posts_collection.count_documents({"user_id": "test_user"}) == 2
+    assert (await db.post_versions_collection.find_one({"_id": "test_user"}))["version"] == 1
+    assert (await PostService.get_user_posts("test_user", limit=10, skip=0))["total"] == 2
+
+async def test_writers_wait_when_buffer_is_full(buffer, monkeypatch):
+    release = asyncio.Event()
+    insert_many = db.posts_collection.insert_many
+
+    async def slow_insert_many(posts, **kwargs):
+        await release.wait()
+        return await insert_many(posts, **kwargs)
+
+    monkeypatch.setattr(db.posts_collection, "insert_many", slow_insert_many)
+    buffer.max_batch = 1
+    await PostService.create_post(_post("In flight"), "test_user")
+    await asyncio.sleep(0.01)
+    await PostService.create_posts([_post("Queued 1"), _post("Queued 2")], "test_user")
+
+    blocked = asyncio.ensure_future(PostService.create_post(_post("Blocked"), "test_user"))
+    await asyncio.sleep(0.05)
+    assert not blocked.done()
+
+    release.set()
+    await blocked
+    await buffer.stop()
+    assert await db.posts_collection.count_documents({"user_id": "test_user"}) == 4
+
+async def test_stop_drains_and_skips_deleted_posts(buffer):
+    kept = await PostService.create_post(_post("Kept"), "test_user")
+    removed = await PostService.create_post(_post("Removed"), "test_user")
+    assert await PostService.delete_post(removed.id, "test_user")
+
+    await buffer.stop()
+    assert not buffer.running
+    stored = await db.posts_collection.find({"user_id": "test_user"}).to_list(length=10)
+    assert [str(post["_id"]) for post in stored] == [kept.id]
+
+async def test_failed_batches_are_retried_until_written(buffer, monkeypatch):
+    monkeypatch.setattr(settings, "post_write_retry_max_delay", 0.01)
+    insert_many = db.posts_collection.insert_many
+    failures = 0
+
+    async def flaky_insert_many(posts, **kwargs):
+        nonlocal failures
+        if failures < 8:
+            failures += 1
+            raise AutoReconnect("connection refused")
+        return await insert_many(posts, **kwargs)
+
+    monkeypatch.setattr(db.posts_collection, "insert_many", flaky_insert_many)
+    post = await PostService.create_post(_post("Outage"), "test_user")
+    await asyncio.sleep(0.03)
+    # Still shown to its author while the database is unreachable
+    assert buffer.is_pending("test_user", post.id)
+
+    await buffer.stop()
+    assert failures == 8 and buffer.retries == 8
+    assert await db.posts_collection.count_documents({"user_id": "test_user"}) == 1
+
+async def test_a_post_the_database_rejects_does_not_hold_up_the_batch(buffer):
+    buffer.max_batch = 3
+    poison = {**_post("Poison"), "a\u0000b": 1}
+    await PostService.create_posts([_post("Before"), poison, _post("After")], "test_user")
+    await buffer.stop()
+
+    stored = await db.posts_collection.find({"user_id": "test_user"}).to_list(length=10)
+    assert sorted(post["objective"] for post in stored) == ["After", "Before"]
+    assert buffer.rejected == 1 and buffer.retries == 0
+    assert buffer.pending_for("test_user") == []
+
+async def test_invalid_posts_are_rejected_before_they_are_buffered(buffer):
+    with pytest.raises(APIError) as exc_info:
+        await PostService.create_post({**_post("Bad template"), "template": "not-a-template"}, "test_user")
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.details["errors"][0]["field"] == "template"
+
+    with pytest.raises(APIError):
+        await PostService.create_posts([_post("Fine"), {"objective": "No content"}], "test_user")
+
+    await buffer.stop()
+    assert await db.posts_collection.count_documents({}) == 0
+
+async def test_pending_posts_are_only_visible_on_their_own_worker(buffer, monkeypatch):
+    other_worker = PostWriteBuffer(max_batch=2, flush_interval=5.0, max_pending=2)
+    post = await PostService.create_post(_post("Not flushed yet"), "test_user")
+    # Another worker process has its own buffer and only sees the post once it is written
+    monkeypatch.setattr(post_service_module, "post_write_buffer", other_worker)
+    assert (await PostService.get_user_posts("test_user", limit=10))["posts"] == []
+
+    monkeypatch.setattr(post_service_module, "post_write_buffer", buffer)
+    # Fills the batch, so it is flushed right away
+    waited = await buffer.submit([{**_post("Waited for"), "user_id": "test_user", "created_at": post.created_at}], wait=True)
+    # Written before submit returned, so any worker can read it
+    assert await db.posts_collection.count_documents({"_id": ObjectId(waited[0]["_id"])}) == 1
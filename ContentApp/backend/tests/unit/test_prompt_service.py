@@ -0,0 +1,94 @@
+import httpx # type: ignore
+import pytest # type: ignore
+from app.appmain import app
+from app.services import post_service as post_service_module
+from app.services.post_service import PostService
+from app.services.post_write_buffer import PostWriteBuffer
+from app.services.prompt_service import PromptService, prompt_key, prompt_service
+from app.database import db
+
+def _post(template="tech-insight", objective="Launch", context="New product"):
+    return {"template": template, "objective": objective, "context": context, "generated_content": "Content"}
+
+@pytest.fixture
+async def buffer(mock_db, monkeypatch):
+    buffer = PostWriteBuffer(max_batch=10, flush_interval=5.0, max_pending=10)
+    monkeypatch.setattr(post_service_module, "post_write_buffer", buffer)
+    await buffer.start()
+    yield buffer
+    await buffer.stop()
+
+def test_prompt_key_ignores_case_and_whitespace():
+    assert prompt_key("a", "tech-insight", "Launch  plan", "New\nproduct") == prompt_key("a", "tech-insight", " launch plan", "new product")
+    assert prompt_key("a", "tech-insight", "Launch", "New product") != prompt_key("a", "startup-story", "Launch", "New product")
+    assert prompt_key("a", "tech-insight", "Launch", "New product") != prompt_key("b", "tech-insight", "Launch", "New product")
+
+async def test_posts_share_one_prompt_and_drop_its_context(buffer):
+    first = await PostService.create_post(_post(), "test_user")
+    await PostService.create_posts([_post(), _post(template="startup-story")], "test_user")
+    # The prompt id is known up front; prompts are only written with the posts
+    assert first.prompt_id == prompt_key("test_user", "tech-insight", "Launch", "New product")
+    assert await db.prompts_collection.count_documents({}) == 0
+    await buffer.stop()
+
+    prompt = await db.prompts_collection.find_one({"_id": first.prompt_id})
+    assert prompt["use_count"] == 2
+    assert await db.prompts_collection.count_documents({}) == 2
+    assert first.context == "New product"
+
+    stored = await db.posts_collection.find({"user_id": "test_user"}).to_list(length=10)
+    assert all("context" not in post and post["prompt_id"] for post in stored)
+
+    # Reads fill the context back in
+    prompt_service.clear()
+    history = await PostService.get_user_posts("test_user", limit=10)
+    assert [post["context"] for post in history["posts"]] == ["New product"] * 3
+    assert (await PostService.get_post(first.id, "test_user"))["context"] == "New product"
+
+async def test_near_duplicate_keeps_its_exact_context(buffer):
+    await PostService.create_post(_post(context="New product"), "test_user")
+    second = await PostService.create_post(_post(context="new  PRODUCT"), "test_user")
+    await buffer.stop()
+
+    stored = await db.posts_collection.find_one({"prompt_id": second.prompt_id, "context": {"$exists": True}})
+    assert stored["context"] == "new  PRODUCT"
+    assert (await db.prompts_collection.find_one({"_id": second.prompt_id}))["use_count"] == 2
+
+async def test_unbuffered_posts_record_use_in_the_background(mock_db):
+    post = await PostService.create_post(_post(), "test_user")
+    await prompt_service.drain()
+
+    assert (await db.prompts_collection.find_one({"_id": post.prompt_id}))["use_count"] == 1
+    # Written before its prompt, so the post keeps its own context
+    stored = await db.posts_collection.find_one({"prompt_id": post.prompt_id})
+    assert stored["context"] == "New product"
+
+async def test_popular_prompts_are_served_from_top_k_cache(mock_db):
+    service = PromptService(top_k=2, popular_ttl_seconds=60)
+    await service.record_use("user_a", "tech-insight", "A", "Context", count=3)
+    await service.record_use("user_a", "tech-insight", "B", "Context")
+    await service.record_use("user_a", "startup-story", "C", "Context", count=5)
+    await service.record_use("user_b", "tech-insight", "D", "Context", count=50)
+
+    assert [prompt["objective"] for prompt in await service.popular("user_a", 5)] == ["C", "A"]
+    assert [prompt["objective"] for prompt in await service.popular("user_a", 1, "tech-insight")] == ["A"]
+
+    # Counts move on, the cached list only after it expires
+    await service.record_use("user_a", "tech-insight", "B", "Context", count=10)
+    assert [prompt["objective"] for prompt in await service.popular("user_a", 2, "tech-insight")] == ["A", "B"]
+    service.clear()
+    assert [prompt["objective"] for prompt in await service.popular("user_a", 2, "tech-insight")] == ["B", "A"]
+
+async def test_popular_prompts_route_only_lists_the_callers_prompts(mock_db, auth_token):
+    await PostService.create_post(_post(), "test_user_id")
+    await PostService.create_post(_post(objective="Someone else's secret"), "other_user")
+    await prompt_service.drain()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/api/popular-prompts")).status_code in (401, 403)
+        response = await client.get("/api/popular-prompts", params={"limit": 5}, headers={"Authorization": auth_token})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert response.headers["Vary"] == "Authorization"
+    prompts = response.json()
+    assert len(prompts) == 1
+    assert prompts[0]["objective"] == "Launch" and prompts[0]["use_count"] == 1
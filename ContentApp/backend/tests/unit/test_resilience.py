@@ -0,0 +1,95 @@
+import asyncio
+import pytest # type: ignore
+from app.services.model_service import ModelService
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.resilience import ResilientCaller
+from app.utils.error_handlers import APIError
+
+class Retryable(Exception):
+    pass
+
+POLICIES = {
+    "default": {"max_attempts": 3, "base_delay": 0.01, "max_delay": 0.02, "deadline": 2.0, "hedge": False},
+    "hedged": {"max_attempts": 1, "base_delay": 0.01, "max_delay": 0.02, "deadline": 2.0,
+               "hedge": True, "hedge_percentile": 95, "hedge_min_samples": 3},
+}
+
+def _caller():
+    return ResilientCaller(POLICIES, lambda e: isinstance(e, Retryable), lambda e: None)
+
+async def test_retries_retryable_errors_until_success():
+    caller = _caller()
+    calls = 0
+
+    async def attempt(timeout):
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise Retryable()
+        return "ok"
+
+    assert await caller.call("chat", attempt) == "ok"
+    assert caller.stats()["chat"]["retries"] == 2
+
+async def test_non_retryable_errors_are_raised_immediately():
+    caller = _caller()
+
+    async def attempt(timeout):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        await caller.call("chat", attempt)
+    assert caller.stats()["chat"]["attempts"] == 1
+
+async def test_hedge_fires_after_learned_latency_and_wins():
+    caller = _caller()
+    for latency in (0.01, 0.01, 0.01):
+        caller.trackers["hedged"].record(latency)
+    calls = 0
+
+    async def attempt(timeout):
+        nonlocal calls
+        calls += 1
+        # The first copy stalls, the hedged duplicate answers quickly
+        await asyncio.sleep(1.0 if calls == 1 else 0.01)
+        return calls
+
+    assert await caller.call("hedged", attempt) == 2
+    stats = caller.stats()["hedged"]
+    assert stats["hedges_fired"] == 1
+    assert stats["hedges_won"] == 1
+
+async def test_deadline_bounds_the_call():
+    caller = _caller()
+
+    async def attempt(timeout):
+        await asyncio.sleep(5)
+
+    loop = asyncio.get_running_loop()
+    with pytest.raises(APIError) as exc_info:
+        await caller.call("chat", attempt, deadline=loop.time() + 0.05)
+    assert exc_info.value.status_code == 504
+    assert exc_info.value.details["reason"] == "request_deadline"
+
+async def test_short_request_deadlines_do_not_open_the_circuit():
+    caller = _caller()
+    breaker = CircuitBreaker(
+        "text", ModelService._is_upstream_failure,
+        min_calls=4, failure_rate_threshold=0.5, slow_call_seconds=10.0, open_seconds=30.0, half_open_max_calls=1
+    )
+
+    async def attempt(timeout):
+        # The attempt's own timeout outlasts the deadline, so the caller decides which one ran out
+        assert timeout > 0.05
+        await asyncio.sleep(5)
+
+    loop = asyncio.get_running_loop()
+    for _ in range(6):
+        with pytest.raises(APIError) as exc_info:
+            async with breaker.guard():
+                await caller.call("chat", attempt, deadline=loop.time() + 0.02)
+    assert breaker.state == "closed"
+
+    # The provider exceeding the policy deadline still counts
+    policy_timeout = APIError("Model request timed out", 504, details={"route": "chat", "reason": "policy_deadline"})
+    assert ModelService._is_upstream_failure(policy_timeout)
@@ -0,0 +1,63 @@
+import pytest # type: ignore
+from datetime import datetime
+from app.services.post_service import PostService
+from app.services.search_service import SearchService, search_service
+from app.utils.inverted_index import InvertedIndex, highlight_spans
+from app.database import db
+
+def _post(objective, content):
+    return {"template": "tech-insight", "objective": objective, "context": "Context", "generated_content": content}
+
+def test_index_ranks_prefix_matches_and_requires_all_terms():
+    index = InvertedIndex()
+    index.add("a", "Scaling Python services at a startup")
+    index.add("b", "Python tips for beginners")
+    index.add("c", "Startup fundraising lessons")
+
+    hits, total = index.search("pyth start")
+    assert total == 1 and hits[0][0] == "a"
+
+    hits, total = index.search("startup")
+    assert {doc_id for doc_id, _ in hits} == {"a", "c"}
+
+    index.remove("a")
+    assert index.search("pyth start") == ([], 0)
+
+def test_highlight_spans_cover_matching_words():
+    text = "Marketing-led growth: launch Launches"
+    assert highlight_spans(text, "laun growth") == [[14, 20], [22, 28], [29, 37]]
+
+async def test_search_tracks_creates_and_deletes(mock_db):
+    search_service._indexes.clear()
+    first = await PostService.create_post(_post("Python at scale", "Lessons from scaling Python services"), "test_user")
+    await PostService.create_posts([_post("Hiring", "How we hire engineers"), _post("Pythonic code", "Idioms")], "test_user")
+
+    result = await PostService.get_user_posts("test_user", limit=10, search="pyth")
+    assert [post["_id"] for post in result["posts"]][0] == first.id
+    assert result["total"] == 2
+    assert result["posts"][0]["highlights"]["objective"] == [[0, 6]]
+
+    # Writes on this worker update the cached index in place
+    await PostService.delete_post(first.id, "test_user")
+    result = await PostService.get_user_posts("test_user", limit=10, search="pyth")
+    assert result["total"] == 1
+    assert search_service.stats()["rebuilds"] >= 1
+
+async def test_search_rebuilds_after_write_on_another_worker(mock_db):
+    service = SearchService()
+    await db.posts_collection.insert_one({**_post("Old", "Nothing relevant"), "user_id": "test_user", "created_at": datetime.utcnow()})
+    assert (await service.search("test_user", "kubernetes", limit=10))["total"] == 0
+
+    other_worker = SearchService()
+    await db.posts_collection.insert_one({**_post("Kubernetes", "Cluster tips"), "user_id": "test_user", "created_at": datetime.utcnow()})
+    await other_worker.posts_added("test_user", [])
+
+    assert (await service.search("test_user", "kubernetes", limit=10))["total"] == 1
+    assert service.rebuilds == 2
+
+async def test_search_without_terms_matches_literally(mock_db):
+    await db.posts_collection.insert_one({**_post("Odd", "Costs rose (a lot) .*"), "user_id": "test_user", "created_at": datetime.utcnow()})
+    result = await SearchService().search("test_user", ".*", limit=10)
+    assert result["total"] == 1
+    result = await SearchService().search("test_user", "(", limit=10)
+    assert result["total"] == 1
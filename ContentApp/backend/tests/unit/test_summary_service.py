@@ -0,0 +1,84 @@
+import asyncio
+import json
+import pytest # type: ignore
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from app.config import settings
+from app.controllers.post_controller import PostController
+from app.services.cache_service import GenerationCache
+from app.services.post_service import PostService
+from app.services.summary_service import SummaryService
+from app.utils.error_handlers import APIError
+
+class FakeModelService:
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def create_chat_completion(self, messages, user_id="anonymous", **overrides):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        content = f"Summary {self.calls} of {len(messages[1]['content'])} chars."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    monkeypatch.setattr(settings, "summary_pipeline_min_tokens", 100)
+    monkeypatch.setattr(settings, "summary_chunk_tokens", 60)
+    monkeypatch.setattr(settings, "summary_concurrency", 2)
+    monkeypatch.setattr(settings, "document_context_tokens", 20)
+
+def _report(sections: int) -> str:
+    return "\n\n".join(f"Section {i}: revenue grew {i} percent in region {i} after the launch." for i in range(sections))
+
+async def test_small_documents_skip_the_pipeline(mock_db, small_limits):
+    model = FakeModelService()
+    service = SummaryService(model, GenerationCache(max_entries=64, ttl_seconds=60))
+    assert await service.condense(["Short note"]) == ["Short note"]
+    assert model.calls == 0
+
+async def test_large_documents_are_mapped_and_reduced_with_bounded_concurrency(mock_db, small_limits):
+    model = FakeModelService()
+    service = SummaryService(model, GenerationCache(max_entries=64, ttl_seconds=60))
+    events = []
+
+    condensed = await service.condense([_report(40), "Short note"], on_progress=events.append)
+
+    assert len(condensed) == 2 and condensed[1] == "Short note"
+    assert condensed[0].startswith("Summary")
+    assert model.max_active <= 2
+    assert events[-1]["done"] == events[-1]["total"] == model.calls
+    assert any(event["stage"] == "reduce" for event in events)
+
+    # Chunk summaries are cached by content hash
+    calls = model.calls
+    assert await service.condense([_report(40), "Short note"]) == condensed
+    assert model.calls == calls
+
+async def test_oversized_input_is_rejected(mock_db, small_limits, monkeypatch):
+    monkeypatch.setattr(settings, "summary_max_input_tokens", 200)
+    service = SummaryService(FakeModelService(), GenerationCache(max_entries=64, ttl_seconds=60))
+    with pytest.raises(APIError) as exc:
+        await service.condense([_report(40)])
+    assert exc.value.status_code == 413
+
+async def test_stream_reports_summary_progress_before_deltas(mock_db, small_limits):
+    async def fake_stream(template, objective, context, document_texts, **kwargs):
+        assert document_texts[0].startswith("Summary")
+        yield "Post"
+
+    generation_service = MagicMock()
+    generation_service.generate_text_stream = fake_stream
+    generation_service.summaries = SummaryService(FakeModelService(), GenerationCache(max_entries=64, ttl_seconds=60))
+    controller = PostController(PostService(), generation_service, MagicMock())
+
+    events = [json.loads(line) async for line in controller._stream_post_events(
+        "tech-insight", "base", "Objective", "Context", [_report(40)], "test_user"
+    )]
+    types = [event["type"] for event in events]
+    assert types[0] == "progress"
+    assert types[-2:] == ["delta", "done"]
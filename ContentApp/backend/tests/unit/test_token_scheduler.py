@@ -0,0 +1,54 @@
+import asyncio
+import pytest # type: ignore
+from app.utils import token_scheduler
+from app.utils.token_scheduler import TokenBudgetScheduler
+from app.utils.error_handlers import APIError
+
+async def test_scheduler_serves_users_fairly(monkeypatch):
+    monkeypatch.setattr(token_scheduler, "WINDOW_SECONDS", 0.3)  # Wide enough to survive a GC pause between requests
+    scheduler = TokenBudgetScheduler(tokens_per_minute=100, requests_per_minute=100)
+    order = []
+
+    async def request(user_id, label):
+        ticket = await scheduler.acquire(user_id, 100, max_wait=5)
+        order.append(label)
+        scheduler.release(ticket, 100)
+
+    await request("heavy", "heavy-1")
+    await asyncio.gather(
+        request("heavy", "heavy-2"),
+        request("heavy", "heavy-3"),
+        request("light", "light-1")
+    )
+
+    assert order.index("light-1") < order.index("heavy-3")
+
+async def test_scheduler_rejects_when_queue_exceeds_deadline():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=100, requests_per_minute=100)
+    ticket = await scheduler.acquire("user", 100, max_wait=1)
+
+    with pytest.raises(APIError) as exc_info:
+        await scheduler.acquire("user", 100, max_wait=1)
+
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) > 1
+    assert scheduler.stats()["rejected"] == 1
+    scheduler.release(ticket, 50)
+    assert scheduler.stats()["tokens_used_last_minute"] == 50
+
+async def test_scheduler_forgets_users_once_the_queue_is_idle():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=100000, requests_per_minute=1000)
+    for i in range(50):
+        ticket = await scheduler.acquire(f"user-{i}", 10, max_wait=1)
+        scheduler.release(ticket, 10)
+
+    assert scheduler.stats()["tracked_users"] == 0
+
+async def test_release_charges_extra_upstream_calls():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=1000, requests_per_minute=100)
+    ticket = await scheduler.acquire("user", 100, max_wait=1)
+    scheduler.release(ticket, 40, extra_requests=2, extra_tokens=20)
+
+    stats = scheduler.stats()
+    assert stats["requests_last_minute"] == 3
+    assert stats["tokens_used_last_minute"] == 60
@@ -132,7 +132,6 @@ export const deletePost = async (postId: string): Promise<void> => {
 
 export const getPopularPrompts = async (limit = 5): Promise<StoredPrompt[]> => {
   return apiRequest<StoredPrompt[]>('/popular-prompts', {
-    requiresAuth: false,
     params: { limit: String(limit) }
   });
 };